@@ -6,8 +6,8 @@ from ibapi.contract import Contract as IBcontract
 from ibapi.order import Order
 from ibapi.execution import ExecutionFilter
 
-from gwt_pt.util import config_loader
 from gwt_pt.telegram import bot_sender
+from gwt_pt.datasource import ib_session
 
 import time, sys
 from threading import Thread
@@ -24,6 +24,8 @@ DEFAULT_MARKET_DATA_ID=50
 DEFAULT_GET_CONTRACT_ID=43
 DEFAULT_EXEC_TICKER=78
 
+ORDER_CLIENT_ID_BASE=12001
+
 ## marker for when queue is finished
 FINISHED = object()
 STARTED = object()
@@ -568,7 +570,8 @@ class TestClient(EClient):
 
         new_contract_details=new_contract_details[0]
 
-        resolved_ibcontract=new_contract_details.summary
+        ## ContractDetails.summary was renamed contract in API 9.74
+        resolved_ibcontract=getattr(new_contract_details, 'contract', None) or new_contract_details.summary
 
         return resolved_ibcontract
 
@@ -865,6 +868,14 @@ class TestApp(TestWrapper, TestClient):
 
         self.init_error()
 
+def order_pool(is_simulated=False):
+    """
+    The shared pool of gateway sessions used for order handling
+    """
+
+    ip, port = ib_session.gateway_address(is_simulated)
+    return ib_session.get_pool(TestApp, ip, port, ORDER_CLIENT_ID_BASE)
+
 def send_open_orders(open_orders):
 
     message = ""
@@ -909,14 +920,8 @@ if __name__ == "__main__":
     
     args = sys.argv
 
-    config = config_loader.load()
-    ip = config.get("ib-gateway","ip")
-    port = 4001
-    
-    #ip = "127.0.0.1"
-    #port = 4002
-    
-    app = TestApp(ip, port, 59)
+    pool = order_pool(is_simulated=False)
+    app = pool.acquire()
 
     if (len(args) > 1):
         if (args[1] == "get_open_orders"):
@@ -1041,6 +1046,6 @@ if __name__ == "__main__":
     #print("Any open orders? - should be False")
     #print(app.any_open_orders())
 
-    app.disconnect()
+    pool.release(app)
 
 
@@ -3,8 +3,8 @@
 from ibapi.wrapper import EWrapper
 from ibapi.client import EClient
 
-from gwt_pt.util import config_loader
 from gwt_pt.telegram import bot_sender
+from gwt_pt.datasource import ib_session
 
 from threading import Thread
 import queue
@@ -19,6 +19,8 @@ ACCOUNT_UPDATE_FLAG = "update"
 ACCOUNT_VALUE_FLAG = "value"
 ACCOUNT_TIME_FLAG = "time"
 
+POSITION_CLIENT_ID_BASE = 13001
+
 EL = "\n"
 DEL = "\n\n"
 
@@ -303,6 +305,8 @@ class TestWrapper(EWrapper):
     ## get accounting data
     def init_accounts(self, accountName):
         accounting_queue = self._my_accounts[accountName] = queue.Queue()
+        ## updateAccountTime does not say which account it is for
+        self._account_name = accountName
 
         return accounting_queue
 
@@ -329,7 +333,7 @@ class TestWrapper(EWrapper):
 
         ## use this to seperate out different account data
         data = identifed_as(ACCOUNT_TIME_FLAG, timeStamp)
-        self._my_accounts[accountName].put(data)
+        self._my_accounts[self._account_name].put(data)
 
 
     def accountDownloadEnd(self, accountName:str):
@@ -463,6 +467,14 @@ class TestApp(TestWrapper, TestClient):
 
         setattr(self, "_thread", thread)
 
+def position_pool(is_simulated=False):
+    """
+    The shared pool of gateway sessions used for positions and accounting data
+    """
+
+    ip, port = ib_session.gateway_address(is_simulated)
+    return ib_session.get_pool(TestApp, ip, port, POSITION_CLIENT_ID_BASE)
+
 def send_accounting_updates(accounting_updates):
 
     #[(90394224: 258771417,1357,STK,,0.0,0,,,SEHK,HKD,1357,1357,False,,combo:, 2000.0, 8.55935, 17118.7, 8.96824165, -817.78, 0.0), (92328016: 42
@@ -504,11 +516,8 @@ if __name__ == "__main__":
     
     args = sys.argv
 
-    config = config_loader.load()
-    ip = config.get("ib-gateway","ip")
-    #ip = "127.0.0.1"
-
-    app = TestApp(ip, 4001, 59)
+    pool = position_pool(is_simulated=False)
+    app = pool.acquire()
     
     ## lets get positions
     positions_list = app.get_current_positions()
@@ -535,7 +544,7 @@ if __name__ == "__main__":
             print(accounting_updates)
             send_accounting_updates(accounting_updates)
     
-    app.disconnect()    
+    pool.release(app)    
 
 
 
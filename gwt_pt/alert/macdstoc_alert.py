@@ -3,28 +3,23 @@
 import numpy as np
 import pandas as pd
 import os
-from pandas_datareader import data as web, wb
-from gwt_pt.common.indicator import SMA, EMA, RSI, FASTSTOC, SLOWSTOC, MACD
+from gwt_pt.common import signal_pipeline
 
 from gwt_pt.datasource import ibkr 
+from gwt_pt.datasource import bar_array
 from gwt_pt.telegram import bot_sender
-from gwt_pt.charting import frameplot
+from gwt_pt.charting import render_service
 from gwt_pt.redis import redis_pool
+from gwt_pt.redis import stream_bus
+from gwt_pt.strategy.strat_macdstoc import macdstoc_strategy
+from gwt_pt.util import log_config
 
 import time
 import datetime
 import logging, sys
 
-if (os.name == 'nt'):
-    logfile = 'C:\\Users\\Hin\\eggyolktech\\gwtPT\\gwt_pt\\log\\macdstoc_alert.log'
-    testMode = True
-else:
-    logfile = '/app/gwtPT/gwt_pt/log/macdstoc_alert_%s.log' % datetime.datetime.today().strftime('%m%d-%H%M%S')
-    testMode = False
-    #sys.stderr.write = lambda s: logger.error(s)
-    #sys.stdout.write = lambda s: logger.info(s)
+testMode = (os.name == 'nt')
 
-logging.basicConfig(filename=logfile, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger()
 
 EL = "\n"
@@ -44,6 +39,10 @@ MACDSTOC_THRESHOLD = 1.0
 MONITOR_PERIOD = 20
 SLEEP_PERIOD = 8
 
+## daily signal states in the state store, kept over weekends and holidays
+DS_PREFIX = "DS"
+DS_TTL = 7 * 86400
+
 CURRENCY_PAIR = ["EUR/USD", 
                 "GBP/USD", 
                 "USD/JPY", 
@@ -76,101 +75,11 @@ def write_signals_log(signals_str):
         
     return logpath
 
-def gen_signal(historic_df):
-
-    signals = pd.DataFrame(index=historic_df.index)
-    signals['open'] = historic_df['open']    
-    signals['high'] = historic_df['high']
-    signals['low'] = historic_df['low']
-    signals['close'] = historic_df['close']
-    signals["ema25"] = EMA(signals, 'close', 25)
-
-    # MACD
-    macd = MACD(historic_df['close'])
-    signals = pd.concat([signals, macd], axis=1)
+def gen_signal(historic_df, symbol=""):
 
-    # Slowstoc
-    kslow, dslow = SLOWSTOC(historic_df, 'low', 'high', 'close', STOC_WINDOW, 6, False)
-    signals = pd.concat([signals, kslow, dslow], axis=1)
-
-    # Super Macdstoc
-    skslow, sdslow = FASTSTOC(signals, "macd", "macd", "macd", MACDSTOC_WINDOW, 3, False)
-    skslow = skslow.rename(columns = {'k_fast':'sk_slow'})
-    sdslow = sdslow.rename(columns = {'d_fast':'sd_slow'})
-    signals = pd.concat([signals, skslow, sdslow], axis=1)
-    
-    # Xover Mark
-    signals['signal_stoc_xup'] = 0.0
-    signals['signal_stoc_xdown'] = 0.0
-    signals['signal_macd_xup'] = 0.0
-    signals['signal_macd_xdown'] = 0.0
-    signals['signal_xup'] = 0.0
-    signals['signal_xdown'] = 0.0    
-    signals['signal_sxup'] = 0.0
-    signals['signal_sxdown'] = 0.0  
-
-    ###############################################################################
-    ## Create a 'signal' for Slow Stoc cross over <=25    
-    if (len(signals) >= STOC_WINDOW):
-        signals['signal_stoc_xup'][STOC_WINDOW:] = np.where(
-            (signals['k_slow'][STOC_WINDOW:] > signals['d_slow'][STOC_WINDOW:])
-            & (signals['k_slow'][STOC_WINDOW:] <= STOC_LOWER_LIMIT)
-            , 1.0, 0.0)
-    else:
-        signals['signal_stoc_xup'] = 0.0
-    
-    ## Take the difference of the signals in order to generate actual trading orders
-    signals['stoc_xup_positions'] = signals['signal_stoc_xup'].diff()
-    signals.loc[signals.stoc_xup_positions == -1.0, 'stoc_xup_positions'] = 0.0    
-    
-    ###############################################################################
-    ## Create a 'signal' for Macdstoc cross up <=5
-    if (len(signals) >= MACDSTOC_WINDOW):
-        signals['signal_xup'][MACDSTOC_WINDOW:] = np.where(
-            (signals['sk_slow'][MACDSTOC_WINDOW:] > signals['sd_slow'][MACDSTOC_WINDOW:] + MACDSTOC_THRESHOLD)
-            & (signals['sd_slow'][MACDSTOC_WINDOW:] <= MACDSTOC_LOWER_LIMIT)
-            , 1.0, 0.0)
-            
-        signals['signal_sxup'][MACDSTOC_WINDOW:] = np.where(
-            (signals['sk_slow'][MACDSTOC_WINDOW:] == 100) 
-            & (signals['sd_slow'][MACDSTOC_WINDOW:] == 100)
-            , 1.0, 0.0)
-    else:
-        signals['signal_xup'] = 0.0
-        signals['signal_sxup'] = 0.0
-    
-    ## Take the difference of the signals in order to generate actual trading orders
-    signals['xup_positions'] = signals['signal_xup'].diff()
-    signals.loc[signals.xup_positions == -1.0, 'xup_positions'] = 0.0
-    signals['sxup_positions'] = signals['signal_sxup'].diff()
-    signals.loc[signals.sxup_positions == -1.0, 'sxup_positions'] = 0.0
- 
-    ## Create a 'signal' for Macdstoc cross down >=95
-    if (len(signals) >= MACDSTOC_WINDOW):
-        signals['signal_xdown'][MACDSTOC_WINDOW:] = np.where(
-            (signals['sk_slow'][MACDSTOC_WINDOW:] < signals['sd_slow'][MACDSTOC_WINDOW:] - MACDSTOC_THRESHOLD)
-            & (signals['sd_slow'][MACDSTOC_WINDOW:] >= MACDSTOC_UPPER_LIMIT)
-            , 1.0, 0.0)
-            
-        signals['signal_sxdown'][MACDSTOC_WINDOW:] = np.where(
-            (signals['sk_slow'][MACDSTOC_WINDOW:] == 0) 
-            & (signals['sd_slow'][MACDSTOC_WINDOW:] == 0)
-            , 1.0, 0.0)
-    else:
-        signals['signal_xdown'] = 0.0
-        signals['signal_sxdown'] = 0.0
-    
-    ## Take the difference of the signals in order to generate actual trading orders
-    signals['xdown_positions'] = signals['signal_xdown'].diff()
-    signals.loc[signals.xdown_positions == -1.0, 'xdown_positions'] = 0.0
-    signals['sxdown_positions'] = signals['signal_sxdown'].diff()
-    signals.loc[signals.sxdown_positions == -1.0, 'sxdown_positions'] = 0.0
-    
-    ## Aggregrate the special case + normal case together
-    signals['xup_positions'] = signals['xup_positions'] + signals['sxup_positions']
-    signals['xdown_positions'] = signals['xdown_positions'] + signals['sxdown_positions']
-    
-    return signals
+    strategy = macdstoc_strategy(symbol, historic_df, STOC_WINDOW, 6, MACDSTOC_WINDOW, 3, STOC_LOWER_LIMIT,
+                                 MACDSTOC_UPPER_LIMIT, MACDSTOC_LOWER_LIMIT, MACDSTOC_THRESHOLD)
+    return signal_pipeline.get_pipeline().signals(strategy, historic_df, symbol)
  
 def format_hist_df(historic_data):
 
@@ -178,16 +87,17 @@ def format_hist_df(historic_data):
     #pd.options.display.float_format = "{:.9f}".format
     
     # Data pre-processing
-    historic_df = pd.DataFrame(historic_data, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
-    historic_df.set_index('datetime', inplace=True)
-    historic_df.index = pd.to_datetime(historic_df.index)
+    historic_df = bar_array.to_frame(historic_data)
     
     return historic_df
  
-def get_alert(cur, title, historic_data): 
+def get_alert(cur, title, historic_data, ds=None): 
+    """
+    :param ds: the daily signal state of cur ("XUP since ..."), read from the state store if not given
+    """
     
     historic_df = format_hist_df(historic_data)
-    signals = gen_signal(historic_df)
+    signals = gen_signal(historic_df, cur)
     
     latest_signal = signals.tail(1)
     lts = latest_signal.index[0]
@@ -223,44 +133,53 @@ def get_alert(cur, title, historic_data):
     #signals_log = signals[['open','high','low','close','ema25','divergence','emaSmooth','macd','k_slow','d_slow','sk_slow','sd_slow','xup_positions','xdown_positions']].tail(20).to_string()
     signals_log = signals[['sk_slow','sd_slow','xup_positions','xdown_positions','sxup_positions','sxdown_positions']].tail(20).to_string()
     #print(">>>>>>>>>>>>>>>>>> Get DS Key " + cur) 
-    ds = redis_pool.getV("DS:" + cur)
+    if (ds is None):
+        ds = redis_pool.getV(redis_pool.make_key(DS_PREFIX, cur))
     if (not ds):
         ds = ""
-    else:
+    elif (isinstance(ds, bytes)):
         ds = ds.decode()
         
     print(">>>>>>>>>>>>>>>>>> Daily Sig [" + cur + "]: " + str(lxup) + "/" + str(lxdown) + "/" + ds)
-    if (lxup and "XUP" in ds):
-        message = (message_tmpl % (title, "Up", lts, "GMT"))
-        filepath = frameplot.plot_macdstoc_signals(historic_df, signals, title, True)
+    if (lxup and "XUP" in ds) or (lxdown and "XDOWN" in ds):
+        message = (message_tmpl % (title, "Up" if (lxup and "XUP" in ds) else "Down", lts, "GMT"))
+        ## the chart is rendered in the background, the alert goes out once it is written
+        filepath = render_service.chart_path()
         filename = filepath.split("/")[-1]
         logname = write_signals_log(signals_log).split("/")[-1]
         message = message + " (<a href='http://www.eggyolk.tech/gwtpt/%s' target='_blank'>Chart</a>)" % filename 
         message = message + DEL + signals_stmt + EL
         message = message + ("<b>DAILY:</b> %s" % ds) + EL
         message = message + " (<a href='http://www.eggyolk.tech/gwtpt/%s' target='_blank'>Log</a>)" % logname
-    elif (lxdown and "XDOWN" in ds):
-        message = (message_tmpl % (title, "Down", lts, "GMT"))
-        filepath = frameplot.plot_macdstoc_signals(historic_df, signals, title, True)
-        filename = filepath.split("/")[-1]
-        logname = write_signals_log(signals_log).split("/")[-1]
-        message = message + " (<a href='http://www.eggyolk.tech/gwtpt/%s' target='_blank'>Chart</a>)" % filename
-        message = message + DEL + signals_stmt + EL
-        message = message + ("<b>DAILY:</b> %s" % ds) + EL
-        message = message + " (<a href='http://www.eggyolk.tech/gwtpt/%s' target='_blank'>Log</a>)" % logname
+
+        chart = render_service.get_service().submit(historic_df, signals, title, filepath)
+        chart.add_done_callback(lambda future: send_alert(future, message))
+        stream_bus.get_bus().publish(stream_bus.ALERTS_STREAM, {'strategy': "MACDSTOC", 'symbol': cur, 'title': title,
+                                                                'message': message, 'chart': filename})
     else:
         print(message_nil_tmpl % (title, lts))
         
-    if (message):
-        bot_sender.broadcast(message, testMode)
-    
     #print(signals.info())
     #print(signals.to_string())
     #print(signals.tail())
     #print(signals[['sk_slow','sd_slow', 'xup_positions', 'xdown_positions']].tail(20).to_string())
     print(signals_log)
 
-def update_latest_pos(cur, signals):
+def send_alert(chart, message):
+    """
+    Broadcast an alert once its chart has been rendered
+    :param chart: render_service Future of the chart path
+    """
+
+    if chart.exception() is not None:
+        print("Chart rendering failed: [%s]" % chart.exception())
+    bot_sender.broadcast(message, testMode)
+
+def update_latest_pos(cur, signals, states=None):
+    """
+    :param states: dict to collect the daily signal states in for one batched write, written
+                   straight away if not given
+    """
 
     lsig = signals.loc[(signals['xup_positions'] == 1.0) | (signals['xdown_positions'] == 1.0)].tail(1)
     lrec = lsig.iloc[0]
@@ -269,75 +188,68 @@ def update_latest_pos(cur, signals):
     ltime = str(ltime).split()[0]
     message = ""
     if (lrec['xup_positions']):
-        message = ("%s XUP since %s" % (cur, ltime))
-        redis_pool.setV("DS:" + cur, "XUP since %s" % ltime)
+        state = "XUP since %s" % ltime
     else:
-        message = ("%s XDOWN since %s" % (cur, ltime))
-        redis_pool.setV("DS:" + cur, "XDOWN since %s" % ltime)
+        state = "XDOWN since %s" % ltime
+    message = "%s %s" % (cur, state)
+
+    if (states is None):
+        redis_pool.get_store().set(redis_pool.make_key(DS_PREFIX, cur), state, DS_TTL)
+    else:
+        states[redis_pool.make_key(DS_PREFIX, cur)] = state
     
     print(message)
     return message
 
-def alert_daily():    
-    
-    passage = "Generation of Macdstoc Hourly Alert............."
-    print(passage)
-    
-    errorMessage = ""
-    duration = "3 M"
-    period = "1 day"
-    
-    dsl = []
+def scan_requests(duration, period):
+    """
+    Historical data requests for the whole watch list, keyed by (cur, title)
+    """
+
+    requests = []
 
     for cur in CURRENCY_PAIR:
-    
         symbol = cur.split("/")[0]
         currency = cur.split("/")[1]
         title = symbol + "/" + currency + "@" + period
-        print("Checking on " + title + " ......")
+        requests.append(((cur, title), ibkr.fx_contract(symbol, currency), duration, period, "MIDPOINT", "FX"))
 
-        hist_data = ibkr.get_fx_data(symbol, currency, duration, period)
- 
-        historic_df = format_hist_df(hist_data)
-        signals = gen_signal(historic_df)
-        print(signals[['sk_slow','sd_slow','xup_positions','xdown_positions','sxup_positions','sxdown_positions']].tail(20).to_string())
-        dsl.append(update_latest_pos(cur, signals))
-        
-        print("Sleeping for " + str(SLEEP_PERIOD) + " seconds...")
-        time.sleep(SLEEP_PERIOD)
-        
     # Metal Pair
     for cur in METAL_PAIR:
+        title = cur + "@" + period
+        requests.append(((cur, title), ibkr.metal_contract(cur), duration, period, "MIDPOINT", None))
 
-        symbol = cur
-        title = symbol + "@" + period
-        print("Checking on " + title + " ......")
-
-        hist_data = ibkr.get_metal_data(symbol, duration, period)
-        
-        historic_df = format_hist_df(hist_data)
-        signals = gen_signal(historic_df)
-        dsl.append(update_latest_pos(cur, signals))
-        
-        print("Sleeping for " + str(SLEEP_PERIOD) + " seconds...")
-        time.sleep(SLEEP_PERIOD)
-        
     # Futures Pair
+    current_mth = datetime.datetime.today().strftime('%Y%m')
     for cur in HKFE_PAIR:
+        title = cur + "@" + period
+        requests.append(((cur, title), ibkr.hkfe_contract(current_mth, cur), duration, period, "TRADES", "HKFE"))
+
+    return requests
+
+def alert_daily():    
+    
+    passage = "Generation of Macdstoc Hourly Alert............."
+    print(passage)
+    
+    errorMessage = ""
+    duration = "3 M"
+    period = "1 day"
+    
+    dsl = []
+    states = {}
+
+    for (cur, title), hist_data in ibkr.get_data_batch(scan_requests(duration, period), use_cache=True):
 
-        symbol = cur
-        current_mth = datetime.datetime.today().strftime('%Y%m')
-        title = symbol + "@" + period
         print("Checking on " + title + " ......")
 
-        hist_data = ibkr.get_hkfe_data(current_mth, symbol, duration, period)
- 
         historic_df = format_hist_df(hist_data)
-        signals = gen_signal(historic_df)
-        dsl.append(update_latest_pos(cur, signals))
+        signals = gen_signal(historic_df, cur)
+        print(signals[['sk_slow','sd_slow','xup_positions','xdown_positions','sxup_positions','sxdown_positions']].tail(20).to_string())
+        dsl.append(update_latest_pos(cur, signals, states))
 
-        print("Sleeping for " + str(SLEEP_PERIOD) + " seconds...")
-        time.sleep(SLEEP_PERIOD)
+    ## the whole universe in one round trip
+    redis_pool.get_store().mset(states, DS_TTL)
         
     message = "<b>Daily Macdstoc Signal</b>" + DEL
     message = message + EL.join(dsl)
@@ -355,55 +267,32 @@ def alert_hourly():
     errorMessage = ""
     duration = "16 D"
     period = "1 hour"
+
+    requests = scan_requests(duration, period)
+    ## the daily signal states of the whole universe in one round trip
+    keys = [redis_pool.make_key(DS_PREFIX, cur) for (cur, title), _, _, _, _, _ in requests]
+    states = dict(zip(keys, redis_pool.get_store().mget(keys)))
     
-    for cur in CURRENCY_PAIR:
-    
-        symbol = cur.split("/")[0]
-        currency = cur.split("/")[1]
-        title = symbol + "/" + currency + "@" + period
+    for (cur, title), hist_data in ibkr.get_data_batch(requests, use_cache=True):
+
         print("Checking on " + title + " ......")
-        
-        hist_data = ibkr.get_fx_data(symbol, currency, duration, period)
 
-        if (not hist_data):
-            hist_data = ibkr.get_fx_data(symbol, currency, duration, period)
+        if (not hist_data and cur in CURRENCY_PAIR):
+            hist_data = ibkr.get_fx_data(cur.split("/")[0], cur.split("/")[1], duration, period)
 
         if (not hist_data):
             bot_sender.broadcast("ERROR: No Data returns for %s" % cur, testMode)
             return
 
-        get_alert(cur, title, hist_data)
-        print("Sleeping for " + str(SLEEP_PERIOD) + " seconds...")
-        time.sleep(SLEEP_PERIOD)
-        
-    # Metal Pair
-    for cur in METAL_PAIR:
-
-        symbol = cur
-        title = symbol + "@" + period
-        print("Checking on " + title + " ......")
-
-        hist_data = ibkr.get_metal_data(symbol, duration, period)
-        get_alert(cur, title, hist_data)
-        print("Sleeping for " + str(SLEEP_PERIOD) + " seconds...")
-        time.sleep(SLEEP_PERIOD)
-        
-    # Futures Pair
-    for cur in HKFE_PAIR:
-
-        symbol = cur
-        current_mth = datetime.datetime.today().strftime('%Y%m')
-        title = symbol + "@" + period
-        print("Checking on " + title + " ......")
-
-        hist_data = ibkr.get_hkfe_data(current_mth, symbol, duration, period)
-        get_alert(cur, title, hist_data)
-        print("Sleeping for " + str(SLEEP_PERIOD) + " seconds...")
-        time.sleep(SLEEP_PERIOD)
+        get_alert(cur, title, hist_data, states[redis_pool.make_key(DS_PREFIX, cur)] or b"")
 
 def main(args):
     
     start_time = time.time()
+    log_config.init_logging("macdstoc_alert")
+
+    ## fork the chart workers before the IB and Telegram threads start
+    render_service.get_service().start()
 
     if (len(args) > 1 and args[1] == "alert_daily"):
         alert_daily()        
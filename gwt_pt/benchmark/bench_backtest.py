@@ -0,0 +1,20 @@
+#! /usr/bin/python
+
+"""
+Backtest engine benchmarks, run by gwt_pt.benchmark.runner
+"""
+
+from gwt_pt.strategy.strat_macdstoc import macdstoc_strategy
+from gwt_pt.strategy.strat_backtest import event_portfolio
+from gwt_pt.benchmark.synthetic import random_bars
+
+class backtestBench(object):
+
+    def setup(self, n):
+        bars = random_bars(n)
+        signals = macdstoc_strategy("BENCH", bars).generate_signals()
+        self.portfolio = event_portfolio("BENCH", bars, signals, quantity=10,
+                                         long_column='xup_positions', short_column='xdown_positions')
+
+    def time_backtest_portfolio(self, n):
+        self.portfolio.backtest_portfolio()
@@ -0,0 +1,66 @@
+#! /usr/bin/python
+
+"""
+Chart rendering benchmarks, run by gwt_pt.benchmark.runner
+
+The chart is drawn to an in-memory PNG, which is what the bot sends
+"""
+
+import io
+import warnings
+
+from gwt_pt.benchmark.synthetic import random_bars
+
+class chartBench(object):
+
+    ## nobody charts 10M bars
+    sizes = [1000, 100000]
+
+    def setup(self, n):
+        try:
+            from gwt_pt.charting import frameplot
+        except ImportError as e:
+            raise NotImplementedError(str(e))
+
+        import matplotlib.pyplot as plt
+        from gwt_pt.strategy.strat_macdstoc import macdstoc_strategy
+
+        self.frameplot = frameplot
+        self.plt = plt
+        self.bars = random_bars(n)
+        self.signals = macdstoc_strategy("BENCH", self.bars, 16, 8, frameplot.MACDSTOC_WINDOW, 3, 25,
+                                         frameplot.MACDSTOC_UPPER_LIMIT, frameplot.MACDSTOC_LOWER_LIMIT,
+                                         0.0).generate_signals()
+
+    def time_plot_macdstoc_signals(self, n):
+
+        with warnings.catch_warnings():
+            ## plt.show() on the Agg backend
+            warnings.simplefilter('ignore', UserWarning)
+            self.frameplot.plot_macdstoc_signals(self.bars, self.signals, "BENCH", False)
+            self.plt.savefig(io.BytesIO(), format='png')
+        self.plt.close('all')
+
+class renderBench(object):
+    """
+    The render service's reusable figure, as drawn in each worker process
+    """
+
+    sizes = [1000, 100000]
+
+    def setup(self, n):
+
+        from gwt_pt.charting import render_service
+        from gwt_pt.strategy.strat_macdstoc import macdstoc_strategy
+
+        bars = random_bars(n)
+        signals = macdstoc_strategy("BENCH", bars).generate_signals()
+        self.job = render_service.chart_job(bars, signals, "BENCH")
+        self.template = render_service.chartTemplate()
+
+    def time_render_template(self, n):
+        self.template.render(self.job, io.BytesIO())
+
+    def teardown(self):
+        import matplotlib.pyplot as plt
+        plt.close(self.template.fig)
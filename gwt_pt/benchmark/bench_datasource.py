@@ -0,0 +1,20 @@
+#! /usr/bin/python
+
+"""
+Bar filtering and resampling benchmarks, run by gwt_pt.benchmark.runner
+"""
+
+from gwt_pt.datasource import resample
+from gwt_pt.benchmark.synthetic import random_bar_array
+
+class datasourceBench(object):
+
+    def setup(self, n):
+        ## hourly bars from the 09:15 open, so the HKFE filter has bars to drop
+        self.bars = random_bar_array(n, freq='1h')
+
+    def time_filter_data(self, n):
+        resample.filter_data("HKFE", self.bars, "1 hour")
+
+    def time_resample_bars(self, n):
+        resample.resample_bars(self.bars, "4 hours", "HKFE")
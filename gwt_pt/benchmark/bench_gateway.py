@@ -0,0 +1,94 @@
+#! /usr/bin/python
+
+"""
+Gateway round trip benchmarks, run by gwt_pt.benchmark.runner
+
+The fetch and order paths are timed end to end (pool, socket, ibapi decoder, wrapper queues)
+against an in-process fake_gateway.fakeGateway, so they need no IB Gateway and no network.
+The client side pacing rules are relaxed for the run, the fake gateway does not enforce any.
+"""
+
+import queue
+
+from gwt_pt.datasource import fake_gateway
+from gwt_pt.datasource import ib_session
+from gwt_pt.datasource import ibkr
+
+BAR_SECONDS = 300
+BATCH_SYMBOLS = ["EUR", "GBP", "AUD", "NZD", "CHF", "CAD", "JPY", "SGD"]
+
+MAX_WAIT_SECONDS = 60
+
+class gatewayBench(object):
+    """
+    Shared fake gateway set up, pacing relaxed until teardown
+    """
+
+    def setup(self, n):
+
+        self.gateway = fake_gateway.fakeGateway().start()
+        ib_session.use_gateway("127.0.0.1", self.gateway.port)
+
+        self.pacing = ibkr.HIST_PACING
+        self.pacing_rules = (self.pacing.max_requests, self.pacing.max_same_contract, self.pacing.identical_period)
+        self.pacing.max_requests, self.pacing.max_same_contract, self.pacing.identical_period = 1000000, 1000000, 0
+
+    def teardown(self):
+
+        self.pacing.max_requests, self.pacing.max_same_contract, self.pacing.identical_period = self.pacing_rules
+        ib_session.close_all()
+        ib_session.use_gateway(None, None)
+        self.gateway.stop()
+
+class histBench(gatewayBench):
+
+    ## the bars all go through the ibapi decoder, 10M bars would be several GB of messages
+    sizes = [1000, 100000]
+
+    def time_get_hist_data(self, n):
+        ibkr.get_hist_data(ibkr.hkfe_contract("201810"), "%d S" % (n * BAR_SECONDS), "5 mins", "TRADES")
+
+    def time_get_data_batch(self, n):
+
+        duration = "%d S" % (n // len(BATCH_SYMBOLS) * BAR_SECONDS)
+        requests = [(symbol, ibkr.fx_contract(symbol, "USD"), duration, "5 mins", "MIDPOINT", None)
+                    for symbol in BATCH_SYMBOLS]
+        for key, historic_data in ibkr.get_data_batch(requests):
+            pass
+
+class orderFillBench(gatewayBench):
+
+    ## n / 10 orders
+    sizes = [1000]
+
+    def setup(self, n):
+
+        gatewayBench.setup(self, n)
+
+        from gwt_pt.account import order
+        from ibapi.order import Order
+
+        self.pool = order.order_pool()
+        self.Order = Order
+        with self.pool.session() as app:
+            self.contract = app.resolve_ib_contract(ibkr.hkfe_contract("201810"), self.pool.next_request_id())
+
+    def time_place_and_fill(self, n):
+        """
+        Place n / 10 market orders back to back and wait for all the fills
+        """
+
+        with self.pool.session() as app:
+            fills = app.access_executions_stream()
+            for i in range(n // 10):
+                order = self.Order()
+                order.action = "BUY" if i % 2 == 0 else "SELL"
+                order.orderType = "MKT"
+                order.totalQuantity = 1
+                app.place_new_IB_order(self.contract, order)
+
+            for i in range(n // 10):
+                try:
+                    fills.get(timeout=MAX_WAIT_SECONDS)
+                except queue.Empty:
+                    raise Exception("Only %d of %d orders filled" % (i, n // 10))
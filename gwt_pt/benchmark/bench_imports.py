@@ -0,0 +1,124 @@
+#! /usr/bin/python
+
+"""
+Start up benchmarks, run by gwt_pt.benchmark.runner
+
+Times a fresh interpreter importing each alert / strategy entry point, what a short lived
+monitor run pays before doing anything. Run on its own, it profiles the imports with
+python -X importtime, lists the slowest modules and exits with 1 if an entry point takes longer
+than IMPORT_BUDGET or loads one of the modules which are meant to be imported lazily:
+
+    python -m gwt_pt.benchmark.bench_imports
+    python -m gwt_pt.benchmark.bench_imports gwt_pt.alert.macdstoc_alert --top 30
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+ENTRY_POINTS = [
+    "gwt_pt.alert.macdstoc_alert",
+    "gwt_pt.execution.strat_trade_monitor",
+    "gwt_pt.strategy.strat_ema_xover",
+    "gwt_pt.strategy.strat_mkt_open_reversal",
+    "gwt_pt.execution.alert_daemon",
+    "gwt_pt.datasource.bar_ingest",
+]
+
+## only loaded on the paths which need them (charts, the bot, OANDA, a Redis server)
+LAZY_MODULES = ["matplotlib", "pandas_datareader", "telepot", "v20", "redis", "msgpack"]
+
+## seconds spent importing, per entry point
+IMPORT_BUDGET = 1.0
+TOP = 15
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def run_import(module, importtime=False):
+    """
+    Import module in a new interpreter
+    :return: stderr of the run, the -X importtime report with importtime
+    """
+
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", "import " + module]
+    result = subprocess.run(command, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError("import %s failed:\n%s" % (module, result.stderr[-2000:]))
+    return result.stderr
+
+def parse_importtime(report):
+    """
+    :return: list of (module, self seconds, cumulative seconds) in import order
+    """
+
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6))
+    return modules
+
+def profile(module, top=TOP):
+    """
+    Print the import profile of module
+    :return: (total import seconds, lazy modules it loaded)
+    """
+
+    modules = parse_importtime(run_import(module, importtime=True))
+    total = sum(own for _, own, _ in modules)
+    loaded = sorted(set(name.split(".")[0] for name, _, _ in modules) & set(LAZY_MODULES))
+
+    print("%s: %.3fs" % (module, total))
+    for name, own, cumulative in sorted(modules, key=lambda m: m[2], reverse=True)[:top]:
+        print("    %-50s %8.3fs %8.3fs" % (name.strip(), own, cumulative))
+    if loaded:
+        print("    loads %s" % ", ".join(loaded))
+
+    return total, loaded
+
+class importBench(object):
+    """
+    New interpreter importing an entry point, the size is ignored
+    """
+
+    sizes = [1000]
+
+    def setup(self, n):
+        pass
+
+    def time_macdstoc_alert(self, n):
+        run_import("gwt_pt.alert.macdstoc_alert")
+
+    def time_strat_trade_monitor(self, n):
+        run_import("gwt_pt.execution.strat_trade_monitor")
+
+    def time_alert_daemon(self, n):
+        run_import("gwt_pt.execution.alert_daemon")
+
+def main(args):
+
+    parser = argparse.ArgumentParser(description="import time profile of the entry points")
+    parser.add_argument('modules', nargs='*', default=ENTRY_POINTS)
+    parser.add_argument('--top', type=int, default=TOP, help="slowest modules to list")
+    parser.add_argument('--budget', type=float, default=IMPORT_BUDGET, help="seconds per entry point")
+    options = parser.parse_args(args[1:])
+
+    failed = []
+    for module in options.modules:
+        total, loaded = profile(module, options.top)
+        if total > options.budget or loaded:
+            failed.append(module)
+        print()
+
+    if failed:
+        print("Over budget (%.1fs) or loading lazy modules: %s" % (options.budget, ", ".join(failed)))
+        return 1
+    print("All entry points within %.1fs" % options.budget)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,34 @@
+#! /usr/bin/python
+
+"""
+Indicator benchmarks, run by gwt_pt.benchmark.runner
+"""
+
+from gwt_pt.common.indicator import SMA, EMA, RSI, BB, FASTSTOC, SLOWSTOC, MACD
+from gwt_pt.benchmark.synthetic import random_bars
+
+class indicatorBench(object):
+
+    def setup(self, n):
+        self.bars = random_bars(n)
+
+    def time_SMA(self, n):
+        SMA(self.bars, 'close', 26)
+
+    def time_EMA(self, n):
+        EMA(self.bars, 'close', 25)
+
+    def time_RSI(self, n):
+        RSI(self.bars, 'close', 14)
+
+    def time_BB(self, n):
+        BB(self.bars, 'close', 20)
+
+    def time_FASTSTOC(self, n):
+        FASTSTOC(self.bars, 'low', 'high', 'close', 16, 6)
+
+    def time_SLOWSTOC(self, n):
+        SLOWSTOC(self.bars, 'low', 'high', 'close', 16, 6)
+
+    def time_MACD(self, n):
+        MACD(self.bars['close'])
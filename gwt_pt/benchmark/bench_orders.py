@@ -0,0 +1,29 @@
+#! /usr/bin/python
+
+"""
+Order / execution merging benchmarks, run by gwt_pt.benchmark.runner
+
+Here n is the number of order records, half of them status updates of the same orders
+"""
+
+from gwt_pt.account.order import orderInformation, list_of_orderInformation
+
+class orderBench(object):
+
+    ## a 10M order stack is not a thing
+    sizes = [1000, 100000]
+
+    def setup(self, n):
+        orders = n // 2
+        self.stack = list_of_orderInformation(
+            [orderInformation(i, status="Submitted", filled=0, remaining=10) for i in range(orders)]
+            + [orderInformation(i, status="Filled", filled=10, remaining=0, avgFillPrice=30000.0)
+               for i in range(orders)])
+        self.open_orders = list_of_orderInformation(
+            [orderInformation(i, status="PreSubmitted", permid=i + 1000000) for i in range(orders)])
+
+    def time_merged_dict(self, n):
+        self.stack.merged_dict()
+
+    def time_blended_dict(self, n):
+        self.open_orders.blended_dict(self.stack)
@@ -0,0 +1,237 @@
+#! /usr/bin/python
+
+"""
+Signal benchmarks, run by gwt_pt.benchmark.runner
+
+Run on its own, a micro-benchmark of the Macdstoc crossover stage: times
+macdstoc_strategy.generate_signals on the same indicator frame against two baselines,
+
+    original - the stage as macdstoc_alert.gen_signal built it before the strategy class, chained
+               assignments into zeroed columns, .diff() and a boolean .loc fix-up per column
+    column   - the column-at-a-time rewrite it was first moved to (a Series per signal, no
+               chained assignment)
+
+after checking they give the same frame:
+
+    python -m gwt_pt.benchmark.bench_signals 10000
+
+Under copy-on-write (pandas 3) the original chained assignments no longer write into the frame,
+so its signals are only compared where they still do; it is timed either way.
+"""
+
+import sys
+import timeit
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from gwt_pt.common import signal_pipeline
+from gwt_pt.strategy.strat_macdstoc import macdstoc_strategy
+from gwt_pt.benchmark.synthetic import random_bars
+
+BARS = 10000
+REPEAT = 7
+NUMBER = 20
+
+def original_signals(strat, signals):
+    """
+    The crossover stage of the original macdstoc_alert.gen_signal, with the strategy's parameters
+    in place of the module constants
+    """
+
+    signals = signals.copy()
+
+    # Xover Mark
+    signals['signal_stoc_xup'] = 0.0
+    signals['signal_stoc_xdown'] = 0.0
+    signals['signal_macd_xup'] = 0.0
+    signals['signal_macd_xdown'] = 0.0
+    signals['signal_xup'] = 0.0
+    signals['signal_xdown'] = 0.0
+    signals['signal_sxup'] = 0.0
+    signals['signal_sxdown'] = 0.0
+
+    STOC_WINDOW = strat.stoc_window
+    MACDSTOC_WINDOW = strat.macdstoc_window
+
+    ## Create a 'signal' for Slow Stoc cross over <=25
+    if (len(signals) >= STOC_WINDOW):
+        signals['signal_stoc_xup'][STOC_WINDOW:] = np.where(
+            (signals['k_slow'][STOC_WINDOW:] > signals['d_slow'][STOC_WINDOW:])
+            & (signals['k_slow'][STOC_WINDOW:] <= strat.stoc_lower_limit)
+            , 1.0, 0.0)
+
+    signals['stoc_xup_positions'] = signals['signal_stoc_xup'].diff()
+    signals.loc[signals.stoc_xup_positions == -1.0, 'stoc_xup_positions'] = 0.0
+
+    ## Create a 'signal' for Macdstoc cross up
+    if (len(signals) >= MACDSTOC_WINDOW):
+        signals['signal_xup'][MACDSTOC_WINDOW:] = np.where(
+            (signals['sk_slow'][MACDSTOC_WINDOW:] > signals['sd_slow'][MACDSTOC_WINDOW:] + strat.macdstoc_threshold)
+            & (signals['sd_slow'][MACDSTOC_WINDOW:] <= strat.macdstoc_lower_limit)
+            , 1.0, 0.0)
+
+        signals['signal_sxup'][MACDSTOC_WINDOW:] = np.where(
+            (signals['sk_slow'][MACDSTOC_WINDOW:] == 100)
+            & (signals['sd_slow'][MACDSTOC_WINDOW:] == 100)
+            , 1.0, 0.0)
+
+    signals['xup_positions'] = signals['signal_xup'].diff()
+    signals.loc[signals.xup_positions == -1.0, 'xup_positions'] = 0.0
+    signals['sxup_positions'] = signals['signal_sxup'].diff()
+    signals.loc[signals.sxup_positions == -1.0, 'sxup_positions'] = 0.0
+
+    ## Create a 'signal' for Macdstoc cross down
+    if (len(signals) >= MACDSTOC_WINDOW):
+        signals['signal_xdown'][MACDSTOC_WINDOW:] = np.where(
+            (signals['sk_slow'][MACDSTOC_WINDOW:] < signals['sd_slow'][MACDSTOC_WINDOW:] - strat.macdstoc_threshold)
+            & (signals['sd_slow'][MACDSTOC_WINDOW:] >= strat.macdstoc_upper_limit)
+            , 1.0, 0.0)
+
+        signals['signal_sxdown'][MACDSTOC_WINDOW:] = np.where(
+            (signals['sk_slow'][MACDSTOC_WINDOW:] == 0)
+            & (signals['sd_slow'][MACDSTOC_WINDOW:] == 0)
+            , 1.0, 0.0)
+
+    signals['xdown_positions'] = signals['signal_xdown'].diff()
+    signals.loc[signals.xdown_positions == -1.0, 'xdown_positions'] = 0.0
+    signals['sxdown_positions'] = signals['signal_sxdown'].diff()
+    signals.loc[signals.sxdown_positions == -1.0, 'sxdown_positions'] = 0.0
+
+    ## Aggregrate the special case + normal case together
+    signals['xup_positions'] = signals['xup_positions'] + signals['sxup_positions']
+    signals['xdown_positions'] = signals['xdown_positions'] + signals['sxdown_positions']
+
+    return signals
+
+def chained_assignment_writes():
+    """
+    False under copy-on-write, where original_signals leaves its signal columns at 0.0
+    """
+
+    frame = pd.DataFrame({'a': [0.0, 0.0]})
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        frame['a'][1:] = 1.0
+    return frame['a'].iloc[1] == 1.0
+
+def column_signals(strat, signals):
+    """
+    The crossover stage as first rewritten, one pandas column at a time
+    """
+
+    signals = signals.copy()
+
+    k_slow, d_slow = signals['k_slow'].values, signals['d_slow'].values
+    sk_slow, sd_slow = signals['sk_slow'].values, signals['sd_slow'].values
+
+    def after_window(condition, window):
+        signal = np.where(condition, 1.0, 0.0)
+        signal[:window] = 0.0
+        return pd.Series(signal, index=signals.index)
+
+    def xover_positions(signal):
+        positions = signal.diff()
+        positions[positions == -1.0] = 0.0
+        return positions
+
+    signals['signal_stoc_xup'] = after_window((k_slow > d_slow) & (k_slow <= strat.stoc_lower_limit),
+                                              strat.stoc_window)
+    signals['signal_stoc_xdown'] = 0.0
+    signals['signal_macd_xup'] = 0.0
+    signals['signal_macd_xdown'] = 0.0
+
+    window = strat.macdstoc_window
+    signals['signal_xup'] = after_window((sk_slow > sd_slow + strat.macdstoc_threshold)
+                                         & (sd_slow <= strat.macdstoc_lower_limit), window)
+    signals['signal_sxup'] = after_window((sk_slow == 100) & (sd_slow == 100), window)
+    signals['signal_xdown'] = after_window((sk_slow < sd_slow - strat.macdstoc_threshold)
+                                           & (sd_slow >= strat.macdstoc_upper_limit), window)
+    signals['signal_sxdown'] = after_window((sk_slow == 0) & (sd_slow == 0), window)
+
+    signals['stoc_xup_positions'] = xover_positions(signals['signal_stoc_xup'])
+    signals['xup_positions'] = xover_positions(signals['signal_xup'])
+    signals['sxup_positions'] = xover_positions(signals['signal_sxup'])
+    signals['xdown_positions'] = xover_positions(signals['signal_xdown'])
+    signals['sxdown_positions'] = xover_positions(signals['signal_sxdown'])
+
+    signals['xup_positions'] = signals['xup_positions'] + signals['sxup_positions']
+    signals['xdown_positions'] = signals['xdown_positions'] + signals['sxdown_positions']
+
+    return signals
+
+def best_of(func, repeat=REPEAT, number=NUMBER):
+    """
+    Best time of one call in seconds
+    """
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+def run(n=BARS):
+    """
+    :return: dict of bars, original / column / block seconds per call, the speedups over both
+             baselines and whether the original's frame was compared
+    """
+
+    bars = random_bars(n)
+    strat = macdstoc_strategy("BENCH", bars)
+    indicators = strat.generate_indicators()
+    expected = strat.generate_signals(indicators)
+
+    pd.testing.assert_frame_equal(column_signals(strat, indicators), expected)
+    compared = chained_assignment_writes()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if compared:
+            ## same columns, in the order the original added them
+            pd.testing.assert_frame_equal(original_signals(strat, indicators), expected, check_like=True)
+        original = best_of(lambda: original_signals(strat, indicators))
+
+    column = best_of(lambda: column_signals(strat, indicators))
+    block = best_of(lambda: strat.generate_signals(indicators))
+    return {'bars': n, 'original': original, 'column': column, 'block': block,
+            'speedup': original / block, 'column_speedup': column / block, 'compared': compared}
+
+class signalBench(object):
+
+    def setup(self, n):
+        self.bars = random_bars(n)
+        self.strategy = macdstoc_strategy("BENCH", self.bars)
+        self.indicators = self.strategy.generate_indicators()
+
+    def time_crossover_stage(self, n):
+        self.strategy.generate_signals(self.indicators)
+
+    def time_generate_signals(self, n):
+        ## cold, indicators included
+        signal_pipeline.get_pipeline().clear()
+        self.strategy.generate_signals()
+
+class genSignalBench(object):
+
+    def setup(self, n):
+        try:
+            from gwt_pt.alert import macdstoc_alert
+        except ImportError as e:
+            raise NotImplementedError(str(e))
+        self.gen_signal = macdstoc_alert.gen_signal
+        self.bars = random_bars(n)
+
+    def time_gen_signal(self, n):
+        signal_pipeline.get_pipeline().clear()
+        self.gen_signal(self.bars, "BENCH")
+
+def main(args):
+
+    n = int(args[1]) if len(args) > 1 else BARS
+    result = run(n)
+    print("Crossover stage on %d bars: original %.3fms, column %.3fms, block %.3fms" % (
+        result['bars'], result['original'] * 1000, result['column'] * 1000, result['block'] * 1000))
+    print("Block is %.1fx faster than the original, %.1fx than the column rewrite" % (
+        result['speedup'], result['column_speedup']))
+    if not result['compared']:
+        print("Original frame not compared, chained assignment does not write under copy-on-write")
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,239 @@
+#! /usr/bin/python
+
+"""
+Benchmark runner, asv style
+
+Every bench_*.py module in this package holds classes with time_* methods. Before timing, the
+runner calls setup(n) with the number of bars (a class can narrow the sizes with a sizes
+attribute, and skip itself by raising NotImplementedError in setup, eg. for a missing optional
+dependency). Each result is the best and the median time of one call, and the results of a run
+are written to a JSON file tagged with the git commit, so a change can be compared with the
+last run:
+
+    python -m gwt_pt.benchmark.runner run                     # 1k, 100k and 10M bars
+    python -m gwt_pt.benchmark.runner run --sizes 1000,100000 --bench indicator
+    python -m gwt_pt.benchmark.runner compare                 # the last two runs
+    python -m gwt_pt.benchmark.runner compare old.json new.json --threshold 1.2
+
+compare exits with 1 when anything got slower than threshold times its old median.
+"""
+
+import os
+import re
+import sys
+import gc
+import json
+import time
+import glob
+import math
+import platform
+import argparse
+import datetime
+import importlib
+import subprocess
+import traceback
+
+import numpy as np
+import pandas as pd
+
+SIZES = [1000, 100000, 10000000]
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+## keep timing a benchmark until a repeat takes at least MIN_TIME seconds
+MIN_TIME = 0.2
+REPEAT = 5
+## slower calls are only timed once
+SLOW_CALL = 2.0
+
+THRESHOLD = 1.2
+
+def bench_modules():
+    """
+    Names of the bench_*.py modules in this package
+    """
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return sorted(os.path.splitext(os.path.basename(path))[0]
+                  for path in glob.glob(os.path.join(directory, 'bench_*.py')))
+
+def bench_classes(module):
+    """
+    Classes defined in a bench module with time_* methods
+    """
+
+    classes = []
+    for name in sorted(dir(module)):
+        obj = getattr(module, name)
+        if isinstance(obj, type) and obj.__module__ == module.__name__ and timers(obj):
+            classes.append(obj)
+    return classes
+
+def timers(cls):
+    return sorted(name for name in dir(cls) if name.startswith('time_') and callable(getattr(cls, name)))
+
+def time_call(func, min_time=MIN_TIME, repeat=REPEAT):
+    """
+    :return: dict of min / median seconds per call, the calls per sample and the number of samples
+    """
+
+    ## the first call warms up caches and gives the scale
+    start_time = time.perf_counter()
+    func()
+    first = time.perf_counter() - start_time
+
+    if first >= SLOW_CALL:
+        return {'min': first, 'median': first, 'number': 1, 'repeat': 1}
+
+    number = max(1, int(math.ceil(min_time / max(first, 1e-6)))) if first < min_time else 1
+    samples = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start_time) / number)
+
+    return {'min': min(samples), 'median': float(np.median(samples)), 'number': number, 'repeat': repeat}
+
+def git_commit():
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run(sizes=SIZES, pattern=None):
+    """
+    Run every benchmark matching pattern (a regex on module.class.method) at each size
+    :return: dict of run metadata and results, {name: {size: timing}}, None timings for skipped ones
+    """
+
+    results = {}
+    start_time = time.time()
+
+    for module_name in bench_modules():
+        module = importlib.import_module('gwt_pt.benchmark.' + module_name)
+
+        for cls in bench_classes(module):
+            names = [name for name in timers(cls)
+                     if pattern is None or re.search(pattern, "%s.%s.%s" % (module_name, cls.__name__, name))]
+            if not names:
+                continue
+
+            for n in sizes:
+                if n not in getattr(cls, 'sizes', SIZES):
+                    continue
+
+                bench = cls()
+                try:
+                    bench.setup(n)
+                except NotImplementedError as e:
+                    print("%s.%s [%d] skipped: %s" % (module_name, cls.__name__, n, e))
+                    for name in names:
+                        results.setdefault("%s.%s.%s" % (module_name, cls.__name__, name), {})[str(n)] = None
+                    continue
+
+                for name in names:
+                    key = "%s.%s.%s" % (module_name, cls.__name__, name)
+                    try:
+                        timing = time_call(lambda: getattr(bench, name)(n))
+                        print("%-60s %10d %12.6fs" % (key, n, timing['median']))
+                    except Exception:
+                        print("%s [%d] failed" % (key, n))
+                        traceback.print_exc()
+                        timing = None
+                    results.setdefault(key, {})[str(n)] = timing
+
+                if hasattr(bench, 'teardown'):
+                    bench.teardown()
+                del bench
+                gc.collect()
+
+    return {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': platform.node(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'elapsed': time.time() - start_time,
+        'results': results
+    }
+
+def save(run_result, results_dir=RESULTS_DIR):
+    """
+    :return: path of the JSON file written
+    """
+
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    path = os.path.join(results_dir, "%s-%s.json" % (run_result['date'].replace(':', '').replace('-', ''),
+                                                     run_result['commit']))
+    with open(path, 'w') as f:
+        json.dump(run_result, f, indent=1, sort_keys=True)
+    return path
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(old, new, threshold=THRESHOLD):
+    """
+    Ratio of new to old median per benchmark and size
+    :return: DataFrame of old, new, ratio, sorted slowest first, and the rows over threshold
+    """
+
+    rows = []
+    for key, by_size in new['results'].items():
+        for n, timing in by_size.items():
+            before = old['results'].get(key, {}).get(n)
+            if timing is None or before is None:
+                continue
+            rows.append({'benchmark': key, 'bars': int(n), 'old': before['median'], 'new': timing['median'],
+                         'ratio': timing['median'] / before['median'] if before['median'] > 0 else np.nan})
+
+    table = pd.DataFrame(rows, columns=['benchmark', 'bars', 'old', 'new', 'ratio'])
+    table = table.sort_values('ratio', ascending=False).reset_index(drop=True)
+    return table, table[table['ratio'] > threshold]
+
+def main(args):
+
+    parser = argparse.ArgumentParser(description="Benchmarks of the indicator, signal and backtest hot paths")
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help="run the benchmarks and record the results")
+    run_parser.add_argument('--sizes', default=",".join(str(n) for n in SIZES), help="bar counts, comma separated")
+    run_parser.add_argument('--bench', default=None, help="regex on module.class.method")
+    run_parser.add_argument('--results-dir', default=RESULTS_DIR)
+
+    compare_parser = commands.add_parser('compare', help="compare two recorded runs, the last two by default")
+    compare_parser.add_argument('files', nargs='*')
+    compare_parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    compare_parser.add_argument('--results-dir', default=RESULTS_DIR)
+
+    options = parser.parse_args(args[1:])
+
+    if options.command == 'compare':
+        files = options.files or sorted(glob.glob(os.path.join(options.results_dir, '*.json')))[-2:]
+        if len(files) != 2:
+            print("Need two result files to compare, found %d" % len(files))
+            return 2
+
+        table, regressions = compare(load(files[0]), load(files[1]), options.threshold)
+        print("%s -> %s" % (files[0], files[1]))
+        print(table.to_string())
+        if len(regressions):
+            print("%d benchmarks slower than %.2fx:" % (len(regressions), options.threshold))
+            print(regressions.to_string())
+            return 1
+        return 0
+
+    sizes = [int(n) for n in options.sizes.split(',')] if options.command == 'run' else SIZES
+    result = run(sizes, options.bench if options.command == 'run' else None)
+    path = save(result, options.results_dir if options.command == 'run' else RESULTS_DIR)
+    print("Ran %d benchmarks in %.1fs, results in %s" % (len(result['results']), result['elapsed'], path))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,39 @@
+#! /usr/bin/python
+
+"""
+Synthetic data for the benchmarks, deterministic for a given size and seed
+"""
+
+import numpy as np
+import pandas as pd
+
+from gwt_pt.datasource.bar_array import barArray
+
+## HKFE day session open, so hourly bars include the partial 09:15 bar filter_data drops
+START = '2018-01-02 09:15'
+
+def random_bars(n, seed=0, freq='5min'):
+    """
+    Random walk OHLCV bars
+    :return: DataFrame of open, high, low, close, volume with a datetime index
+    """
+
+    rng = np.random.default_rng(seed)
+    close = 20000 + np.cumsum(rng.standard_normal(n) * 10)
+    open = np.empty(n)
+    open[:1] = close[:1]
+    open[1:] = close[:-1]
+    spread = np.abs(rng.standard_normal(n)) * 10
+    index = pd.date_range(START, periods=n, freq=freq, name='datetime')
+    return pd.DataFrame({'open': open, 'high': np.maximum(open, close) + spread,
+                         'low': np.minimum(open, close) - spread, 'close': close,
+                         'volume': rng.integers(1, 500, n).astype(np.float64)}, index=index)
+
+def random_bar_array(n, seed=0, freq='5min'):
+    """
+    Same bars as random_bars, as the barArray the IB client returns
+    """
+
+    bars = random_bars(n, seed, freq)
+    ts = bars.index.values.astype('datetime64[s]').astype(np.int64)
+    return barArray.from_arrays(ts, bars[['open', 'high', 'low', 'close', 'volume']].values)
@@ -14,6 +14,7 @@ from matplotlib.dates import DateFormatter
 import matplotlib.ticker as ticker
 
 from gwt_pt.datasource import ibkr 
+from gwt_pt.charting import render_service
 
 import time
 import datetime
@@ -24,23 +25,8 @@ def plot_with_portfolio(historic_df, signals, portfolio, title, isFile=False):
     fig.patch.set_facecolor('white')     # Set the outer colour to white
     fig.suptitle(title, fontsize=12, color='grey')
 
-    plt.style.use('bmh')
-
-    plt.rcParams['font.family'] = 'serif'
-    plt.rcParams['font.serif'] = 'Ubuntu'
-    plt.rcParams['font.monospace'] = 'Ubuntu Mono'
-    plt.rcParams['font.size'] = 8
-
-    plt.rcParams['axes.labelsize'] = 8
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 9
-    plt.rcParams['axes.titleweight'] = 'bold'
-    plt.rcParams['xtick.labelsize'] = 8
-    plt.rcParams['ytick.labelsize'] = 8
-    plt.rcParams['lines.linewidth'] = 1
-    plt.rcParams['legend.fontsize'] = 8
-    plt.rcParams['figure.facecolor'] = '#fffff9'
-    plt.rcParams['figure.titlesize'] = 8
+    ## style and fonts are set once per process
+    render_service.apply_style()
 
     ax1 = plt.subplot2grid((10, 1), (0, 0), rowspan=4, ylabel='Price in $')
 
@@ -55,12 +41,10 @@ def plot_with_portfolio(historic_df, signals, portfolio, title, isFile=False):
     ax1.plot(df_idx, signals['ema25'], lw=1.)
     
     # plot pf xup / xdown
-    pf_xup_idx = signals.ix[signals.xup_pos == 1.0].index
-    df_pf_xup_idx = [signals.index.get_loc(idx) for idx in pf_xup_idx]
+    df_pf_xup_idx = np.flatnonzero(signals.xup_pos.values == 1.0)
     ax1.plot(df_pf_xup_idx, signals.low[signals.xup_pos == 1.0], '^', markersize=7, color='m')
 
-    pf_xdown_idx = signals.ix[signals.xdown_pos == 1.0].index
-    df_pf_xdown_idx = [signals.index.get_loc(idx) for idx in pf_xdown_idx]
+    df_pf_xdown_idx = np.flatnonzero(signals.xdown_pos.values == 1.0)
     ax1.plot(df_pf_xdown_idx, signals.high[signals.xdown_pos == 1.0], 'v', markersize=7, color='r')
     
     ax1.xaxis.set_major_formatter(ticker.FuncFormatter(format_date))
@@ -121,13 +105,9 @@ def plot_with_portfolio(historic_df, signals, portfolio, title, isFile=False):
     # Plot the figure
     plt.tight_layout(w_pad=3, h_pad=3)
     if (isFile):
-        if not os.name == 'nt':
-            tstr = str(int(round(time.time() * 1000)))
-            chartpath = "/var/www/eggyolk.tech/html/gwtpt/" + 'pchart' + tstr + '.png'
-        else:
-            chartpath = "C:\\Temp\\gwtpt\\" + 'pchart' + str(int(round(time.time() * 1000))) + '.png'
-        
+        chartpath = render_service.chart_path()
         plt.savefig(chartpath, bbox_inches='tight')
+        plt.close(fig)
         print("Chart generated at %s" % chartpath)
         return chartpath 
     else:
@@ -0,0 +1,218 @@
+#! /usr/bin/python
+
+"""
+Cache of rendered charts
+
+A chart only changes when a new bar comes in, so charts are kept by the data they were drawn
+from, (symbol, bar size, chart type, timestamp and close of the last bar):
+
+- current() answers a repeat request without asking IB for data at all, with the latest chart of
+  the symbol as long as its last bar is still the one forming (now < last bar + bar size). The bar
+  times come from the data, so session aligned bars (IB FX 4 hours start at 02:15, 06:15...) and
+  skipped partial bars are handled the same as epoch aligned ones
+- data_key() of freshly fetched bars finds the same chart again, for when the clock has moved on
+  but IB has not printed the new bar yet
+
+Each entry keeps the PNG path and, once sent, the Telegram file_id of the photo, which can be
+sent again without uploading the file. Entries (and their files) are evicted by count, total
+size and age:
+
+    cache = chart_cache.get_cache()
+    entry = cache.current("EUR/USD", "4 hours", "macdstoc")
+    if entry is None:
+        ... fetch ...
+        key = cache.data_key("EUR/USD", "4 hours", "macdstoc", historic_df)
+        entry = cache.get(key)
+        if entry is None:
+            ... render ...
+            entry = cache.put(key, chartpath)
+"""
+
+import os
+import time
+import calendar
+import datetime
+from collections import OrderedDict
+from threading import Lock
+
+from gwt_pt.datasource import bar_store
+
+MAX_ENTRIES = 200
+MAX_BYTES = 200 * 1024 * 1024
+## a day, charts of daily bars are refreshed at least this often
+MAX_AGE_SECONDS = 86400
+
+def now_ts():
+    """
+    Wall clock in the bar store convention, local time stored as if it were UTC
+    """
+    return calendar.timegm(datetime.datetime.now().timetuple())
+
+class chartEntry(object):
+
+    def __init__(self, key, path, bar_end=None):
+        self.key = key
+        self.path = path
+        ## end of the last bar drawn, the chart is current until then
+        self.bar_end = bar_end
+        self.file_id = None
+        self.created = time.time()
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        self.hits = 0
+
+    def __repr__(self):
+        return "chartEntry %s -> %s (%d bytes, %d hits)" % (str(self.key), self.path, self.size, self.hits)
+
+class chartCache(object):
+    """
+    LRU of chart files, evicted by count, bytes and age
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, max_age=MAX_AGE_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._entries = OrderedDict()
+        ## (symbol, bar size, chart type) -> key of its latest chart
+        self._latest = {}
+        self._bytes = 0
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return "chartCache %d charts, %d bytes, %d hits, %d misses" % (len(self._entries), self._bytes,
+                                                                        self.hits, self.misses)
+
+    def data_key(self, symbol, bar_size, chart_type, historic_df):
+        """
+        Key of the data a chart is drawn from, the timestamp and close of its last bar
+        :param historic_df: DataFrame of bars with a datetime index
+        """
+
+        if len(historic_df) == 0:
+            return (symbol, bar_size, chart_type, None, None)
+        last_ts = calendar.timegm(historic_df.index[-1].timetuple())
+        return (symbol, bar_size, chart_type, last_ts, float(historic_df['close'].values[-1]))
+
+    def current(self, symbol, bar_size, chart_type, now=None):
+        """
+        The latest chart of the symbol, if the last bar it was drawn from is still forming
+        :return: chartEntry or None
+        """
+
+        now = now_ts() if now is None else now
+
+        with self._lock:
+            key = self._latest.get((symbol, bar_size, chart_type))
+            entry = self._entries.get(key)
+            if entry is None or entry.bar_end is None or now >= entry.bar_end:
+                self.misses += 1
+                return None
+            return self._hit(key, entry)
+
+    def _expired(self, entry, now):
+        return now - entry.created > self.max_age or not os.path.exists(entry.path)
+
+    def get(self, key):
+        """
+        :return: chartEntry, or None if there is no live chart for the key
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            return self._hit(key, entry)
+
+    def _hit(self, key, entry):
+        """
+        (lock held)
+        :return: entry, None if it has expired
+        """
+
+        if self._expired(entry, time.time()):
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        entry.hits += 1
+        self.hits += 1
+        return entry
+
+    def put(self, key, path):
+        """
+        Add a rendered chart, evicting the oldest ones over the limits
+        :param key: data_key of the bars it was drawn from
+        :return: the new chartEntry
+        """
+
+        symbol, bar_size, chart_type, last_ts = key[:4]
+        bar_end = None if last_ts is None else last_ts + bar_store.BAR_SECONDS.get(bar_size, 86400)
+        entry = chartEntry(key, path, bar_end)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._latest[(symbol, bar_size, chart_type)] = key
+            self._evict()
+
+        return entry
+
+    def set_file_id(self, key, file_id):
+        """
+        Remember the Telegram file_id the chart was stored under once sent
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.file_id = file_id
+
+    def _remove(self, key):
+        """
+        Drop a key and its chart file (lock held)
+        """
+
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        if self._latest.get(key[:3]) == key:
+            del self._latest[key[:3]]
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+    def _evict(self):
+
+        now = time.time()
+        for key in [key for key, entry in self._entries.items() if self._expired(entry, now)]:
+            self._remove(key)
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+_CACHE = None
+_CACHE_LOCK = Lock()
+
+def get_cache():
+    """
+    The process wide chart cache
+    """
+
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = chartCache()
+        return _CACHE
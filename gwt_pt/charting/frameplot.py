@@ -3,7 +3,6 @@
 import numpy as np
 import pandas as pd
 import os
-from pandas_datareader import data as web, wb
 from gwt_pt.common.indicator import SMA, EMA, RSI, FASTSTOC, SLOWSTOC, MACD
 
 import matplotlib
@@ -17,6 +16,10 @@ from matplotlib.dates import DateFormatter
 import matplotlib.ticker as ticker
 
 from gwt_pt.datasource import ibkr 
+from gwt_pt.charting import render_service
+from gwt_pt.datasource import bar_array
+from gwt_pt.common import signal_pipeline
+from gwt_pt.strategy.strat_macdstoc import macdstoc_strategy
 
 import time
 import datetime
@@ -37,25 +40,8 @@ def plot_macdstoc_signals(historic_df, signals, title, isFile=False):
     fig.patch.set_facecolor('white')     # Set the outer colour to white
     fig.suptitle(title, fontsize=12, color='grey')
 
-    plt.style.use('bmh')
-    #plt.style.use('ggplot')
-    #plt.style.use('fivethirtyeight')
-
-    plt.rcParams['font.family'] = 'serif'
-    plt.rcParams['font.serif'] = 'Ubuntu'
-    plt.rcParams['font.monospace'] = 'Ubuntu Mono'
-    plt.rcParams['font.size'] = 8
-
-    plt.rcParams['axes.labelsize'] = 8
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 9
-    plt.rcParams['axes.titleweight'] = 'bold'
-    plt.rcParams['xtick.labelsize'] = 8
-    plt.rcParams['ytick.labelsize'] = 8
-    plt.rcParams['lines.linewidth'] = 1
-    plt.rcParams['legend.fontsize'] = 8
-    plt.rcParams['figure.facecolor'] = '#fffff9'
-    plt.rcParams['figure.titlesize'] = 8
+    ## style and fonts are set once per process
+    render_service.apply_style()
 
     ax1 = plt.subplot2grid((10, 1), (0, 0), rowspan=4, ylabel='Price in $')
 
@@ -75,12 +61,10 @@ def plot_macdstoc_signals(historic_df, signals, title, isFile=False):
     #ax1.plot(df_stoc_xup_idx, signals.low[signals.stoc_xup_positions == 1.0], '^', markersize=7, color='m')
 
     # plot macdstoc xup / xdown
-    xup_idx = signals.ix[signals.xup_positions == 1.0].index
-    df_xup_idx = [signals.index.get_loc(idx) for idx in xup_idx]
+    df_xup_idx = np.flatnonzero(signals.xup_positions.values == 1.0)
     ax1.plot(df_xup_idx, signals.low[signals.xup_positions == 1.0], '^', markersize=7, color='m')
 
-    xdown_idx = signals.ix[signals.xdown_positions == 1.0].index
-    df_xdown_idx = [signals.index.get_loc(idx) for idx in xdown_idx]
+    df_xdown_idx = np.flatnonzero(signals.xdown_positions.values == 1.0)
     ax1.plot(df_xdown_idx, signals.high[signals.xdown_positions == 1.0], 'v', markersize=7, color='r')
     
     ax1.xaxis.set_major_formatter(ticker.FuncFormatter(format_date))
@@ -142,13 +126,9 @@ def plot_macdstoc_signals(historic_df, signals, title, isFile=False):
     # Plot the figure
     plt.tight_layout(w_pad=3, h_pad=3)
     if (isFile):
-        if not os.name == 'nt':
-            tstr = str(int(round(time.time() * 1000)))
-            chartpath = "/var/www/eggyolk.tech/html/gwtpt/" + 'pchart' + tstr + '.png'
-        else:
-            chartpath = "C:\\Temp\\gwtpt\\" + 'pchart' + str(int(round(time.time() * 1000))) + '.png'
-        
+        chartpath = render_service.chart_path()
         plt.savefig(chartpath, bbox_inches='tight')
+        plt.close(fig)
         return chartpath 
     else:
         print("Plotting Chart.............")
@@ -161,79 +141,12 @@ def plot_test(historic_data, title, isFile=False):
     #pd.options.display.float_format = "{:.9f}".format
     
     # Data pre-processing
-    historic_df = pd.DataFrame(historic_data, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
-    historic_df.set_index('datetime', inplace=True)
-    historic_df.index = pd.to_datetime(historic_df.index)
-
-    signals = pd.DataFrame(index=historic_df.index)
-    signals['open'] = historic_df['open']    
-    signals['high'] = historic_df['high']
-    signals['low'] = historic_df['low']
-    signals['close'] = historic_df['close']
-    signals["ema25"] = EMA(signals, 'close', 25)
-
-    # MACD
-    macd = MACD(historic_df['close'])
-    signals = pd.concat([signals, macd], axis=1)
-
-    # Slowstoc
-    kslow, dslow = SLOWSTOC(historic_df, 'low', 'high', 'close', STOC_WINDOW, 8, False)
-    signals = pd.concat([signals, kslow, dslow], axis=1)
-
-    # Super Macdstoc
-    skslow, sdslow = FASTSTOC(signals, "macd", "macd", "macd", MACDSTOC_WINDOW, 3, False)
-    skslow = skslow.rename(columns = {'k_fast':'sk_slow'})
-    sdslow = sdslow.rename(columns = {'d_fast':'sd_slow'})
-    signals = pd.concat([signals, skslow, sdslow], axis=1)
-    
-    # Xover Mark
-    signals['signal_stoc_xup'] = 0.0
-    signals['signal_stoc_xdown'] = 0.0
-    signals['signal_macd_xup'] = 0.0
-    signals['signal_macd_xdown'] = 0.0
-    signals['signal_xup'] = 0.0
-    signals['signal_xdown'] = 0.0    
-
-    ###############################################################################
-    ## Create a 'signal' for Slow Stoc cross over <=25    
-    if (len(signals) >= STOC_WINDOW):
-        signals['signal_stoc_xup'][STOC_WINDOW:] = np.where(
-            (signals['k_slow'][STOC_WINDOW:] > signals['d_slow'][STOC_WINDOW:])
-            & (signals['k_slow'][STOC_WINDOW:] <= STOC_LOWER_LIMIT)
-            , 1.0, 0.0)
-    else:
-        signals['signal_stoc_xup'] = 0.0
-    
-    ## Take the difference of the signals in order to generate actual trading orders
-    signals['stoc_xup_positions'] = signals['signal_stoc_xup'].diff()
-    signals.loc[signals.stoc_xup_positions == -1.0, 'stoc_xup_positions'] = 0.0    
-    
-    ###############################################################################
-    ## Create a 'signal' for Macdstoc cross up <=5
-    if (len(signals) >= MACDSTOC_WINDOW):
-        signals['signal_xup'][MACDSTOC_WINDOW:] = np.where(
-            (signals['sk_slow'][MACDSTOC_WINDOW:] > signals['sd_slow'][MACDSTOC_WINDOW:])
-            & (signals['sd_slow'][MACDSTOC_WINDOW:] <= MACDSTOC_LOWER_LIMIT)
-            , 1.0, 0.0)
-    else:
-        signals['signal_xup'] = 0.0
-    
-    ## Take the difference of the signals in order to generate actual trading orders
-    signals['xup_positions'] = signals['signal_xup'].diff()
-    signals.loc[signals.xup_positions == -1.0, 'xup_positions'] = 0.0
- 
-    ## Create a 'signal' for Macdstoc cross down >=95
-    if (len(signals) >= MACDSTOC_WINDOW):
-        signals['signal_xdown'][MACDSTOC_WINDOW:] = np.where(
-            (signals['sk_slow'][MACDSTOC_WINDOW:] < signals['sd_slow'][MACDSTOC_WINDOW:])
-            & (signals['sd_slow'][MACDSTOC_WINDOW:] >= MACDSTOC_UPPER_LIMIT)
-            , 1.0, 0.0)
-    else:
-        signals['signal_xdown'] = 0.0
-    
-    ## Take the difference of the signals in order to generate actual trading orders
-    signals['xdown_positions'] = signals['signal_xdown'].diff()
-    signals.loc[signals.xdown_positions == -1.0, 'xdown_positions'] = 0.0
+    historic_df = bar_array.to_frame(historic_data)
+
+    ## same indicators / signal rules as the alert, computed once through the signal pipeline
+    strategy = macdstoc_strategy("", historic_df, STOC_WINDOW, 8, MACDSTOC_WINDOW, 3, STOC_LOWER_LIMIT,
+                                 MACDSTOC_UPPER_LIMIT, MACDSTOC_LOWER_LIMIT, 0.0)
+    signals = signal_pipeline.get_pipeline().signals(strategy, historic_df)
  
     #print(signals.info())
     #print(signals.to_string())
@@ -244,25 +157,8 @@ def plot_test(historic_data, title, isFile=False):
     fig.patch.set_facecolor('white')     # Set the outer colour to white
     fig.suptitle(title, fontsize=12, color='grey')
 
-    plt.style.use('bmh')
-    #plt.style.use('ggplot')
-    #plt.style.use('fivethirtyeight')
-
-    plt.rcParams['font.family'] = 'serif'
-    plt.rcParams['font.serif'] = 'Ubuntu'
-    plt.rcParams['font.monospace'] = 'Ubuntu Mono'
-    plt.rcParams['font.size'] = 8
-
-    plt.rcParams['axes.labelsize'] = 8
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 9
-    plt.rcParams['axes.titleweight'] = 'bold'
-    plt.rcParams['xtick.labelsize'] = 8
-    plt.rcParams['ytick.labelsize'] = 8
-    plt.rcParams['lines.linewidth'] = 1
-    plt.rcParams['legend.fontsize'] = 8
-    plt.rcParams['figure.facecolor'] = '#fffff9'
-    plt.rcParams['figure.titlesize'] = 8
+    ## style and fonts are set once per process
+    render_service.apply_style()
 
     #ax1 = fig.add_subplot(211,  ylabel='Price in $')
     ax1 = plt.subplot2grid((10, 1), (0, 0), rowspan=4, ylabel='Price in $')
@@ -283,12 +179,10 @@ def plot_test(historic_data, title, isFile=False):
     #ax1.plot(df_stoc_xup_idx, signals.low[signals.stoc_xup_positions == 1.0], '^', markersize=7, color='m')
 
     # plot macdstoc xup / xdown
-    xup_idx = signals.ix[signals.xup_positions == 1.0].index
-    df_xup_idx = [signals.index.get_loc(idx) for idx in xup_idx]
+    df_xup_idx = np.flatnonzero(signals.xup_positions.values == 1.0)
     ax1.plot(df_xup_idx, signals.low[signals.xup_positions == 1.0], '^', markersize=7, color='m')
 
-    xdown_idx = signals.ix[signals.xdown_positions == 1.0].index
-    df_xdown_idx = [signals.index.get_loc(idx) for idx in xdown_idx]
+    df_xdown_idx = np.flatnonzero(signals.xdown_positions.values == 1.0)
     ax1.plot(df_xdown_idx, signals.high[signals.xdown_positions == 1.0], 'v', markersize=7, color='r')
     
     ax1.xaxis.set_major_formatter(ticker.FuncFormatter(format_date))
@@ -361,13 +255,9 @@ def plot_test(historic_data, title, isFile=False):
     # Plot the figure
     plt.tight_layout(w_pad=3, h_pad=3)
     if (isFile):
-        tstr = str(int(round(time.time() * 1000)))
-        if not os.name == 'nt':            
-            chartpath = "/var/www/eggyolk.tech/html/gwtpt/" + 'pchart' + tstr + '.png'
-        else:
-            chartpath = "C:\\Temp\\gwtpt\\" + 'pchart' + tstr + '.png'
-        
+        chartpath = render_service.chart_path()
         plt.savefig(chartpath, bbox_inches='tight')
+        plt.close(fig)
         return chartpath 
     else:
         plt.show()
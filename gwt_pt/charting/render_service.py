@@ -0,0 +1,291 @@
+#! /usr/bin/python
+
+"""
+Background chart rendering
+
+The Macdstoc chart (price / ema25 with the signals, slow stochastic, MACD, Macdstoc) is drawn in
+a pool of worker processes, so the alert loop does not wait on matplotlib and PNG encoding.
+Every worker sets the chart style once and builds one figure with all its artists; a render
+job only swaps the line data in, rescales and saves:
+
+    path = render_service.chart_path()
+    chart = render_service.get_service().submit(historic_df, signals, title, path)
+    chart.add_done_callback(lambda f: bot_sender.broadcast(message))
+
+Only plain arrays are sent to the workers. Call get_service().start() early, before the IB and
+Telegram threads are up, so the workers are forked from a quiet process. matplotlib is only
+imported where a chart is drawn, the processes queueing charts never load it.
+"""
+
+import os
+import sys
+import time
+import atexit
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+RENDER_WORKERS = 2
+
+if not os.name == 'nt':
+    CHART_DIR = "/var/www/eggyolk.tech/html/gwtpt/"
+else:
+    CHART_DIR = "C:\\Temp\\gwtpt\\"
+
+CHART_STYLE = {
+    'font.family': 'serif',
+    'font.serif': 'Ubuntu',
+    'font.monospace': 'Ubuntu Mono',
+    'font.size': 8,
+    'axes.labelsize': 8,
+    'axes.labelweight': 'bold',
+    'axes.titlesize': 9,
+    'axes.titleweight': 'bold',
+    'xtick.labelsize': 8,
+    'ytick.labelsize': 8,
+    'lines.linewidth': 1,
+    'legend.fontsize': 8,
+    'figure.facecolor': '#fffff9',
+    'figure.titlesize': 8
+}
+
+_STYLE_APPLIED = False
+
+def pyplot():
+    """
+    matplotlib.pyplot, imported on first use (with the Agg backend off Windows)
+    """
+
+    import matplotlib
+    if not os.name == 'nt' and 'matplotlib.pyplot' not in sys.modules:
+        matplotlib.use('Agg')
+
+    import matplotlib.pyplot as plt
+    return plt
+
+def apply_style():
+    """
+    bmh plus the chart fonts, set once per process rather than on every chart
+    """
+
+    global _STYLE_APPLIED
+    if not _STYLE_APPLIED:
+        plt = pyplot()
+        plt.style.use('bmh')
+        plt.rcParams.update(CHART_STYLE)
+        _STYLE_APPLIED = True
+
+_PATH_LOCK = Lock()
+_LAST_TSTR = [0]
+
+def chart_path(prefix='pchart'):
+    """
+    A new chart file name under CHART_DIR, unique even for charts started in the same millisecond
+    """
+
+    with _PATH_LOCK:
+        tstr = max(int(round(time.time() * 1000)), _LAST_TSTR[0] + 1)
+        _LAST_TSTR[0] = tstr
+    return CHART_DIR + prefix + str(tstr) + '.png'
+
+def chart_job(historic_df, signals, title):
+    """
+    The arrays a worker needs to draw the Macdstoc chart
+    :param signals: macdstoc_strategy signals for historic_df
+    """
+
+    xup_idx = np.flatnonzero(signals['xup_positions'].values == 1.0)
+    xdown_idx = np.flatnonzero(signals['xdown_positions'].values == 1.0)
+
+    job = {'title': title, 'dates': historic_df.index.strftime('%Y-%m-%d').values,
+           'close': historic_df['close'].values, 'xup_idx': xup_idx, 'xdown_idx': xdown_idx,
+           'low': signals['low'].values[xup_idx], 'high': signals['high'].values[xdown_idx]}
+    for column in ['ema25', 'k_slow', 'd_slow', 'macd', 'emaSmooth', 'divergence', 'sk_slow', 'sd_slow']:
+        job[column] = np.ascontiguousarray(signals[column].values, dtype=np.float64)
+    return job
+
+class chartTemplate(object):
+    """
+    The 4 panel Macdstoc figure, built once and redrawn with new data
+    """
+
+    def __init__(self):
+
+        import matplotlib.ticker as ticker
+
+        apply_style()
+        plt = pyplot()
+
+        self.fig = plt.figure(figsize=(15, 20))
+        self.fig.patch.set_facecolor('white')     # Set the outer colour to white
+        self.title = self.fig.suptitle("", fontsize=12, color='grey')
+        self.dates = np.array([""])
+
+        formatter = ticker.FuncFormatter(self.format_date)
+
+        ax1 = self.ax1 = plt.subplot2grid((10, 1), (0, 0), rowspan=4, ylabel='Price in $', fig=self.fig)
+        self.close_line, = ax1.plot([], [], color='r', lw=1.)
+        self.ema_line, = ax1.plot([], [], lw=1.)
+        self.xup_marks, = ax1.plot([], [], '^', markersize=7, color='m')
+        self.xdown_marks, = ax1.plot([], [], 'v', markersize=7, color='r')
+        ax1.xaxis.set_major_formatter(formatter)
+        ax1.grid(True)
+
+        # Slow Stoc
+        ax2 = self.ax2 = plt.subplot2grid((10, 1), (4, 0), rowspan=2, ylabel='Slow Stoc', fig=self.fig)
+        ax2.axes.xaxis.set_visible(False)
+        self.k_line, = ax2.plot([], [], lw=1.)
+        self.d_line, = ax2.plot([], [], lw=1.)
+        ax2.axhspan(90, 100, facecolor='red', alpha=.2)
+        ax2.axhspan(0, 10, facecolor='red', alpha=.2)
+        ax2.axhline(y = 90, color = "brown", lw = 0.5)
+        ax2.axhline(y = 10, color = "red", lw = 0.5)
+
+        # MACD, the divergence fills are the only artists rebuilt per chart
+        ax3 = self.ax3 = plt.subplot2grid((10, 1), (6, 0), rowspan=2, ylabel='MACD', fig=self.fig)
+        ax3.axes.xaxis.set_visible(False)
+        self.macd_line, = ax3.plot([], [], lw=1.)
+        self.smooth_line, = ax3.plot([], [], lw=1.)
+        self.divergence_line, = ax3.plot([], [], lw=0.1)
+        self.fills = []
+
+        # Macdstoc
+        ax4 = self.ax4 = plt.subplot2grid((10, 1), (8, 0), rowspan=2, ylabel='Macdstoc', fig=self.fig)
+        self.sk_line, = ax4.plot([], [], lw=1.)
+        self.sd_line, = ax4.plot([], [], lw=1.)
+        self.sk_xup_marks, = ax4.plot([], [], '^', markersize=7, color='m')
+        self.sk_xdown_marks, = ax4.plot([], [], 'v', markersize=7, color='r')
+        ax4.xaxis.set_major_formatter(formatter)
+
+    def format_date(self, x, pos=None):
+        thisind = np.clip(int(x+0.5), 0, len(self.dates)-1)
+        return self.dates[thisind]
+
+    def render(self, job, path):
+        """
+        Draw a chart_job and save it
+        :param path: file name or file object
+        :return: path
+        """
+
+        self.title.set_text(job['title'])
+        self.dates = job['dates']
+        df_idx = np.arange(len(job['close']))
+        xup_idx, xdown_idx = job['xup_idx'], job['xdown_idx']
+
+        self.close_line.set_data(df_idx, job['close'])
+        self.ema_line.set_data(df_idx, job['ema25'])
+        self.xup_marks.set_data(xup_idx, job['low'])
+        self.xdown_marks.set_data(xdown_idx, job['high'])
+
+        self.k_line.set_data(df_idx, job['k_slow'])
+        self.d_line.set_data(df_idx, job['d_slow'])
+
+        divergence = job['divergence']
+        self.macd_line.set_data(df_idx, job['macd'])
+        self.smooth_line.set_data(df_idx, job['emaSmooth'])
+        self.divergence_line.set_data(df_idx, divergence)
+        for fill in self.fills:
+            fill.remove()
+        with np.errstate(invalid='ignore'):
+            self.fills = [
+                self.ax3.fill_between(df_idx, divergence, 0, where=divergence >= 0,
+                                      facecolor='blue', alpha=.8, interpolate=True),
+                self.ax3.fill_between(df_idx, divergence, 0, where=divergence < 0,
+                                      facecolor='red', alpha=.8, interpolate=True)
+            ]
+
+        self.sk_line.set_data(df_idx, job['sk_slow'])
+        self.sd_line.set_data(df_idx, job['sd_slow'])
+        self.sk_xup_marks.set_data(xup_idx, job['sk_slow'][xup_idx])
+        self.sk_xdown_marks.set_data(xdown_idx, job['sk_slow'][xdown_idx])
+
+        for ax in (self.ax1, self.ax2, self.ax3, self.ax4):
+            ax.relim()
+            ax.autoscale_view()
+
+        self.fig.tight_layout(w_pad=3, h_pad=3)
+        self.fig.savefig(path, bbox_inches='tight')
+        return path
+
+## the worker process's template
+_TEMPLATE = None
+
+def _init_worker():
+    global _TEMPLATE
+    _TEMPLATE = chartTemplate()
+
+def _render(job, path):
+    if _TEMPLATE is None:
+        _init_worker()
+    _TEMPLATE.render(job, path)
+    return path
+
+def _ready():
+    return os.getpid()
+
+class renderService(object):
+    """
+    Pool of chart rendering processes
+    """
+
+    def __init__(self, workers=RENDER_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            return self._executor
+
+    def start(self):
+        """
+        Start the worker processes now rather than on the first chart
+        """
+
+        executor = self._get_executor()
+        pids = set(future.result() for future in [executor.submit(_ready) for _ in range(self.workers)])
+        print("Chart render workers started: %s" % sorted(pids))
+        return self
+
+    def submit(self, historic_df, signals, title, path=None):
+        """
+        Queue a Macdstoc chart
+        :param path: where to save it, a new chart_path() by default
+        :return: Future of the chart path
+        """
+
+        return self._get_executor().submit(_render, chart_job(historic_df, signals, title), path or chart_path())
+
+    def shutdown(self, wait=True):
+        """
+        Finish the queued charts and stop the workers
+        """
+
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+_SERVICE = None
+_SERVICE_LOCK = Lock()
+
+def get_service():
+    """
+    The process wide render service
+    """
+
+    global _SERVICE
+    with _SERVICE_LOCK:
+        if _SERVICE is None:
+            _SERVICE = renderService()
+        return _SERVICE
+
+def shutdown():
+    if _SERVICE is not None:
+        _SERVICE.shutdown()
+
+atexit.register(shutdown)
@@ -132,6 +132,115 @@ def MACD(prices, nslow=26, nfast=12, smoothing=9):
     result = pd.DataFrame({'macd': macd, 'emaSmooth': emasmooth, 'divergence': macd-emasmooth})
     return result
 
+def _as_panel(data, like=None):
+    """ wrap a 2-D array (time x symbols) as a DataFrame, on the index / columns of like if given,
+    DataFrames pass through untouched """
+
+    if isinstance(data, pd.DataFrame):
+        return data
+    if like is not None:
+        return pd.DataFrame(np.asarray(data, dtype=np.float64), index=like.index, columns=like.columns)
+    return pd.DataFrame(np.asarray(data, dtype=np.float64))
+
+def calendar_groups(bars_dict):
+    """ split a dict of symbol => bars DataFrame into dicts of symbols with the same bar times
+    (eg. HSI apart from the FX pairs), each one can go into to_panel
+    """
+
+    groups = []
+    for symbol, bars in bars_dict.items():
+        for group in groups:
+            if next(iter(group.values())).index.equals(bars.index):
+                group[symbol] = bars
+                break
+        else:
+            groups.append({symbol: bars})
+    return groups
+
+def to_panel(bars_dict, column="close"):
+    """ build a wide panel (time x symbols) of one column out of a dict of symbol => bars DataFrame
+    The symbols must share their bar times: an outer join would put NaN rows into the ewm / rolling
+    windows and change every value after them, use calendar_groups for mixed sessions
+    """
+
+    indexes = [bars.index for bars in bars_dict.values()]
+    if any(not index.equals(indexes[0]) for index in indexes[1:]):
+        raise ValueError("bars of %s have different bar times, split them with calendar_groups"
+                         % ", ".join(str(symbol) for symbol in bars_dict))
+
+    return pd.DataFrame(dict([(symbol, bars[column]) for symbol, bars in bars_dict.items()]))
+
+def MACD_PANEL(prices, nslow=26, nfast=12, smoothing=9):
+    """ MACD for every column of a (time x symbols) panel in one pass
+    Returns a dict of panels keyed as the MACD columns: macd, emaSmooth, divergence
+    """
+
+    prices = _as_panel(prices)
+    emaslow = prices.ewm(min_periods=1, ignore_na=False, span=nslow, adjust=True).mean()
+    emafast = prices.ewm(min_periods=1, ignore_na=False, span=nfast, adjust=True).mean()
+
+    macd = emafast - emaslow
+    emasmooth = macd.ewm(min_periods=1, ignore_na=False, span=smoothing, adjust=True).mean()
+
+    return {'macd': macd, 'emaSmooth': emasmooth, 'divergence': macd - emasmooth}
+
+def FASTSTOC_PANEL(low, high, close, period=16, smoothing=8):
+    """ fast stochastic for every column of (time x symbols) low / high / close panels
+    Returns the k_fast and d_fast panels
+    """
+
+    low = _as_panel(low)
+    high = _as_panel(high)
+    close = _as_panel(close)
+
+    low_min = low.rolling(center=False, min_periods=1, window=period).min()
+    high_max = high.rolling(center=False, min_periods=1, window=period).max()
+    k_fast = 100 * (close - low_min) / (high_max - low_min)
+
+    d_fast = k_fast.rolling(window=smoothing, min_periods=1, center=False).mean()
+    d_fast = np.round(d_fast, 6)
+    return k_fast, d_fast
+
+def SLOWSTOC_PANEL(low, high, close, period=16, smoothing=8):
+    """ slow stochastic for every column of (time x symbols) low / high / close panels
+    Returns the k_slow and d_slow panels
+    """
+
+    # D in fast stochastic is K in slow stochastic
+    k_fast, k_slow = FASTSTOC_PANEL(low, high, close, period, smoothing)
+    d_slow = k_slow.rolling(window=smoothing, min_periods=1, center=False).mean()
+    return k_slow, d_slow
+
+def MACDSTOC_PANEL(low, high, close, stoc_window=16, stoc_smoothing=6, macdstoc_window=11, macdstoc_smoothing=3):
+    """ MACD, slow stochastic and Macdstoc (stochastic of the MACD) for a whole universe at once
+    Returns a dict of (time x symbols) panels keyed by the gen_signal column names
+    The panels must share their bar times (to_panel), arrays take the index / columns of close
+    """
+
+    close = _as_panel(close)
+    low = _as_panel(low, close)
+    high = _as_panel(high, close)
+    result = MACD_PANEL(close)
+
+    result['k_slow'], result['d_slow'] = SLOWSTOC_PANEL(low, high, close, stoc_window, stoc_smoothing)
+
+    macd = result['macd']
+    result['sk_slow'], result['sd_slow'] = FASTSTOC_PANEL(macd, macd, macd, macdstoc_window, macdstoc_smoothing)
+    return result
+
+def MACDSTOC_GROUPS(bars_dict, stoc_window=16, stoc_smoothing=6, macdstoc_window=11, macdstoc_smoothing=3):
+    """ MACDSTOC_PANEL over a universe with mixed sessions, one pass per calendar group
+    Returns a dict of symbol => DataFrame of the gen_signal columns
+    """
+
+    frames = {}
+    for group in calendar_groups(bars_dict):
+        result = MACDSTOC_PANEL(to_panel(group, 'low'), to_panel(group, 'high'), to_panel(group, 'close'),
+                                stoc_window, stoc_smoothing, macdstoc_window, macdstoc_smoothing)
+        for symbol in group:
+            frames[symbol] = pd.DataFrame(dict([(name, panel[symbol]) for name, panel in result.items()]))
+    return frames
+
 def main():
 
     print("main....")
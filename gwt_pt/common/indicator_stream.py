@@ -0,0 +1,433 @@
+#! /usr/bin/python
+
+"""
+Incremental (streaming) versions of the indicators in common/indicator.py
+
+Each class keeps just enough state to produce the next value in O(1) per bar,
+with the same adjust / min_periods semantics as the pandas based functions:
+
+    ema_stream       <=> EMA
+    sma_stream       <=> SMA
+    macd_stream      <=> MACD
+    rsi_stream       <=> RSI
+    bb_stream        <=> BB
+    faststoc_stream  <=> FASTSTOC
+    slowstoc_stream  <=> SLOWSTOC
+    macdstoc_stream  <=> the EMA / MACD / SLOWSTOC / Macdstoc set used by gen_signal
+
+Seed from a history DataFrame once, then call update() for every new bar:
+
+    stream = macdstoc_stream().seed(historic_df)
+    row = stream.update(open, high, low, close)
+
+update_bar(open, high, low, close) is there on every class, for feeding whole bars generically.
+"""
+
+import math
+from collections import deque
+
+NAN = float("nan")
+
+
+def _isnan(x):
+    return x is None or x != x
+
+
+class _ewm(object):
+    """
+    Exponentially weighted mean, same as Series.ewm(alpha=...).mean() with ignore_na=False
+    """
+
+    def __init__(self, alpha, adjust=True, min_periods=0):
+        self._decay = 1.0 - alpha
+        self._alpha = alpha
+        self._adjust = adjust
+        self._min_periods = max(min_periods, 1)
+
+        self._num = 0.0
+        self._den = 0.0
+        self._mean = NAN
+        self.nobs = 0
+
+    def update(self, x):
+
+        if _isnan(x):
+            ## decay the weights, keep the mean (pandas ignore_na=False)
+            if self.nobs and self._adjust:
+                self._num *= self._decay
+                self._den *= self._decay
+            elif self.nobs:
+                self._den *= self._decay
+        else:
+            x = float(x)
+            if self._adjust:
+                self._num = self._num * self._decay + x
+                self._den = self._den * self._decay + 1.0
+                self._mean = self._num / self._den
+            elif self.nobs == 0:
+                self._mean = x
+                self._den = 1.0
+            else:
+                ## adjust=False recursion, gaps widen the weight of the old mean
+                old_wt = self._den * self._decay
+                self._mean = (old_wt * self._mean + self._alpha * x) / (old_wt + self._alpha)
+                self._den = 1.0
+            self.nobs += 1
+
+        return self.value
+
+    @property
+    def value(self):
+        if self.nobs < self._min_periods:
+            return NAN
+        return self._mean
+
+
+class _rolling_window(object):
+    """
+    Fixed length window skipping NaN, the building block for rolling mean / std
+    """
+
+    def __init__(self, period, min_periods=1):
+        self._period = period
+        self._min_periods = max(min_periods, 1)
+        self._values = deque()
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self.nobs = 0
+
+    def update(self, x):
+
+        if len(self._values) == self._period:
+            old = self._values.popleft()
+            if not _isnan(old):
+                self._sum -= old
+                self._sumsq -= old * old
+                self.nobs -= 1
+
+        if _isnan(x):
+            self._values.append(NAN)
+        else:
+            x = float(x)
+            self._values.append(x)
+            self._sum += x
+            self._sumsq += x * x
+            self.nobs += 1
+
+        if self.nobs == 0:
+            ## reset drift from the running sums whenever the window is empty
+            self._sum = self._sumsq = 0.0
+
+    def mean(self):
+        if self.nobs < self._min_periods:
+            return NAN
+        return self._sum / self.nobs
+
+    def std(self):
+        if self.nobs < self._min_periods or self.nobs < 2:
+            return NAN
+        var = (self._sumsq - self._sum * self._sum / self.nobs) / (self.nobs - 1)
+        return math.sqrt(var) if var > 0 else 0.0
+
+
+class _rolling_extreme(object):
+    """
+    Rolling min or max over the last period bars using a monotonic deque (amortised O(1))
+    """
+
+    def __init__(self, period, is_max):
+        self._period = period
+        self._is_max = is_max
+        self._deque = deque()
+        self._count = 0
+
+    def update(self, x):
+
+        idx = self._count
+        self._count += 1
+
+        ## drop values which fell out of the window
+        while self._deque and self._deque[0][0] <= idx - self._period:
+            self._deque.popleft()
+
+        if not _isnan(x):
+            x = float(x)
+            if self._is_max:
+                while self._deque and self._deque[-1][1] <= x:
+                    self._deque.pop()
+            else:
+                while self._deque and self._deque[-1][1] >= x:
+                    self._deque.pop()
+            self._deque.append((idx, x))
+
+        if not self._deque:
+            return NAN
+        return self._deque[0][1]
+
+
+class sma_stream(object):
+    """
+    Streaming SMA: rolling mean with min_periods=1
+    """
+
+    def __init__(self, period=26):
+        self._window = _rolling_window(period, 1)
+        self.value = NAN
+
+    def update(self, price):
+        self._window.update(price)
+        self.value = self._window.mean()
+        return self.value
+
+    def update_bar(self, open, high, low, close):
+        return self.update(close)
+
+    def seed(self, df, column="close"):
+        for price in df[column].values:
+            self.update(price)
+        return self
+
+
+class ema_stream(object):
+    """
+    Streaming EMA: ewm(span=period, min_periods=period - 1), adjusted
+    """
+
+    def __init__(self, period=20):
+        self._ewm = _ewm(2.0 / (period + 1.0), True, period - 1)
+        self.value = NAN
+
+    def update(self, price):
+        self.value = self._ewm.update(price)
+        return self.value
+
+    def update_bar(self, open, high, low, close):
+        return self.update(close)
+
+    def seed(self, df, column="close"):
+        for price in df[column].values:
+            self.update(price)
+        return self
+
+
+class macd_stream(object):
+    """
+    Streaming MACD, returns (macd, emaSmooth, divergence) on each update
+    """
+
+    def __init__(self, nslow=26, nfast=12, smoothing=9):
+        self._slow = _ewm(2.0 / (nslow + 1.0), True, 1)
+        self._fast = _ewm(2.0 / (nfast + 1.0), True, 1)
+        self._smooth = _ewm(2.0 / (smoothing + 1.0), True, 1)
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, price):
+        macd = self._fast.update(price) - self._slow.update(price)
+        emasmooth = self._smooth.update(macd)
+        self.value = (macd, emasmooth, macd - emasmooth)
+        return self.value
+
+    def update_bar(self, open, high, low, close):
+        return self.update(close)
+
+    def seed(self, df, column="close"):
+        for price in df[column].values:
+            self.update(price)
+        return self
+
+
+class rsi_stream(object):
+    """
+    Streaming Wilder's RSI
+    """
+
+    def __init__(self, period=14):
+        self._up = _ewm(1.0 / period, False, 0)
+        self._down = _ewm(1.0 / period, False, 0)
+        self._last = NAN
+        self.value = NAN
+
+    def update(self, price):
+
+        ## like diff(), no delta into or out of a missing price
+        delta = NAN if _isnan(price) or _isnan(self._last) else float(price) - self._last
+        self._last = NAN if _isnan(price) else float(price)
+
+        if _isnan(delta):
+            up = down = NAN
+        else:
+            up = delta if delta > 0 else 0.0
+            down = delta if delta < 0 else 0.0
+
+        rup = self._up.update(up)
+        rdown = abs(self._down.update(down))
+
+        if _isnan(rup) or _isnan(rdown):
+            self.value = NAN
+        elif rdown == 0:
+            self.value = 100.0 if rup > 0 else NAN
+        else:
+            self.value = 100 - 100 / (1 + rup / rdown)
+        return self.value
+
+    def update_bar(self, open, high, low, close):
+        return self.update(close)
+
+    def seed(self, df, column="close"):
+        for price in df[column].values:
+            self.update(price)
+        return self
+
+
+class bb_stream(object):
+    """
+    Streaming Bollinger Bands, returns (BBANDUP, BBANDLO) on each update
+    """
+
+    def __init__(self, period=20):
+        self._window = _rolling_window(period, period - 1)
+        self.value = (NAN, NAN)
+
+    def update(self, price):
+        self._window.update(price)
+        sma = self._window.mean()
+        std = self._window.std()
+        self.value = (sma + (std * 2), sma - (std * 2))
+        return self.value
+
+    def update_bar(self, open, high, low, close):
+        return self.update(close)
+
+    def seed(self, df, column="close"):
+        for price in df[column].values:
+            self.update(price)
+        return self
+
+
+class faststoc_stream(object):
+    """
+    Streaming fast stochastic, returns (k_fast, d_fast) on each update
+    """
+
+    def __init__(self, period=16, smoothing=8):
+        self._low_min = _rolling_extreme(period, False)
+        self._high_max = _rolling_extreme(period, True)
+        self._d = _rolling_window(smoothing, 1)
+        self.value = (NAN, NAN)
+
+    def update(self, low, high, close):
+
+        low_min = self._low_min.update(low)
+        high_max = self._high_max.update(high)
+
+        rng = high_max - low_min
+        if _isnan(close) or _isnan(rng):
+            k_fast = NAN
+        elif rng == 0:
+            ## flat window, 0/0 in the pandas version
+            k_fast = NAN
+        else:
+            k_fast = 100 * (float(close) - low_min) / rng
+
+        self._d.update(k_fast)
+        d_fast = self._d.mean()
+        if not _isnan(d_fast):
+            d_fast = round(d_fast, 6)
+
+        self.value = (k_fast, d_fast)
+        return self.value
+
+    def update_bar(self, open, high, low, close):
+        return self.update(low, high, close)
+
+    def seed(self, df, column_low="low", column_high="high", column_close="close"):
+        for low, high, close in zip(df[column_low].values, df[column_high].values, df[column_close].values):
+            self.update(low, high, close)
+        return self
+
+
+class slowstoc_stream(object):
+    """
+    Streaming slow stochastic, returns (k_slow, d_slow) on each update
+    """
+
+    def __init__(self, period=16, smoothing=8):
+        self._fast = faststoc_stream(period, smoothing)
+        self._d = _rolling_window(smoothing, 1)
+        self.value = (NAN, NAN)
+
+    def update(self, low, high, close):
+
+        ## D in fast stochastic is K in slow stochastic
+        k_fast, k_slow = self._fast.update(low, high, close)
+        self._d.update(k_slow)
+        self.value = (k_slow, self._d.mean())
+        return self.value
+
+    def update_bar(self, open, high, low, close):
+        return self.update(low, high, close)
+
+    def seed(self, df, column_low="low", column_high="high", column_close="close"):
+        for low, high, close in zip(df[column_low].values, df[column_high].values, df[column_close].values):
+            self.update(low, high, close)
+        return self
+
+
+class macdstoc_stream(object):
+    """
+    Streams the full indicator set used by the Macdstoc alert:
+    ema25, MACD, slow stochastic and the stochastic of the MACD (Macdstoc)
+
+    Each update returns a dict keyed by the same column names gen_signal uses
+    """
+
+    COLUMNS = ['ema25', 'macd', 'emaSmooth', 'divergence', 'k_slow', 'd_slow', 'sk_slow', 'sd_slow']
+
+    def __init__(self, stoc_window=16, stoc_smoothing=6, macdstoc_window=11, macdstoc_smoothing=3, ema_period=25):
+        self._ema = ema_stream(ema_period)
+        self._macd = macd_stream()
+        self._stoc = slowstoc_stream(stoc_window, stoc_smoothing)
+        self._macdstoc = faststoc_stream(macdstoc_window, macdstoc_smoothing)
+        self.value = dict([(column, NAN) for column in self.COLUMNS])
+
+    def update(self, open, high, low, close):
+
+        ema25 = self._ema.update(close)
+        macd, emasmooth, divergence = self._macd.update(close)
+        k_slow, d_slow = self._stoc.update(low, high, close)
+        sk_slow, sd_slow = self._macdstoc.update(macd, macd, macd)
+
+        self.value = {'ema25': ema25, 'macd': macd, 'emaSmooth': emasmooth, 'divergence': divergence,
+                      'k_slow': k_slow, 'd_slow': d_slow, 'sk_slow': sk_slow, 'sd_slow': sd_slow}
+        return self.value
+
+    def update_bar(self, open, high, low, close):
+        return self.update(open, high, low, close)
+
+    def seed(self, df):
+        for open, high, low, close in zip(df['open'].values, df['high'].values, df['low'].values, df['close'].values):
+            self.update(open, high, low, close)
+        return self
+
+
+def main():
+
+    import time
+    import numpy as np
+    import pandas as pd
+    from gwt_pt.common.indicator import EMA, MACD, SLOWSTOC
+
+    n = 5000
+    close = 100 + np.cumsum(np.random.randn(n))
+    df = pd.DataFrame({'open': close, 'high': close + 1, 'low': close - 1, 'close': close})
+
+    start_time = time.time()
+    stream = macdstoc_stream().seed(df)
+    print("Seeded %d bars in %.3fs" % (n, time.time() - start_time))
+
+    print("EMA    batch %.6f stream %.6f" % (EMA(df, 'close', 25).iloc[-1, 0], stream.value['ema25']))
+    print("MACD   batch %.6f stream %.6f" % (MACD(df['close']).iloc[-1]['macd'], stream.value['macd']))
+    print("SLOWD  batch %.6f stream %.6f" % (SLOWSTOC(df, 'low', 'high', 'close', 16, 6)[1].iloc[-1, 0], stream.value['d_slow']))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#! /usr/bin/python
+
+"""
+Shared, memoized indicator pipeline
+
+The alert, the charts and the strategies all build the same ema25 / MACD / slow stochastic /
+Macdstoc columns. A signalPipeline computes each indicator once per bar set and parameters,
+keeps it in a small LRU cache, and hands out the same frame to everyone:
+
+    signals = signal_pipeline.get_pipeline().frame(historic_df, "EUR/USD", "1 hour")
+
+A bar set is identified by (symbol, bar size, number of bars, first and last bar timestamp,
+a hash of the open / high / low / close columns), so a refetch which moved the forming bar, even
+just its high or low, or revised an earlier bar, is not served stale indicators. Hashing the
+columns is a pass over the bytes, far cheaper than the indicators it saves.
+
+frame() and signals() hand out a copy of the cached frame, callers are free to add or change columns.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from gwt_pt.common.indicator import EMA, FASTSTOC, SLOWSTOC, MACD
+
+EMA_WINDOW = 25
+STOC_WINDOW = 16
+STOC_SMOOTHING = 6
+MACDSTOC_WINDOW = 11
+MACDSTOC_SMOOTHING = 3
+
+MAX_ENTRIES = 256
+
+def bars_key(bars, symbol="", bar_size=""):
+    """
+    Identity of a bar set for the cache
+    :param bars: DataFrame of open, high, low, close with a datetime index
+    """
+
+    if len(bars) == 0:
+        return (symbol, bar_size, 0)
+    content = tuple(hash(np.ascontiguousarray(bars[column].values).tobytes())
+                    for column in ('open', 'high', 'low', 'close'))
+    return (symbol, bar_size, len(bars), bars.index[0], bars.index[-1]) + content
+
+def signal_positions(signal, out):
+    """
+    Rising edges of a 0 / 1 signal written into out: 1.0 on the bar it turns on, NaN on the first bar
+    (same as signal.diff() with the -1.0s set to 0.0)
+    :return: out
+    """
+
+    if len(signal) == 0:
+        return out
+    out[0] = np.nan
+    np.subtract(signal[1:], signal[:-1], out=out[1:])
+    np.maximum(out[1:], 0.0, out=out[1:])
+    return out
+
+def crossover_columns(signals, close, ema, window):
+    """
+    xup / xdown (close above / below the ema once the window has filled) and their
+    xup_pos / xdown_pos rising edges, computed into one block
+    :return: signals with the four columns added
+    """
+
+    block = np.zeros((len(signals), 4))
+    started = slice(window, None)
+    with np.errstate(invalid='ignore'):
+        block[started, 0] = close[started] > ema[started]
+        block[started, 2] = close[started] < ema[started]
+    signal_positions(block[:, 0], block[:, 1])
+    signal_positions(block[:, 2], block[:, 3])
+
+    return pd.concat([signals, pd.DataFrame(block, index=signals.index, copy=False,
+                                            columns=['xup', 'xup_pos', 'xdown', 'xdown_pos'])], axis=1)
+
+class signalPipeline(object):
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _memoize(self, key, compute):
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+
+        ## computed outside the lock, at worst two threads both compute the same thing
+        value = compute()
+
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = value
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    ## Each indicator is cached on its own, so strategies sharing e.g. the MACD reuse it
+    def ema(self, bars, window=EMA_WINDOW, key=None):
+        key = key or bars_key(bars)
+        return self._memoize(key + ('ema', window), lambda: EMA(bars, 'close', window))
+
+    def macd(self, bars, key=None):
+        key = key or bars_key(bars)
+        return self._memoize(key + ('macd',), lambda: MACD(bars['close']))
+
+    def slowstoc(self, bars, window=STOC_WINDOW, smoothing=STOC_SMOOTHING, key=None):
+        key = key or bars_key(bars)
+        return self._memoize(key + ('slowstoc', window, smoothing),
+                             lambda: SLOWSTOC(bars, 'low', 'high', 'close', window, smoothing, False))
+
+    def macdstoc(self, bars, window=MACDSTOC_WINDOW, smoothing=MACDSTOC_SMOOTHING, key=None):
+        """
+        Stochastic of the MACD, (sk_slow, sd_slow)
+        """
+
+        key = key or bars_key(bars)
+
+        def compute():
+            macd = self.macd(bars, key)
+            skslow, sdslow = FASTSTOC(macd, "macd", "macd", "macd", window, smoothing, False)
+            return skslow.rename(columns = {'k_fast':'sk_slow'}), sdslow.rename(columns = {'d_fast':'sd_slow'})
+
+        return self._memoize(key + ('macdstoc', window, smoothing), compute)
+
+    def frame(self, bars, symbol="", bar_size="", ema_window=EMA_WINDOW, stoc_window=STOC_WINDOW,
+              stoc_smoothing=STOC_SMOOTHING, macdstoc_window=MACDSTOC_WINDOW, macdstoc_smoothing=MACDSTOC_SMOOTHING):
+        """
+        open, high, low, close, ema25, macd, emaSmooth, divergence, k_slow, d_slow, sk_slow, sd_slow
+        (the ema25 column holds the EMA of ema_window)
+        :return: a copy of the cached DataFrame
+        """
+
+        key = bars_key(bars, symbol, bar_size)
+
+        def compute():
+            columns = [bars[['open', 'high', 'low', 'close']],
+                       self.ema(bars, ema_window, key).rename(columns={'EMA': 'ema25'}),
+                       self.macd(bars, key)]
+            columns.extend(self.slowstoc(bars, stoc_window, stoc_smoothing, key))
+            columns.extend(self.macdstoc(bars, macdstoc_window, macdstoc_smoothing, key))
+            return pd.concat(columns, axis=1)
+
+        return self._memoize(key + ('frame', ema_window, stoc_window, stoc_smoothing, macdstoc_window,
+                                    macdstoc_smoothing), compute).copy()
+
+    def signals(self, strategy, bars, symbol="", bar_size=""):
+        """
+        strategy.generate_signals(), memoized on the strategy's parameters
+        :param strategy: strategy object with a params() dict, eg. strat_macdstoc.macdstoc_strategy
+        :return: a copy of the cached DataFrame
+        """
+
+        key = bars_key(bars, symbol, bar_size) + (type(strategy).__name__, tuple(sorted(strategy.params().items())))
+        return self._memoize(key, strategy.generate_signals).copy()
+
+_PIPELINE = signalPipeline()
+
+def get_pipeline():
+    """
+    The process wide pipeline
+    """
+    return _PIPELINE
@@ -0,0 +1,213 @@
+#! /usr/bin/python
+
+"""
+Compact container of OHLCV bars
+
+The wrapper used to push one (date, open, high, low, close, volume) tuple per bar onto a queue,
+and every consumer then built a DataFrame from the tuples and parsed the date strings again.
+A barArray is filled straight from TestWrapper.historicalData instead: int64 epoch seconds plus
+one float64 (n, 5) block of open, high, low, close, volume, grown in place.
+
+    bars = app.get_IB_historical_data(...)
+    bars.close                  ## float64 view, no copy
+    df = bars.to_frame()        ## DataFrame over the same block
+
+It still behaves like the old list of tuples (len, iteration, indexing, truth value), so code
+which has not been moved over keeps working. Timestamps follow the bar store convention: the
+gateway's wall clock time stored as if it were UTC.
+"""
+
+import numpy as np
+
+from gwt_pt.datasource import bar_store
+
+COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+INITIAL_CAPACITY = 256
+
+class barArray(object):
+
+    __slots__ = ('daily', '_ts', '_values', '_size')
+
+    def __init__(self, capacity=INITIAL_CAPACITY, daily=False):
+        self.daily = daily
+        self._ts = np.empty(capacity, dtype=np.int64)
+        self._values = np.empty((capacity, len(COLUMNS)), dtype=np.float64)
+        self._size = 0
+
+    @classmethod
+    def from_arrays(cls, ts, values, daily=False):
+        """
+        Wrap existing arrays, no copy if they already have the right dtype
+        :param ts: epoch seconds
+        :param values: (n, 5) open, high, low, close, volume
+        """
+
+        bars = cls(0, daily)
+        bars._ts = np.asarray(ts, dtype=np.int64)
+        bars._values = np.asarray(values, dtype=np.float64).reshape(len(bars._ts), len(COLUMNS))
+        bars._size = len(bars._ts)
+        return bars
+
+    @classmethod
+    def from_records(cls, records, daily=False):
+        """
+        From a bar_store structured array
+        """
+
+        values = np.empty((len(records), len(COLUMNS)), dtype=np.float64)
+        for idx, column in enumerate(COLUMNS):
+            values[:, idx] = records[column]
+        return cls.from_arrays(np.array(records['ts']), values, daily)
+
+    @classmethod
+    def from_tuples(cls, historic_data):
+        """
+        From the old list of (date, open, high, low, close, volume) tuples
+        """
+
+        if isinstance(historic_data, cls):
+            return historic_data
+
+        bars = cls(max(len(historic_data), 1))
+        for bardata in historic_data:
+            bars.append(*bardata)
+        return bars
+
+    def append(self, date, open, high, low, close, volume):
+        """
+        Add one bar, date as IB sends it ("20180406  09:15:00" or "20180406")
+        """
+
+        if self._size == len(self._ts):
+            self._grow()
+
+        idx = self._size
+        self._ts[idx] = bar_store.parse_ib_date(date)
+        self._values[idx] = (open, high, low, close, volume)
+        self._size = idx + 1
+
+        if len(date) == 8:
+            self.daily = True
+
+    def _grow(self):
+
+        capacity = max(len(self._ts) * 2, INITIAL_CAPACITY)
+
+        ts = np.empty(capacity, dtype=np.int64)
+        ts[:self._size] = self._ts[:self._size]
+        values = np.empty((capacity, len(COLUMNS)), dtype=np.float64)
+        values[:self._size] = self._values[:self._size]
+
+        self._ts = ts
+        self._values = values
+
+    def copy(self):
+        return barArray.from_arrays(self.ts.copy(), self.values.copy(), self.daily)
+
+    ## array views, valid until the next append
+    @property
+    def ts(self):
+        return self._ts[:self._size]
+
+    @property
+    def values(self):
+        return self._values[:self._size]
+
+    @property
+    def open(self):
+        return self._values[:self._size, 0]
+
+    @property
+    def high(self):
+        return self._values[:self._size, 1]
+
+    @property
+    def low(self):
+        return self._values[:self._size, 2]
+
+    @property
+    def close(self):
+        return self._values[:self._size, 3]
+
+    @property
+    def volume(self):
+        return self._values[:self._size, 4]
+
+    def dates(self):
+        """
+        Bar dates as datetime64
+        """
+        return self.ts.astype('datetime64[s]')
+
+    def select(self, mask):
+        """
+        Bars where mask (boolean array or index array / slice) is set, as a new barArray
+        """
+        return barArray.from_arrays(self.ts[mask], self.values[mask], self.daily)
+
+    def to_records(self):
+        """
+        As a bar_store structured array
+        """
+
+        records = np.empty(self._size, dtype=bar_store.BAR_DTYPE)
+        records['ts'] = self.ts
+        for idx, column in enumerate(COLUMNS):
+            records[column] = self.values[:, idx]
+        return records
+
+    def to_frame(self):
+        """
+        DataFrame indexed by datetime over the same float64 block (no copy of the prices, so
+        writing to its open / high / low / close / volume writes to the bars)
+        """
+
+        ## pandas is only needed by the callers that want a DataFrame
+        import pandas as pd
+
+        index = pd.DatetimeIndex(pd.to_datetime(self.ts, unit='s'), name='datetime')
+        return pd.DataFrame(self.values, index=index, columns=COLUMNS, copy=False)
+
+    ## list of tuples compatibility
+    def _tuple(self, idx):
+        open, high, low, close, volume = self._values[idx].tolist()
+        return (bar_store.format_ib_date(self._ts[idx], self.daily), open, high, low, close, volume)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for idx in range(self._size):
+            yield self._tuple(idx)
+
+    def __getitem__(self, idx):
+
+        if isinstance(idx, slice):
+            return self.select(idx)
+
+        if idx < 0:
+            idx = idx + self._size
+        if idx < 0 or idx >= self._size:
+            raise IndexError("bar index out of range")
+        return self._tuple(idx)
+
+    def __repr__(self):
+        if self._size == 0:
+            return "barArray(0 bars)"
+        return "barArray(%d bars, %s to %s)" % (self._size, self._tuple(0)[0], self._tuple(self._size - 1)[0])
+
+def to_frame(historic_data):
+    """
+    DataFrame indexed by datetime from a barArray or a list of (date, open, high, low, close, volume) tuples
+    """
+
+    if isinstance(historic_data, barArray):
+        return historic_data.to_frame()
+
+    import pandas as pd
+
+    historic_df = pd.DataFrame(historic_data, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
+    historic_df.set_index('datetime', inplace=True)
+    historic_df.index = pd.to_datetime(historic_df.index)
+    return historic_df
@@ -0,0 +1,94 @@
+#! /usr/bin/python
+
+"""
+Bar ingest
+
+The one process subscribing to IB for live bars, every completed bar is published to the bars
+stream of the message bus (stream_bus.BARS_STREAM) as
+
+    {'symbol': 'MHI', 'bar_size': '1 min', 'key': <bar_store key>, 'bar': [date, open, high, low, close, volume]}
+
+for the trade monitor, alerting, charting and persistence to consume, instead of each of them
+fetching the same data from IB.
+
+    python -m gwt_pt.datasource.bar_ingest            # publish MHI 1 min bars
+    python -m gwt_pt.datasource.bar_ingest persist    # write the published bars to the bar store
+"""
+
+import sys
+import time
+import datetime
+
+from gwt_pt.datasource import ibkr
+from gwt_pt.datasource import bar_store
+from gwt_pt.redis import stream_bus
+
+RUN_SECONDS = 8 * 3600
+PERSIST_GROUP = "bar-store"
+
+def bar_message(symbol, bar_size, key, bardata):
+    return {'symbol': symbol, 'bar_size': bar_size, 'key': key, 'bar': list(bardata)}
+
+def publish_bars(symbol, ibcontract, duration, period, priceType="MIDPOINT", bus=None, is_simulated=False):
+    """
+    Stream the bars of a contract onto the bus
+    :return: ibkr.barSubscription, close() it to stop
+    """
+
+    bus = bus or stream_bus.get_bus()
+
+    ## keyed by the resolved contract, as ibkr.get_hist_data files its bars
+    pool = ibkr.hist_pool(is_simulated)
+    with pool.session() as app:
+        ibcontract = app.resolve_ib_contract(ibcontract, pool.next_request_id())
+    key = bar_store.get_store().key(ibkr.contract_key(ibcontract, priceType), period)
+
+    def on_bar(bardata):
+        bus.publish(stream_bus.BARS_STREAM, bar_message(symbol, period, key, bardata))
+
+    return ibkr.stream_data(ibcontract, duration, period, priceType, [on_bar], is_simulated)
+
+def persist_bar(message):
+    """
+    Bars stream handler, writes the bar into the local bar store under its own timestamp
+    The group replays the stream from the start and retries failed bars, so an older bar can come
+    after newer ones, it must not truncate the cache like a fetch merge does
+    """
+
+    bar_store.get_store().upsert(message['key'], [tuple(message['bar'])])
+
+def ingest(run_seconds=RUN_SECONDS, is_simulated=False):
+
+    current_mth = datetime.datetime.today().strftime('%Y%m')
+    subscriptions = [publish_bars("MHI", ibkr.hkfe_contract(current_mth, "MHI"), "28800 S", "1 min", "TRADES",
+                                  is_simulated=is_simulated)]
+    try:
+        time.sleep(run_seconds)
+    finally:
+        for subscription in subscriptions:
+            subscription.close()
+
+def persist(run_seconds=RUN_SECONDS):
+
+    consumer = stream_bus.streamConsumer(stream_bus.get_bus(), stream_bus.BARS_STREAM, PERSIST_GROUP,
+                                         stream_bus.consumer_name(), persist_bar, start="0")
+    consumer.start()
+    try:
+        time.sleep(run_seconds)
+    finally:
+        consumer.stop()
+        print(consumer)
+
+def main(args):
+
+    start_time = time.time()
+
+    if (len(args) > 1 and args[1] == "persist"):
+        persist()
+    else:
+        ingest()
+
+    print("Time elapsed: " + "%.3f" % (time.time() - start_time) + "s")
+
+if __name__ == "__main__":
+    main(sys.argv)
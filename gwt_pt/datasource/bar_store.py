@@ -0,0 +1,248 @@
+#! /usr/bin/python
+
+"""
+Local on-disk store of historical bars, so the fetchers only have to ask IB for the gap
+since the last cached bar
+
+Bars are kept one file per (contract, bar size, price type) as a NumPy structured array
+(epoch seconds + float64 OHLCV) and opened memory-mapped. Timestamps are the wall clock
+times IB sends back (the gateway's time zone), stored as if they were UTC, so the store
+assumes this process runs in the same time zone as the gateway.
+"""
+
+import os
+import re
+import math
+import calendar
+import datetime
+from threading import Lock
+
+import numpy as np
+
+from gwt_pt.util import config_loader
+
+BAR_DTYPE = np.dtype([('ts', 'i8'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'), ('close', 'f8'), ('volume', 'f8')])
+
+## bars older than this many are dropped from the files
+MAX_BARS = 500000
+
+## re-fetch this many bars before the last cached one, the last bar of a fetch may still be forming
+GAP_PADDING_BARS = 2
+
+BAR_SECONDS = {
+    "1 secs": 1, "5 secs": 5, "10 secs": 10, "15 secs": 15, "30 secs": 30,
+    "1 min": 60, "2 mins": 120, "3 mins": 180, "5 mins": 300, "10 mins": 600,
+    "15 mins": 900, "20 mins": 1200, "30 mins": 1800,
+    "1 hour": 3600, "2 hours": 7200, "3 hours": 10800, "4 hours": 14400, "8 hours": 28800,
+    "1 day": 86400, "1 week": 7 * 86400, "1 month": 31 * 86400
+}
+
+## calendar days covered by one unit of an IB duration string, D and W are trading days / weeks
+DURATION_DAYS = {"D": 7.0 / 5.0, "W": 7.0, "M": 31.0, "Y": 366.0}
+
+def is_daily(bar_size):
+    return bar_size in ("1 day", "1 week", "1 month")
+
+## epoch seconds at midnight, by "YYYYMMDD"
+_DAY_CACHE = {}
+
+def parse_ib_date(date_str):
+    """
+    IB formatDate=1 dates, "20180406  09:15:00" intraday or "20180406" for daily bars
+    Called once per bar, so it slices the string instead of going through strptime
+    :return: epoch seconds
+    """
+
+    day = date_str[:8]
+    midnight = _DAY_CACHE.get(day)
+    if midnight is None:
+        midnight = _DAY_CACHE[day] = calendar.timegm((int(day[:4]), int(day[4:6]), int(day[6:8]), 0, 0, 0))
+
+    time_str = date_str[8:].strip()
+    if not time_str:
+        return midnight
+    return midnight + int(time_str[:2]) * 3600 + int(time_str[3:5]) * 60 + int(time_str[6:8])
+
+def format_ib_date(ts, daily=False):
+
+    dt = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=int(ts))
+    if daily:
+        return dt.strftime("%Y%m%d")
+    return dt.strftime("%Y%m%d  %H:%M:%S")
+
+def to_records(historic_data):
+    """
+    List of (date, open, high, low, close, volume) tuples (or a bar_array.barArray) as a structured array
+    """
+
+    if hasattr(historic_data, 'to_records'):
+        return historic_data.to_records()
+
+    records = np.empty(len(historic_data), dtype=BAR_DTYPE)
+    for idx, (date, open, high, low, close, volume) in enumerate(historic_data):
+        records[idx] = (parse_ib_date(date), open, high, low, close, volume)
+    return records
+
+def to_tuples(records, bar_size):
+    """
+    Structured array back to the list of tuples the fetchers return
+    """
+
+    daily = is_daily(bar_size)
+    return [(format_ib_date(rec['ts'], daily), float(rec['open']), float(rec['high']), float(rec['low']),
+             float(rec['close']), rec['volume'].item()) for rec in records]
+
+def duration_seconds(duration):
+    """
+    Approximate calendar span of an IB duration string such as "16 D" or "3 M"
+    """
+
+    count, unit = duration.split()
+    if unit == "S":
+        return int(count)
+    return int(int(count) * DURATION_DAYS[unit] * 86400)
+
+def gap_duration(last_ts, bar_size, now=None):
+    """
+    IB duration string which covers everything since last_ts, plus a couple of bars
+    """
+
+    if now is None:
+        now = calendar.timegm(datetime.datetime.now().timetuple())
+
+    seconds = int(now - last_ts) + GAP_PADDING_BARS * BAR_SECONDS.get(bar_size, 86400)
+
+    ## IB only takes durations in seconds up to a day
+    if seconds <= 86400 and not is_daily(bar_size):
+        return "%d S" % max(seconds, 60)
+    return "%d D" % (int(math.ceil(seconds / 86400.0)) + 1)
+
+def fetch_duration(records, duration, bar_size):
+    """
+    What to ask IB for: just the gap since the last cached bar, or the full duration if the cache
+    is empty or older than the duration asked for
+    """
+
+    if len(records) == 0:
+        return duration
+
+    gap = gap_duration(records['ts'][-1], bar_size)
+    if duration_seconds(gap) >= duration_seconds(duration):
+        return duration
+    return gap
+
+class barStore(object):
+    """
+    Directory of bar files, one per (contract, bar size, price type)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def key(self, contract_key, bar_size):
+        """
+        :param contract_key: tuple from ibkr.contract_key (includes the price type)
+        """
+        return "_".join([str(part) for part in contract_key if part] + [bar_size])
+
+    def _file(self, key):
+        return os.path.join(self.path, re.sub(r'[^A-Za-z0-9.]+', '_', key) + ".npy")
+
+    def load(self, key):
+        """
+        :return: memory-mapped structured array of bars, empty if nothing is cached
+        """
+
+        filename = self._file(key)
+        if not os.path.exists(filename):
+            return np.empty(0, dtype=BAR_DTYPE)
+        return np.load(filename, mmap_mode='r')
+
+    def save(self, key, records):
+
+        filename = self._file(key)
+        tmpname = filename + ".tmp.npy"
+        np.save(tmpname, np.ascontiguousarray(records[-MAX_BARS:]))
+        os.replace(tmpname, filename)
+
+    def merge(self, key, historic_data):
+        """
+        Merge freshly fetched bars into the cache, overwriting cached bars from the first new one on
+        :param historic_data: list of (date, open, high, low, close, volume) tuples
+        :return: all cached bars after the merge
+        """
+
+        new_records = to_records(historic_data)
+
+        with self._lock:
+            cached = self.load(key)
+
+            if len(new_records) == 0:
+                return np.array(cached)
+
+            keep = np.array(cached[cached['ts'] < new_records['ts'][0]])
+            del cached
+
+            merged = np.concatenate([keep, new_records])
+            self.save(key, merged)
+            return merged
+
+    def upsert(self, key, historic_data):
+        """
+        Write bars into the cache by time, replacing cached bars with the same timestamp and keeping
+        all the others, for bars which arrive one at a time and maybe out of order (replayed or retried)
+        :param historic_data: list of (date, open, high, low, close, volume) tuples
+        :return: all cached bars after the write
+        """
+
+        new_records = to_records(historic_data)
+
+        with self._lock:
+            cached = self.load(key)
+
+            if len(new_records) == 0:
+                return np.array(cached)
+
+            if len(cached) == 0 or new_records['ts'].min() > cached['ts'][-1]:
+                merged = np.concatenate([np.array(cached), np.sort(new_records, order='ts')])
+            else:
+                ## the last of the bars with the same timestamp wins, new ones after the cached
+                combined = np.concatenate([np.array(cached), new_records])
+                del cached
+                _, last = np.unique(combined['ts'][::-1], return_index=True)
+                merged = combined[len(combined) - 1 - last]
+
+            self.save(key, merged)
+            return merged
+
+    def window(self, records, duration):
+        """
+        The bars covering duration up to the last cached bar
+        """
+
+        if len(records) == 0:
+            return records
+
+        start = records['ts'][-1] - duration_seconds(duration)
+        return records[records['ts'] >= start]
+
+_STORE = None
+_STORE_LOCK = Lock()
+
+def get_store():
+    """
+    The process wide bar store, location from [bar-store] path in config.properties
+    """
+
+    global _STORE
+
+    with _STORE_LOCK:
+        if _STORE is None:
+            config = config_loader.load()
+            default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'bars')
+            _STORE = barStore(config.get("bar-store", "path", fallback=default_path))
+        return _STORE
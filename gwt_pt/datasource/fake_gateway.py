@@ -0,0 +1,845 @@
+#! /usr/bin/python
+
+"""
+Offline IB gateway simulator
+
+Speaks enough of the TWS socket protocol (handshake, length prefixed NUL separated fields,
+server version 124) for the ibapi EClient used by ibkr, order and position to run against it
+with no IB Gateway and no network:
+
+- contract details for any contract, with a stable conId
+- historical bars from a bar_store directory (the .npy files the bar cache writes), or a
+  deterministic random walk when there is no file, plus keepUpToDate bar updates
+- streaming last price / size ticks
+- positions, account values and portfolio updates
+- orders: open orders, order status, fills with execution details and commission reports
+- configurable response latency / jitter, historical data pacing violations (error 162)
+  and client id clashes (error 326)
+
+    gateway = fakeGateway(latency=0.05, pacing=(60, 600)).start()
+    ib_session.use_gateway("127.0.0.1", gateway.port)
+    historic_data = ibkr.get_hkfe_data("201810", "MHI", "1 D", "5 mins")
+    gateway.stop()
+
+or as a stand-alone process for the other scripts on the box (with [ib-gateway] ip pointed at it):
+
+    python -m gwt_pt.datasource.fake_gateway --port 4002 --latency 0.05 --bars /app/gwtPT/bars
+"""
+
+import sys
+import time
+import heapq
+import queue
+import random
+import socket
+import struct
+import zlib
+import argparse
+import datetime
+import calendar
+from collections import deque
+from threading import Thread, Lock, Condition
+
+import numpy as np
+
+from ibapi.message import IN, OUT
+from ibapi.server_versions import MIN_SERVER_VER_SYNT_REALTIME_BARS
+from ibapi.contract import Contract as IBcontract
+
+from gwt_pt.datasource import bar_store
+## same key as the bar cache, so the bar store files line up
+from gwt_pt.datasource.ibkr import contract_key
+
+## oldest version the keepUpToDate historical data requests work with
+SERVER_VERSION = MIN_SERVER_VER_SYNT_REALTIME_BARS
+
+ACCOUNT = "DU0000000"
+
+## synthetic history is capped like the bar store files
+MAX_SYNTHETIC_BARS = bar_store.MAX_BARS
+
+## starting price of the random walks, by security type
+BASE_PRICES = {"FUT": 28000.0, "CASH": 1.15, "CMDTY": 1200.0, "STK": 100.0}
+
+TICK_INTERVAL = 0.25
+
+## tick types sent for reqMktData
+TICK_LAST = 4
+TICK_LAST_SIZE = 5
+
+PACING_VIOLATION = (162, "Historical Market Data Service error message:Historical data request pacing violation")
+CLIENT_ID_IN_USE = (326, "Unable to connect as the client id is already in use. Retry with a unique client id.")
+
+def _field(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return str(int(value))
+    return str(value)
+
+def make_message(*fields):
+    """
+    One length prefixed message of NUL terminated fields, as the gateway sends them
+    """
+
+    payload = "".join(_field(value) + "\0" for value in fields).encode()
+    return struct.pack("!I", len(payload)) + payload
+
+def read_messages(buffer):
+    """
+    Split complete messages off the front of buffer
+    :return: (list of field lists, rest of the buffer)
+    """
+
+    messages = []
+    while len(buffer) >= 4:
+        size = struct.unpack("!I", buffer[:4])[0]
+        if len(buffer) < 4 + size:
+            break
+        payload = buffer[4:4 + size]
+        buffer = buffer[4 + size:]
+        messages.append([field.decode(errors='backslashreplace') for field in payload.split(b"\0")[:-1]])
+    return messages, buffer
+
+def _read_contract(fields, idx):
+    """
+    conId, symbol, secType, expiry, strike, right, multiplier, exchange, primaryExchange, currency,
+    localSymbol, tradingClass as sent by reqContractDetails, reqHistoricalData, reqMktData and placeOrder
+    :return: (contract, index of the next field)
+    """
+
+    contract = IBcontract()
+    contract.conId = int(fields[idx] or 0)
+    contract.symbol = fields[idx + 1]
+    contract.secType = fields[idx + 2]
+    contract.lastTradeDateOrContractMonth = fields[idx + 3]
+    contract.strike = float(fields[idx + 4] or 0.0)
+    contract.right = fields[idx + 5]
+    contract.multiplier = fields[idx + 6]
+    contract.exchange = fields[idx + 7]
+    contract.primaryExchange = fields[idx + 8]
+    contract.currency = fields[idx + 9]
+    contract.localSymbol = fields[idx + 10]
+    contract.tradingClass = fields[idx + 11]
+    return contract, idx + 12
+
+def _now():
+    ## gateway wall clock, stored as UTC like the bar store timestamps
+    return calendar.timegm(datetime.datetime.now().timetuple())
+
+def _parse_end(end_date_time):
+    """
+    reqHistoricalData endDateTime, "20181018 09:15:00 HKT" or "" for now
+    """
+
+    if not end_date_time.strip():
+        return _now()
+    return bar_store.parse_ib_date(end_date_time[:8] + " " + end_date_time[9:17])
+
+class fakeConnection(object):
+    """
+    One client socket: a reader thread handling requests, and a writer thread sending the
+    responses once their latency is up, so slow responses do not hold back later ones
+    """
+
+    def __init__(self, gateway, sock):
+        self.gateway = gateway
+        self.sock = sock
+        self.client_id = None
+        self.connected = True
+
+        self._outbox = []
+        self._seq = 0
+        self._cond = Condition(Lock())
+
+        self._reader = Thread(target=self._read_loop, daemon=True)
+        self._writer = Thread(target=self._write_loop, daemon=True)
+
+    def start(self):
+        self._reader.start()
+        self._writer.start()
+        return self
+
+    def send(self, *fields, delay=None):
+        """
+        Queue a message, delivered after the gateway latency (or delay seconds)
+        """
+
+        if delay is None:
+            delay = self.gateway.response_delay()
+
+        with self._cond:
+            self._seq = self._seq + 1
+            heapq.heappush(self._outbox, (time.time() + delay, self._seq, make_message(*fields)))
+            self._cond.notify()
+
+    def error(self, reqId, code, message, delay=None):
+        self.send(IN.ERR_MSG, 2, reqId, code, message, delay=delay)
+
+    def close(self):
+
+        with self._cond:
+            if not self.connected:
+                return
+            self.connected = False
+            self._cond.notify()
+
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.gateway._disconnected(self)
+
+    def _write_loop(self):
+
+        while True:
+            with self._cond:
+                while self.connected and (not self._outbox or self._outbox[0][0] > time.time()):
+                    self._cond.wait(None if not self._outbox else max(self._outbox[0][0] - time.time(), 0.0))
+                if not self.connected:
+                    return
+                due, seq, data = heapq.heappop(self._outbox)
+
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.close()
+                return
+
+    def _recv(self, buffer, size):
+
+        while len(buffer) < size:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise EOFError()
+            buffer = buffer + chunk
+        return buffer
+
+    def _read_loop(self):
+
+        try:
+            ## "API\0" then the length prefixed "v100..157" version range
+            buffer = self._recv(b"", 4)
+            if buffer[:4] != b"API\0":
+                raise EOFError()
+            buffer = buffer[4:]
+
+            ## the version range is a bare string, not a NUL terminated field
+            buffer = self._recv(buffer, 4)
+            size = 4 + struct.unpack("!I", buffer[:4])[0]
+            buffer = self._recv(buffer, size)[size:]
+            messages, buffer = read_messages(buffer)
+
+            self.send(SERVER_VERSION, datetime.datetime.now().strftime("%Y%m%d %H:%M:%S HKT"), delay=0.0)
+
+            while self.connected:
+                for fields in messages:
+                    self.gateway.handle(self, fields)
+                messages = []
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    break
+                messages, buffer = read_messages(buffer + chunk)
+
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            print("Fake gateway dropped client %s: [%s]" % (self.client_id, e))
+
+        self.close()
+
+class fakeGateway(object):
+    """
+    Local stand-in for IB Gateway / TWS
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, pacing=None, bars=None,
+                 account=ACCOUNT, positions=None, account_values=None, auto_fill=True, commission=2.0,
+                 tick_interval=TICK_INTERVAL, seed=0):
+        """
+        :param port: 0 picks a free port, see .port once started
+        :param latency: seconds before each response goes out, plus up to jitter more
+        :param pacing: (max requests, seconds), historical data requests beyond it fail with error 162
+        :param bars: bar_store.barStore or the path of one to serve history from, random walks otherwise
+        :param positions: list of (contract, position, average cost)
+        :param account_values: dict of key to (value, currency), eg. {'NetLiquidation': ('100000', 'HKD')}
+        :param auto_fill: fill orders straight away (market at the last price, limits at the limit),
+                          otherwise they rest until cancelled
+        :param commission: per fill, reported in the commission reports
+        """
+
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.pacing = pacing
+        self.account = account
+        self.auto_fill = auto_fill
+        self.commission = commission
+        self.tick_interval = tick_interval
+
+        if isinstance(bars, str):
+            bars = bar_store.barStore(bars)
+        self.store = bars
+
+        self.account_values = account_values or {
+            'NetLiquidation': ('1000000', 'HKD'), 'TotalCashValue': ('1000000', 'HKD'),
+            'AvailableFunds': ('1000000', 'HKD'), 'BuyingPower': ('4000000', 'HKD')
+        }
+
+        self._lock = Lock()
+        self._random = random.Random(seed)
+        self._seed = seed
+        self._socket = None
+        self._running = False
+        self._connections = []
+
+        self._next_order_id = 1
+        self._next_perm_id = 1000000
+        self._next_exec_id = 1
+        self._orders = {}
+        self._executions = []
+        self._positions = {}
+        self._last_price = {}
+        self._hist_requests = deque()
+
+        ## streaming subscriptions, (connection, reqId) -> dict
+        self._subscriptions = {}
+
+        for contract, position, avg_cost in (positions or []):
+            self._positions[contract_key(contract)] = [contract, float(position), float(avg_cost)]
+
+        ## request counters, for load tests
+        self.requests = {}
+
+    def __repr__(self):
+        return "fakeGateway %s:%d (%d clients)" % (self.host, self.port, len(self._connections))
+
+    def start(self):
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen(64)
+        self.port = self._socket.getsockname()[1]
+        self._running = True
+
+        Thread(target=self._accept_loop, daemon=True).start()
+        Thread(target=self._tick_loop, daemon=True).start()
+
+        print("Fake IB gateway listening on %s:%d" % (self.host, self.port))
+        return self
+
+    def stop(self):
+
+        self._running = False
+        try:
+            self._socket.close()
+        except OSError:
+            pass
+
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            conn.close()
+
+    def _accept_loop(self):
+
+        while self._running:
+            try:
+                sock, address = self._socket.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = fakeConnection(self, sock)
+            with self._lock:
+                self._connections.append(conn)
+            conn.start()
+
+    def _disconnected(self, conn):
+
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+            for key in [key for key in self._subscriptions if key[0] is conn]:
+                del self._subscriptions[key]
+
+    def response_delay(self):
+        if self.jitter:
+            return self.latency + self._random.uniform(0.0, self.jitter)
+        return self.latency
+
+    ## request dispatch
+    def handle(self, conn, fields):
+
+        msg_id = int(fields[0])
+
+        with self._lock:
+            self.requests[msg_id] = self.requests.get(msg_id, 0) + 1
+
+        handler = self._handlers.get(msg_id)
+        if handler is None:
+            ## not simulated, ignore like an unsubscribed feed
+            return
+        handler(self, conn, fields)
+
+    def _start_api(self, conn, fields):
+
+        client_id = int(fields[2])
+        with self._lock:
+            in_use = any(other.client_id == client_id for other in self._connections if other is not conn)
+            if not in_use:
+                conn.client_id = client_id
+            next_order_id = self._next_order_id
+
+        if in_use:
+            conn.error(-1, CLIENT_ID_IN_USE[0], CLIENT_ID_IN_USE[1], delay=0.0)
+            time.sleep(0.05)
+            conn.close()
+            return
+
+        conn.send(IN.MANAGED_ACCTS, 1, self.account, delay=0.0)
+        conn.send(IN.NEXT_VALID_ID, 1, next_order_id, delay=0.0)
+
+    def _current_time(self, conn, fields):
+        conn.send(IN.CURRENT_TIME, 1, int(time.time()))
+
+    ## contracts
+    def con_id(self, contract):
+        if contract.conId:
+            return contract.conId
+        return zlib.crc32(repr(contract_key(contract)).encode()) % 900000000 + 100000
+
+    def _contract_details(self, conn, fields):
+
+        reqId = int(fields[2])
+        contract, idx = _read_contract(fields, 3)
+        delay = self.response_delay()
+
+        conn.send(IN.CONTRACT_DATA, 8, reqId, contract.symbol, contract.secType,
+                  contract.lastTradeDateOrContractMonth, contract.strike, contract.right, contract.exchange,
+                  contract.currency, contract.localSymbol or contract.symbol, contract.symbol,
+                  contract.tradingClass or contract.symbol, self.con_id(contract), 0.01, 1,
+                  contract.multiplier, "LMT,MKT,STP", contract.exchange, 1, 0,
+                  contract.symbol, contract.primaryExchange, contract.lastTradeDateOrContractMonth,
+                  "", "", "", "Asia/Hong_Kong", "", "", "", 1, 0, 0, "", "", delay=delay)
+        conn.send(IN.CONTRACT_DATA_END, 1, reqId, delay=delay)
+
+    ## historical data
+    def _paced(self):
+        """
+        Record a historical data request
+        :return: True if it breaks the pacing limit
+        """
+
+        if self.pacing is None:
+            return False
+
+        max_requests, period = self.pacing
+        now = time.time()
+        with self._lock:
+            while self._hist_requests and self._hist_requests[0] <= now - period:
+                self._hist_requests.popleft()
+            if len(self._hist_requests) >= max_requests:
+                return True
+            self._hist_requests.append(now)
+            return False
+
+    def _random_walk(self, contract, ts, bar_seconds):
+        """
+        OHLCV bars for the timestamps ts, the same for the same contract and bar size
+        """
+
+        key = contract_key(contract)
+        rng = np.random.default_rng([zlib.crc32(repr(key).encode()), bar_seconds, self._seed])
+        base = BASE_PRICES.get(contract.secType, 100.0)
+
+        ## steps keyed on the bar timestamp, so overlapping requests see the same bars
+        n = len(ts)
+        steps = rng.standard_normal(n) * base * 0.0005 * np.sqrt(bar_seconds / 60.0)
+        close = base * (1.0 + 0.05 * np.sin(ts / 86400.0 / 7.0)) + np.cumsum(steps)
+        open = np.empty(n)
+        open[:1] = close[:1]
+        open[1:] = close[:-1]
+        spread = np.abs(rng.standard_normal(n)) * base * 0.0003
+
+        records = np.empty(n, dtype=bar_store.BAR_DTYPE)
+        records['ts'] = ts
+        records['open'] = open
+        records['high'] = np.maximum(open, close) + spread
+        records['low'] = np.minimum(open, close) - spread
+        records['close'] = close
+        records['volume'] = rng.integers(1, 500, n)
+        return records
+
+    def history(self, contract, what_to_show, bar_size, duration, end):
+        """
+        Bars for a request, from the bar store if it has the contract, random otherwise
+        :return: bar_store structured array
+        """
+
+        start = end - bar_store.duration_seconds(duration)
+
+        if self.store is not None:
+            records = self.store.load(self.store.key(contract_key(contract, what_to_show), bar_size))
+            if len(records):
+                return np.array(records[(records['ts'] > start) & (records['ts'] <= end)])
+
+        bar_seconds = bar_store.BAR_SECONDS.get(bar_size, 86400)
+        last = end - end % bar_seconds
+        n = int(min(max((last - start) // bar_seconds, 1), MAX_SYNTHETIC_BARS))
+        ts = last - bar_seconds * np.arange(n - 1, -1, -1, dtype=np.int64)
+        return self._random_walk(contract, ts, bar_seconds)
+
+    def _historical_data(self, conn, fields):
+
+        reqId = int(fields[1])
+        contract, idx = _read_contract(fields, 2)
+        end_date_time, bar_size, duration = fields[idx + 1], fields[idx + 2], fields[idx + 3]
+        what_to_show = fields[idx + 5]
+        keep_up_to_date = fields[idx + 7] == "1" if len(fields) > idx + 7 else False
+
+        if self._paced():
+            conn.error(reqId, PACING_VIOLATION[0], PACING_VIOLATION[1])
+            return
+
+        records = self.history(contract, what_to_show, bar_size, duration, _parse_end(end_date_time))
+        daily = bar_store.is_daily(bar_size)
+
+        message = [IN.HISTORICAL_DATA, reqId]
+        if len(records):
+            message.extend([bar_store.format_ib_date(records['ts'][0], daily),
+                            bar_store.format_ib_date(records['ts'][-1], daily)])
+        else:
+            message.extend(["", ""])
+        message.append(len(records))
+        for rec in records.tolist():
+            ts, open, high, low, close, volume = rec
+            message.extend([bar_store.format_ib_date(ts, daily), open, high, low, close, int(volume),
+                            (high + low + close) / 3.0, 1])
+        conn.send(*message)
+
+        if len(records):
+            with self._lock:
+                self._last_price[contract_key(contract)] = float(records['close'][-1])
+
+        if keep_up_to_date and len(records):
+            last = records[-1]
+            with self._lock:
+                self._subscriptions[(conn, reqId)] = {
+                    'type': 'bars', 'contract': contract, 'daily': daily,
+                    'bar_seconds': bar_store.BAR_SECONDS.get(bar_size, 86400),
+                    'bar': [int(last['ts']), float(last['open']), float(last['high']), float(last['low']),
+                            float(last['close']), int(last['volume'])]
+                }
+
+    def _cancel_subscription(self, conn, fields):
+        with self._lock:
+            self._subscriptions.pop((conn, int(fields[2])), None)
+
+    ## streaming
+    def _mkt_data(self, conn, fields):
+
+        reqId = int(fields[2])
+        contract, idx = _read_contract(fields, 3)
+        with self._lock:
+            self._subscriptions[(conn, reqId)] = {'type': 'ticks', 'contract': contract}
+
+    def last_price(self, contract):
+        with self._lock:
+            return self._last_price.get(contract_key(contract), BASE_PRICES.get(contract.secType, 100.0))
+
+    def _tick_loop(self):
+
+        while self._running:
+            time.sleep(self.tick_interval)
+
+            with self._lock:
+                subscriptions = list(self._subscriptions.items())
+
+            for (conn, reqId), sub in subscriptions:
+                key = contract_key(sub['contract'])
+                with self._lock:
+                    price = self._last_price.get(key, BASE_PRICES.get(sub['contract'].secType, 100.0))
+                    price = price * (1.0 + self._random.gauss(0.0, 0.0002))
+                    self._last_price[key] = price
+                    size = self._random.randint(1, 20)
+
+                if sub['type'] == 'ticks':
+                    conn.send(IN.TICK_PRICE, 6, reqId, TICK_LAST, price, size, 0)
+                    conn.send(IN.TICK_SIZE, 6, reqId, TICK_LAST_SIZE, size)
+                    continue
+
+                ## keepUpToDate, the forming bar rolls over on the bar boundary
+                bar = sub['bar']
+                now = _now()
+                if now - now % sub['bar_seconds'] > bar[0]:
+                    bar[:] = [now - now % sub['bar_seconds'], bar[4], bar[4], bar[4], bar[4], 0]
+                bar[2] = max(bar[2], price)
+                bar[3] = min(bar[3], price)
+                bar[4] = price
+                bar[5] = bar[5] + size
+                conn.send(IN.HISTORICAL_DATA_UPDATE, reqId, -1, bar_store.format_ib_date(bar[0], sub['daily']),
+                          bar[1], bar[4], bar[2], bar[3], (bar[2] + bar[3] + bar[4]) / 3.0, bar[5])
+
+    ## orders
+    def _req_ids(self, conn, fields):
+        with self._lock:
+            next_order_id = self._next_order_id
+        conn.send(IN.NEXT_VALID_ID, 1, next_order_id)
+
+    def _send_open_order(self, conn, order, delay=None):
+
+        contract = order['contract']
+        conn.send(IN.OPEN_ORDER, 34, order['orderId'],
+                  self.con_id(contract), contract.symbol, contract.secType, contract.lastTradeDateOrContractMonth,
+                  contract.strike, contract.right, contract.multiplier, contract.exchange, contract.currency,
+                  contract.localSymbol, contract.tradingClass,
+                  order['action'], order['totalQuantity'], order['orderType'], order['lmtPrice'], order['auxPrice'],
+                  order['tif'], "", order['account'], "O", 0, "", order['clientId'], order['permId'], 0, 0, 0, "",
+                  "", "", "", "", "", "", "", "", "", "", 0, "", -1, 0, "", "", "", "", "", 0, 0, 0, 0, "", 0, 0, 0,
+                  "", 0, 0,
+                  ## volatility, trail, basis points, combo legs, scale, hedge and clearing fields
+                  "", 0, "", "", 0, 0, "", "", "", "", "", 0, 0, 0, "", "", "", "", 0, "", "", 0, 0, "", 0,
+                  ## what-if / order state
+                  0, order['status'], "", "", "", "", "", "", "", "",
+                  0, 0, 0, "", 0, "", "", "", "", "", 0, "", "", "", 0, delay=delay)
+
+    def _send_order_status(self, conn, order, delay=None):
+        conn.send(IN.ORDER_STATUS, 6, order['orderId'], order['status'], order['filled'],
+                  order['totalQuantity'] - order['filled'], order['avgFillPrice'], order['permId'], 0,
+                  order['lastFillPrice'], order['clientId'], "", delay=delay)
+
+    def _send_order_update(self, conn, order, delay=None):
+        ## like TWS, every status change is an openOrder followed by an orderStatus,
+        ## order.get_open_orders relies on the pairing
+        if delay is None:
+            delay = self.response_delay()
+        self._send_open_order(conn, order, delay)
+        self._send_order_status(conn, order, delay)
+
+    def _send_execution(self, conn, reqId, execution, delay=None):
+
+        contract = execution['contract']
+        conn.send(IN.EXECUTION_DATA, 10, reqId, execution['orderId'],
+                  self.con_id(contract), contract.symbol, contract.secType, contract.lastTradeDateOrContractMonth,
+                  contract.strike, contract.right, contract.multiplier, contract.exchange, contract.currency,
+                  contract.localSymbol, contract.tradingClass,
+                  execution['execId'], execution['time'], self.account, contract.exchange, execution['side'],
+                  execution['shares'], execution['price'], execution['permId'], execution['clientId'], 0,
+                  execution['shares'], execution['price'], "", "", "", "", delay=delay)
+        conn.send(IN.COMMISSION_REPORT, 1, execution['execId'], execution['commission'], contract.currency or "USD",
+                  execution['realizedPNL'], 0.0, 0, delay=delay)
+
+    def _place_order(self, conn, fields):
+
+        orderId = int(fields[2])
+        contract, idx = _read_contract(fields, 3)
+        ## secIdType and secId
+        idx = idx + 2
+
+        with self._lock:
+            self._next_order_id = max(self._next_order_id, orderId + 1)
+            self._next_perm_id = self._next_perm_id + 1
+            order = self._orders[orderId] = {
+                'orderId': orderId, 'contract': contract, 'action': fields[idx],
+                'totalQuantity': float(fields[idx + 1]), 'orderType': fields[idx + 2],
+                'lmtPrice': fields[idx + 3], 'auxPrice': fields[idx + 4], 'tif': fields[idx + 5],
+                'account': fields[idx + 7] or self.account, 'clientId': conn.client_id,
+                'permId': self._next_perm_id, 'status': "Submitted", 'filled': 0.0,
+                'avgFillPrice': 0.0, 'lastFillPrice': 0.0, 'conn': conn
+            }
+
+        delay = self.response_delay()
+        self._send_order_update(conn, order, delay)
+
+        if self.auto_fill:
+            self.fill(orderId, delay=delay)
+
+    def fill(self, orderId, price=None, delay=None):
+        """
+        Fill a working order in full
+        :param price: fill price, by default the limit / stop price or else the last price
+        """
+
+        with self._lock:
+            order = self._orders.get(orderId)
+            if order is None or order['status'] != "Submitted":
+                return
+            contract = order['contract']
+
+        if price is None:
+            price = float(order['lmtPrice'] or order['auxPrice'] or 0.0) or self.last_price(contract)
+
+        side = 1.0 if order['action'] == "BUY" else -1.0
+        quantity = order['totalQuantity']
+
+        with self._lock:
+            order['status'] = "Filled"
+            order['filled'] = quantity
+            order['avgFillPrice'] = order['lastFillPrice'] = price
+
+            ## position and average cost, realised P&L on the part which reduces the position
+            key = contract_key(contract)
+            holding = self._positions.setdefault(key, [contract, 0.0, 0.0])
+            position, avg_cost = holding[1], holding[2]
+            realized = 0.0
+            if position * side < 0:
+                closing = min(abs(position), quantity)
+                realized = (price - avg_cost) * closing * (1.0 if position > 0 else -1.0)
+            new_position = position + side * quantity
+            if new_position == 0:
+                avg_cost = 0.0
+            elif position * side >= 0:
+                avg_cost = (avg_cost * abs(position) + price * quantity) / abs(new_position)
+            elif abs(quantity) > abs(position):
+                avg_cost = price
+            holding[1], holding[2] = new_position, avg_cost
+
+            execution = {
+                'orderId': orderId, 'contract': contract, 'execId': "0000%08d.01.01" % self._next_exec_id,
+                'time': datetime.datetime.now().strftime("%Y%m%d  %H:%M:%S"),
+                'side': "BOT" if side > 0 else "SLD", 'shares': quantity, 'price': price,
+                'permId': order['permId'], 'clientId': order['clientId'], 'commission': self.commission,
+                'realizedPNL': realized - self.commission if realized else 0.0
+            }
+            self._next_exec_id = self._next_exec_id + 1
+            self._executions.append(execution)
+            conn = order['conn']
+
+        if delay is None:
+            delay = self.response_delay()
+        self._send_order_update(conn, order, delay)
+        self._send_execution(conn, -1, execution, delay)
+
+    def _cancel(self, orderId):
+
+        with self._lock:
+            order = self._orders.get(orderId)
+            if order is None or order['status'] != "Submitted":
+                return None
+            order['status'] = "Cancelled"
+            return order
+
+    def _cancel_order(self, conn, fields):
+
+        order = self._cancel(int(fields[2]))
+        if order is None:
+            conn.error(int(fields[2]), 135, "Can't find order with id = %s" % fields[2])
+            return
+        self._send_order_update(order['conn'], order)
+
+    def _global_cancel(self, conn, fields):
+
+        with self._lock:
+            working = [orderId for orderId, order in self._orders.items() if order['status'] == "Submitted"]
+        for orderId in working:
+            order = self._cancel(orderId)
+            if order is not None:
+                self._send_order_update(order['conn'], order)
+
+    def _open_orders(self, conn, fields):
+
+        with self._lock:
+            working = [order for order in self._orders.values() if order['status'] == "Submitted"]
+
+        delay = self.response_delay()
+        for order in working:
+            self._send_order_update(conn, order, delay)
+        conn.send(IN.OPEN_ORDER_END, 1, delay=delay)
+
+    def _req_executions(self, conn, fields):
+
+        reqId = int(fields[2])
+        with self._lock:
+            executions = list(self._executions)
+
+        delay = self.response_delay()
+        for execution in executions:
+            self._send_execution(conn, reqId, execution, delay)
+        conn.send(IN.EXECUTION_DATA_END, 1, reqId, delay=delay)
+
+    ## positions and account
+    def _req_positions(self, conn, fields):
+
+        with self._lock:
+            holdings = [list(holding) for holding in self._positions.values()]
+
+        delay = self.response_delay()
+        for contract, position, avg_cost in holdings:
+            conn.send(IN.POSITION_DATA, 3, self.account, self.con_id(contract), contract.symbol, contract.secType,
+                      contract.lastTradeDateOrContractMonth, contract.strike, contract.right, contract.multiplier,
+                      contract.exchange, contract.currency, contract.localSymbol, contract.tradingClass,
+                      position, avg_cost, delay=delay)
+        conn.send(IN.POSITION_END, 1, delay=delay)
+
+    def _req_account_updates(self, conn, fields):
+
+        if fields[2] != "1":
+            return
+
+        with self._lock:
+            holdings = [list(holding) for holding in self._positions.values()]
+            values = list(self.account_values.items())
+
+        delay = self.response_delay()
+        for key, (value, currency) in values:
+            conn.send(IN.ACCT_VALUE, 2, key, value, currency, self.account, delay=delay)
+
+        for contract, position, avg_cost in holdings:
+            price = self.last_price(contract)
+            conn.send(IN.PORTFOLIO_VALUE, 8, self.con_id(contract), contract.symbol, contract.secType,
+                      contract.lastTradeDateOrContractMonth, contract.strike, contract.right, contract.multiplier,
+                      contract.primaryExchange, contract.currency, contract.localSymbol, contract.tradingClass,
+                      position, price, position * price, avg_cost, (price - avg_cost) * position, 0.0,
+                      self.account, delay=delay)
+
+        conn.send(IN.ACCT_UPDATE_TIME, 1, datetime.datetime.now().strftime("%H:%M"), delay=delay)
+        conn.send(IN.ACCT_DOWNLOAD_END, 1, self.account, delay=delay)
+
+    _handlers = {
+        OUT.START_API: _start_api,
+        OUT.REQ_CURRENT_TIME: _current_time,
+        OUT.REQ_CONTRACT_DATA: _contract_details,
+        OUT.REQ_HISTORICAL_DATA: _historical_data,
+        OUT.CANCEL_HISTORICAL_DATA: _cancel_subscription,
+        OUT.REQ_MKT_DATA: _mkt_data,
+        OUT.CANCEL_MKT_DATA: _cancel_subscription,
+        OUT.REQ_IDS: _req_ids,
+        OUT.PLACE_ORDER: _place_order,
+        OUT.CANCEL_ORDER: _cancel_order,
+        OUT.REQ_GLOBAL_CANCEL: _global_cancel,
+        OUT.REQ_OPEN_ORDERS: _open_orders,
+        OUT.REQ_ALL_OPEN_ORDERS: _open_orders,
+        OUT.REQ_EXECUTIONS: _req_executions,
+        OUT.REQ_POSITIONS: _req_positions,
+        OUT.REQ_ACCT_DATA: _req_account_updates
+    }
+
+def main(args):
+
+    parser = argparse.ArgumentParser(description="Offline IB gateway simulator")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=4002)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before each response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many seconds more")
+    parser.add_argument('--pacing', type=int, default=None,
+                        help="historical data requests allowed per 10 minutes, error 162 beyond")
+    parser.add_argument('--bars', default=None, help="bar store directory to serve history from")
+    parser.add_argument('--manual-fill', action='store_true', help="leave orders working instead of filling them")
+    options = parser.parse_args(args[1:])
+
+    gateway = fakeGateway(options.host, options.port, options.latency, options.jitter,
+                          (options.pacing, 600) if options.pacing else None, options.bars,
+                          auto_fill=not options.manual_fill).start()
+
+    try:
+        while True:
+            time.sleep(60)
+            print("%s, requests by message id %s" % (gateway, gateway.requests))
+    except KeyboardInterrupt:
+        gateway.stop()
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,299 @@
+#! /usr/bin/python
+
+"""
+Long lived, thread safe pool of IB gateway connections
+
+Every helper used to build a TestApp (TCP connect, handshake, new reader Thread) per call
+and tear it down again. A sessionPool keeps a few connected clients around and hands them
+out one caller at a time:
+
+    pool = ib_session.get_pool(TestApp, ip, 4001, ClientID.POOL_HIST.value)
+    with pool.session() as app:
+        tickerid = pool.next_request_id()
+        ...
+
+Broken clients are dropped on release and replaced on the next acquire. Client ids are
+taken from a range starting at client_id_base, so a clash with another process (IB error 326)
+just moves the pool on to the next id. Waiting for a client gives up after
+DEFAULT_ACQUIRE_TIMEOUT seconds with sessionTimeout rather than hanging the caller.
+
+Long lived subscriptions (keepUpToDate bars, market data) don't take a client each, they share
+one through a sharedSession on a pool of their own, each with its own ticker id.
+"""
+
+from threading import Lock, Condition
+from contextlib import contextmanager
+import atexit
+import time
+
+from gwt_pt.util import config_loader
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_ACQUIRE_TIMEOUT = 60
+CLIENT_ID_SPAN = 50
+REQUEST_ID_START = 100000
+
+## IB Gateway default ports
+LIVE_PORT = 4001
+PAPER_PORT = 4002
+
+MAX_CONNECT_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 1.0
+
+class sessionTimeout(Exception):
+    pass
+
+class sessionPool(object):
+    """
+    Pool of connected app objects (any TestApp style class taking ipaddress, portid, clientid)
+    """
+
+    def __init__(self, app_class, ipaddress, portid, client_id_base, size=DEFAULT_POOL_SIZE,
+                 client_id_span=CLIENT_ID_SPAN, max_retries=MAX_CONNECT_RETRIES):
+
+        self.app_class = app_class
+        self.ipaddress = ipaddress
+        self.portid = portid
+        self.size = size
+        self.max_retries = max_retries
+
+        self._client_ids = list(range(client_id_base, client_id_base + client_id_span))
+        self._idle = []
+        self._in_use = {}
+        self._connecting = 0
+        self._cond = Condition(Lock())
+
+        self._request_id = REQUEST_ID_START
+        self._request_id_lock = Lock()
+
+    def __repr__(self):
+        return "sessionPool %s@%s:%d (%d idle, %d in use)" % (self.app_class.__name__, self.ipaddress,
+                                                              self.portid, len(self._idle), len(self._in_use))
+
+    def next_request_id(self, count=1):
+        """
+        Request ids unique across all the clients of this pool
+        :param count: reserve a block of ids, eg. for a batch of requests
+        :return: first id of the block
+        """
+
+        with self._request_id_lock:
+            request_id = self._request_id
+            self._request_id = self._request_id + count
+            return request_id
+
+    def _connect(self):
+        """
+        Connect a new client, trying the next client id / backing off on failure
+        :return: (client id, app)
+        """
+
+        for attempt in range(self.max_retries):
+            with self._cond:
+                if not self._client_ids:
+                    raise Exception("No client id left in %s" % self)
+                clientid = self._client_ids.pop(0)
+
+            app = None
+            try:
+                app = self.app_class(self.ipaddress, self.portid, clientid)
+            except Exception as e:
+                print("Connect with client id %d failed: %s" % (clientid, e))
+
+            if app is not None and app.isConnected():
+                return clientid, app
+
+            print("Client id %d not connected, retrying..." % clientid)
+            self._discard(clientid, app, reuse_id=False)
+            time.sleep(RETRY_BACKOFF_SECONDS * (attempt + 1))
+
+        raise Exception("Unable to connect to IB gateway %s:%d" % (self.ipaddress, self.portid))
+
+    def _discard(self, clientid, app, reuse_id=True):
+
+        if app is not None:
+            try:
+                app.disconnect()
+            except:
+                print("Disconnect with errors (no harm)!")
+
+        with self._cond:
+            if reuse_id:
+                self._client_ids.insert(0, clientid)
+            else:
+                ## id may be held by someone else, try it again last
+                self._client_ids.append(clientid)
+            self._cond.notify()
+
+    def acquire(self, timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        """
+        Get a connected client for exclusive use, connecting a new one if the pool is not full
+        :param timeout: seconds to wait for a client to come back, None to wait for ever
+        """
+
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._cond:
+            while True:
+                while self._idle:
+                    clientid, app = self._idle.pop()
+                    if app.isConnected():
+                        self._in_use[id(app)] = clientid
+                        return app
+                    ## dropped while idle, recycle its client id
+                    self._client_ids.insert(0, clientid)
+
+                if len(self._in_use) + self._connecting < self.size:
+                    ## reserve the slot while we connect
+                    self._connecting = self._connecting + 1
+                    break
+
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise sessionTimeout("Timed out waiting for a session from %s" % self)
+                self._cond.wait(remaining)
+
+        try:
+            clientid, app = self._connect()
+            with self._cond:
+                self._in_use[id(app)] = clientid
+            return app
+        finally:
+            with self._cond:
+                self._connecting = self._connecting - 1
+                self._cond.notify()
+
+    def release(self, app):
+        """
+        Give a client back to the pool, dropping it if the connection is gone
+        """
+
+        with self._cond:
+            clientid = self._in_use.pop(id(app))
+
+        if app.isConnected():
+            ## clear down anything left in the error queue by the last user
+            while app.is_error():
+                print(app.get_error())
+            with self._cond:
+                self._idle.append((clientid, app))
+                self._cond.notify()
+        else:
+            print("Session with client id %d lost, will reconnect" % clientid)
+            self._discard(clientid, app)
+
+    @contextmanager
+    def session(self, timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        app = self.acquire(timeout)
+        try:
+            yield app
+        finally:
+            self.release(app)
+
+    def close(self):
+        """
+        Disconnect all idle clients
+        """
+
+        with self._cond:
+            idle = self._idle
+            self._idle = []
+
+        for clientid, app in idle:
+            self._discard(clientid, app)
+
+class sharedSession(object):
+    """
+    One client of a pool shared by any number of subscriptions, given back to the pool when
+    the last of them closes. Ticker ids come from pool.next_request_id, unique on the client
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._app = None
+        ## subscriptions open, by client
+        self._users = {}
+        self._lock = Lock()
+
+    def __repr__(self):
+        return "sharedSession on %s (%d subscriptions)" % (self.pool, sum(self._users.values()))
+
+    def open(self, timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        """
+        :return: the shared client, pass it back to close when the subscription ends
+        """
+
+        with self._lock:
+            ## a lost client stays with its subscriptions until they close, new ones get a fresh client
+            if self._app is None or not self._app.isConnected():
+                self._app = self.pool.acquire(timeout)
+                self._users[id(self._app)] = 0
+            self._users[id(self._app)] += 1
+            return self._app
+
+    def close(self, app):
+
+        with self._lock:
+            self._users[id(app)] -= 1
+            if self._users[id(app)] > 0:
+                return
+            del self._users[id(app)]
+            if self._app is app:
+                self._app = None
+
+        self.pool.release(app)
+
+## (ip, port) every pool connects to instead of the configured gateway, see use_gateway
+_GATEWAY_OVERRIDE = None
+
+def use_gateway(ipaddress, portid):
+    """
+    Point every pool created from now on at another gateway, eg. a fake_gateway.fakeGateway
+    for load tests and benchmarks (None, None to go back to the configured one)
+    """
+
+    global _GATEWAY_OVERRIDE
+    _GATEWAY_OVERRIDE = None if ipaddress is None else (ipaddress, portid)
+
+def gateway_address(is_simulated=False):
+    """
+    [ib-gateway] ip, and live-port / paper-port (4001 / 4002 by default) from the config
+    :return: (ip, port)
+    """
+
+    if (_GATEWAY_OVERRIDE is not None):
+        return _GATEWAY_OVERRIDE
+
+    config = config_loader.load()
+    ip = config.get("ib-gateway","ip")
+
+    if (is_simulated):
+        return ip, config.getint("ib-gateway", "paper-port", fallback=PAPER_PORT)
+    else:
+        return ip, config.getint("ib-gateway", "live-port", fallback=LIVE_PORT)
+
+## pools shared by the whole process
+_POOLS = {}
+_POOLS_LOCK = Lock()
+
+def get_pool(app_class, ipaddress, portid, client_id_base, size=DEFAULT_POOL_SIZE):
+    """
+    The process wide pool for this app class, gateway and client id range, created on first use
+    """
+
+    key = (app_class, ipaddress, portid, client_id_base)
+
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = sessionPool(app_class, ipaddress, portid, client_id_base, size)
+        return _POOLS[key]
+
+def close_all():
+
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+
+    for pool in pools:
+        pool.close()
+
+atexit.register(close_all)
@@ -22,15 +22,21 @@
 from ibapi.wrapper import EWrapper
 from ibapi.client import EClient
 from ibapi.contract import Contract as IBcontract
-from threading import Thread
+from threading import Thread, Lock
+from collections import deque
 import queue
 import datetime
+import time
 from gwt_pt.datasource import resample
-from gwt_pt.util import config_loader
+from gwt_pt.datasource import ib_session
+from gwt_pt.datasource import bar_store
+from gwt_pt.datasource import tick_stream
+from gwt_pt.datasource.bar_array import barArray
 
 from enum import Enum
 
 DEFAULT_HISTORIC_DATA_ID=50
+DEFAULT_BATCH_DATA_ID=1000
 DEFAULT_GET_CONTRACT_ID=43
 
 ## marker for when queue is finished
@@ -38,12 +44,150 @@ FINISHED = object()
 STARTED = object()
 TIME_OUT = object()
 
+## errors which terminate a historical data request without a historicalDataEnd
+HISTORIC_DATA_ERROR_CODES = (162, 200, 321, 322, 366)
+
 class ClientID(Enum):
     HIST_FX = 10001
     HIST_HKFE = 10002
     HIST_METAL = 10003
+    POOL_HIST = 11001
+    POOL_STREAM = 11101
     TICK_HKFE = 30002
 
+class pacingLimiter(object):
+    """
+    Keeps historical data requests within the IB pacing rules:
+    - no more than max_requests in any period seconds (60 per 10 mins)
+    - no more than max_same_contract requests for the same contract in same_contract_period seconds (6 per 2 secs)
+    - no identical request within identical_period seconds (15 secs)
+    - no more than max_active requests open at the same time (50)
+    """
+
+    def __init__(self, max_requests=60, period=600, max_same_contract=6, same_contract_period=2,
+                 identical_period=15, max_active=50):
+
+        self.max_requests = max_requests
+        self.period = period
+        self.max_same_contract = max_same_contract
+        self.same_contract_period = same_contract_period
+        self.identical_period = identical_period
+        self.max_active = max_active
+
+        self._lock = Lock()
+        self._history = deque()
+
+    def _prune(self, now):
+        while self._history and self._history[0][0] <= now - self.period:
+            self._history.popleft()
+
+    def wait_time(self, contract_key, request_key=None):
+        """
+        How long we have to wait before the request can go out
+        :param contract_key: identifies the contract (and price type) of the request
+        :param request_key: identifies the full request, for the identical request rule
+        :return: seconds to wait, 0 if the request can be sent now
+        """
+
+        with self._lock:
+            now = time.time()
+            self._prune(now)
+
+            waits = [0.0]
+
+            if len(self._history) >= self.max_requests:
+                waits.append(self._history[0][0] + self.period - now)
+
+            same_contract = [ts for ts, ckey, rkey in self._history
+                             if ckey == contract_key and ts > now - self.same_contract_period]
+            if len(same_contract) >= self.max_same_contract:
+                waits.append(same_contract[0] + self.same_contract_period - now)
+
+            if request_key is not None:
+                identical = [ts for ts, ckey, rkey in self._history
+                             if rkey == request_key and ts > now - self.identical_period]
+                if identical:
+                    waits.append(identical[-1] + self.identical_period - now)
+
+            return max(waits)
+
+    def record(self, contract_key, request_key=None):
+        with self._lock:
+            self._history.append((time.time(), contract_key, request_key))
+
+    def wait(self, contract_key, request_key=None):
+        """
+        Block until the request can be sent, and record it
+        """
+
+        delay = self.wait_time(contract_key, request_key)
+        while delay > 0:
+            time.sleep(delay)
+            delay = self.wait_time(contract_key, request_key)
+
+        self.record(contract_key, request_key)
+
+## one limiter per process, pacing is counted per gateway session by IB
+HIST_PACING = pacingLimiter()
+
+class barSubscription(object):
+    """
+    A keepUpToDate historical data request
+    IB keeps sending updates of the bar which is still forming, once an update arrives for a new bar
+    the previous one is complete and is pushed to every registered callback as a
+    (date, open, high, low, close, volume) tuple
+
+    Callbacks run on the IB reader thread so should be quick, exceptions are printed and swallowed
+    """
+
+    def __init__(self, tickerid, callbacks=None):
+        self.tickerid = tickerid
+        self.history = []
+        self._callbacks = list(callbacks or [])
+        self._forming = None
+        self._history_done = False
+        self._on_close = None
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def _complete(self, bardata):
+
+        self.history.append(bardata)
+        for callback in self._callbacks:
+            try:
+                callback(bardata)
+            except Exception as e:
+                print("Bar callback raised: [" + str(e) + "]")
+
+    def on_history(self, bardata):
+
+        ## initial bars are complete except for the last one, which is the forming bar
+        if self._forming is not None:
+            self.history.append(self._forming)
+        self._forming = bardata
+
+    def on_history_end(self):
+        self._history_done = True
+
+    def on_update(self, bardata):
+
+        if self._forming is not None and self._forming[0] != bardata[0]:
+            self._complete(self._forming)
+        self._forming = bardata
+
+    def close(self):
+        """
+        Cancel the subscription (and give back its share of the stream session)
+        """
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+def contract_key(ibcontract, priceType=""):
+    return (ibcontract.symbol, ibcontract.secType, ibcontract.exchange, ibcontract.currency,
+            ibcontract.lastTradeDateOrContractMonth, priceType)
+
 class finishableQueue(object):
 
     def __init__(self, queue_to_finish):
@@ -93,6 +237,11 @@ class TestWrapper(EWrapper):
     def __init__(self):
         self._my_contract_details = {}
         self._my_historic_data_dict = {}
+        self._my_historic_bars = {}
+        self._my_historic_data_done = queue.Queue()
+        self._my_historic_data_notify = set()
+        self._my_bar_subscriptions = {}
+        self._my_tick_streams = {}
         self.init_error()
 
     ## error handling code
@@ -117,6 +266,11 @@ class TestWrapper(EWrapper):
         errormsg = "IB error id %d errorcode %d string %s" % (id, errorCode, errorString)
         self._my_errors.put(errormsg)
 
+        ## let anyone waiting on this request know it is not coming back
+        if errorCode in HISTORIC_DATA_ERROR_CODES and id in self._my_historic_data_notify:
+            self._my_historic_data_notify.discard(id)
+            self._my_historic_data_done.put(id)
+
 
     ## get contract details code
     def init_contractdetails(self, reqId):
@@ -140,8 +294,14 @@ class TestWrapper(EWrapper):
         self._my_contract_details[reqId].put(FINISHED)
 
     ## Historic data code
-    def init_historicprices(self, tickerid):
+    def init_historicprices(self, tickerid, notify_done=False):
+        ## bars are written straight into a barArray, the queue just signals FINISHED
         historic_data_queue = self._my_historic_data_dict[tickerid] = queue.Queue()
+        self._my_historic_bars[tickerid] = barArray()
+
+        ## completion of this request is also signalled through completed_historicprices
+        if notify_done:
+            self._my_historic_data_notify.add(tickerid)
 
         return historic_data_queue
 
@@ -149,24 +309,87 @@ class TestWrapper(EWrapper):
 
         ## Overriden method
         ## Note I'm choosing to ignore barCount, WAP and hasGaps but you could use them if you like
-        bardata=(bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume)
-
-        historic_data_dict=self._my_historic_data_dict
+        if tickerid in self._my_bar_subscriptions:
+            bardata=(bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume)
+            self._my_bar_subscriptions[tickerid].on_history(bardata)
+            return
 
         ## Add on to the current data
-        if tickerid not in historic_data_dict.keys():
+        if tickerid not in self._my_historic_bars.keys():
             self.init_historicprices(tickerid)
 
-        historic_data_dict[tickerid].put(bardata)
+        self._my_historic_bars[tickerid].append(bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume)
 
     def historicalDataEnd(self, tickerid, start:str, end:str):
         ## overriden method
 
+        if tickerid in self._my_bar_subscriptions:
+            self._my_bar_subscriptions[tickerid].on_history_end()
+            return
+
         if tickerid not in self._my_historic_data_dict.keys():
             self.init_historicprices(tickerid)
 
         self._my_historic_data_dict[tickerid].put(FINISHED)
 
+        if tickerid in self._my_historic_data_notify:
+            self._my_historic_data_notify.discard(tickerid)
+            self._my_historic_data_done.put(tickerid)
+
+    ## Streaming (keepUpToDate) bars
+    def init_bar_subscription(self, tickerid, callbacks=None):
+        subscription = self._my_bar_subscriptions[tickerid] = barSubscription(tickerid, callbacks)
+
+        return subscription
+
+    def historicalDataUpdate(self, tickerid, bar):
+        ## overriden method
+
+        if tickerid in self._my_bar_subscriptions:
+            bardata=(bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume)
+            self._my_bar_subscriptions[tickerid].on_update(bardata)
+
+    ## Streaming ticks
+    def init_tick_stream(self, tickerid, aggregators=None):
+        stream = self._my_tick_streams[tickerid] = tick_stream.tickStream(tickerid, aggregators)
+
+        return stream
+
+    def tickPrice(self, tickerid, tickType, price, attrib):
+        ## overriden method
+
+        if tickerid in self._my_tick_streams:
+            self._my_tick_streams[tickerid].on_price(tickType, price)
+
+    def tickSize(self, tickerid, tickType, size):
+        ## overriden method
+
+        if tickerid in self._my_tick_streams:
+            self._my_tick_streams[tickerid].on_size(tickType, size)
+
+    def take_historicprices(self, tickerid, copy=False):
+        """
+        Hand over the bars of a finished (or abandoned) request
+        :param copy: copy them, the reader thread may still be appending if we timed out
+        :return: barArray
+        """
+
+        self._my_historic_data_dict.pop(tickerid, None)
+        historic_data = self._my_historic_bars.pop(tickerid, None)
+        if historic_data is None:
+            return barArray(0)
+        return historic_data.copy() if copy else historic_data
+
+    def completed_historicprices(self, timeout):
+        """
+        Wait for any historical data request to complete
+        :return: tickerid of the completed request, or None if nothing completed within timeout
+        """
+        try:
+            return self._my_historic_data_done.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
         
 class TestClient(EClient):
     """
@@ -194,6 +417,7 @@ class TestClient(EClient):
         ## Run until we get a valid contract(s) or get bored waiting
         MAX_WAIT_SECONDS = 20
         new_contract_details = contract_details_queue.get(timeout = MAX_WAIT_SECONDS)
+        self._my_contract_details.pop(reqId, None)
 
         while self.wrapper.is_error():
             print(self.get_error())
@@ -210,43 +434,95 @@ class TestClient(EClient):
 
         new_contract_details=new_contract_details[0]
 
-        resolved_ibcontract=new_contract_details.summary
+        ## ContractDetails.summary was renamed contract in API 9.74
+        resolved_ibcontract=getattr(new_contract_details, 'contract', None) or new_contract_details.summary
 
         return resolved_ibcontract
 
 
-    def get_IB_historical_data(self, ibcontract, durationStr="1 Y", barSizeSetting="4 hours", priceType = "MIDPOINT",
-                               tickerid=DEFAULT_HISTORIC_DATA_ID):
-
-        """
-        Returns historical prices for a contract, up to today
-        ibcontract is a Contract
-        :returns list of prices in 4 tuples: Open high low close volume
-        """
-
-        ## Make a place to store the data we're going to return
-        historic_data_queue = finishableQueue(self.init_historicprices(tickerid))
+    def _request_historical_data(self, tickerid, ibcontract, durationStr, barSizeSetting, priceType,
+                                 keepUpToDate=False):
 
         # Request some historical data. Native method in EClient
         self.reqHistoricalData(
             tickerid,  # tickerId,
             ibcontract,  # contract,
-            datetime.datetime.today().strftime("%Y%m%d %H:%M:%S %Z"),  # endDateTime,
+            ## end date has to be left blank to keep up to date
+            "" if keepUpToDate else datetime.datetime.today().strftime("%Y%m%d %H:%M:%S %Z"),  # endDateTime,
             durationStr,  # durationStr,
             barSizeSetting,  # barSizeSetting,
             priceType,
             #"TRADES",  # whatToShow,
             1,  # useRTH,
             1,  # formatDate
-            False,  # KeepUpToDate <<==== added for api 9.73.2
+            keepUpToDate,  # KeepUpToDate <<==== added for api 9.73.2
             [] ## chartoptions not used
         )
 
+    def start_streaming_IB_historical_data(self, ibcontract, durationStr="28800 S", barSizeSetting="1 min",
+                                           priceType="TRADES", tickerid=DEFAULT_HISTORIC_DATA_ID, callbacks=None):
+        """
+        Kick off a keepUpToDate historical data request
+        :param callbacks: functions called with each completed bar tuple
+        :return: barSubscription
+        """
+
+        subscription = self.wrapper.init_bar_subscription(tickerid, callbacks)
+        self._request_historical_data(tickerid, ibcontract, durationStr, barSizeSetting, priceType, True)
+
+        return subscription
+
+    def stop_streaming_IB_historical_data(self, tickerid):
+
+        ## native EClient method
+        self.cancelHistoricalData(tickerid)
+        self.wrapper._my_bar_subscriptions.pop(tickerid, None)
+
+        while self.wrapper.is_error():
+            print(self.get_error())
+
+    def start_streaming_IB_ticks(self, ibcontract, tickerid=DEFAULT_HISTORIC_DATA_ID, aggregators=None):
+        """
+        Subscribe to market data and build trades from the last price / last size ticks
+        :param aggregators: tick_stream.barAggregator objects fed with every trade
+        :return: tick_stream.tickStream
+        """
+
+        stream = self.wrapper.init_tick_stream(tickerid, aggregators)
+
+        ## native EClient method, streaming (not snapshot) market data
+        self.reqMktData(tickerid, ibcontract, "", False, False, [])
+
+        return stream
+
+    def stop_streaming_IB_ticks(self, tickerid):
+
+        ## native EClient method
+        self.cancelMktData(tickerid)
+        self.wrapper._my_tick_streams.pop(tickerid, None)
+
+        while self.wrapper.is_error():
+            print(self.get_error())
+
+    def get_IB_historical_data(self, ibcontract, durationStr="1 Y", barSizeSetting="4 hours", priceType = "MIDPOINT",
+                               tickerid=DEFAULT_HISTORIC_DATA_ID):
+
+        """
+        Returns historical prices for a contract, up to today
+        ibcontract is a Contract
+        :returns barArray of prices: date open high low close volume
+        """
+
+        ## Make a place to store the data we're going to return
+        historic_data_queue = finishableQueue(self.init_historicprices(tickerid))
+
+        self._request_historical_data(tickerid, ibcontract, durationStr, barSizeSetting, priceType)
+
         ## Wait until we get a completed data, an error, or get bored waiting
         MAX_WAIT_SECONDS = 20
         print("Getting historical data from the server... could take %d seconds to complete " % MAX_WAIT_SECONDS)
 
-        historic_data = historic_data_queue.get(timeout = MAX_WAIT_SECONDS)
+        historic_data_queue.get(timeout = MAX_WAIT_SECONDS)
 
         while self.wrapper.is_error():
             print(self.get_error())
@@ -255,9 +531,79 @@ class TestClient(EClient):
             print("Exceeded maximum wait for wrapper to confirm finished - seems to be normal behaviour")
 
         self.cancelHistoricalData(tickerid)
+        historic_data = self.wrapper.take_historicprices(tickerid, historic_data_queue.timed_out())
 
         return historic_data
 
+    def get_IB_historical_data_batch(self, requests, max_wait_seconds=20, limiter=HIST_PACING,
+                                     tickerid_base=DEFAULT_BATCH_DATA_ID):
+
+        """
+        Issues many historical data requests at once over this connection, each with its own tickerid
+        Requests are paced by the limiter, results are returned as each request completes
+        :param requests: list of (key, ibcontract, durationStr, barSizeSetting, priceType)
+        :return: generator of (key, barArray of prices: date open high low close volume)
+        """
+
+        pending = deque(requests)
+        active = {}
+        next_tickerid = tickerid_base
+
+        while pending or active:
+
+            ## send as many requests as the limiter allows
+            delay = 0
+            while pending and len(active) < limiter.max_active:
+                key, ibcontract, durationStr, barSizeSetting, priceType = pending[0]
+                ckey = contract_key(ibcontract, priceType)
+                rkey = (ckey, durationStr, barSizeSetting)
+
+                delay = limiter.wait_time(ckey, rkey)
+                if delay > 0:
+                    break
+
+                pending.popleft()
+                limiter.record(ckey, rkey)
+
+                tickerid = next_tickerid
+                next_tickerid = next_tickerid + 1
+
+                self.init_historicprices(tickerid, notify_done=True)
+                self._request_historical_data(tickerid, ibcontract, durationStr, barSizeSetting, priceType)
+                active[tickerid] = (key, time.time())
+
+            if not active:
+                ## nothing in flight, just wait out the pacing
+                time.sleep(delay)
+                continue
+
+            now = time.time()
+            oldest = min([started for key, started in active.values()])
+            timeout = max(oldest + max_wait_seconds - now, 0)
+            if pending and delay > 0:
+                timeout = min(timeout, delay)
+
+            tickerid = self.wrapper.completed_historicprices(timeout)
+
+            while self.wrapper.is_error():
+                print(self.get_error())
+
+            if tickerid in active:
+                finished = [tickerid]
+            else:
+                ## give up on anything which has waited too long
+                now = time.time()
+                finished = [tid for tid, (key, started) in active.items() if started + max_wait_seconds <= now]
+                for tid in finished:
+                    print("Exceeded maximum wait for historical data %s - returning what we have" % str(active[tid][0]))
+
+            for tid in finished:
+                self.wrapper._my_historic_data_notify.discard(tid)
+                key, started = active.pop(tid)
+                timed_out = tid != tickerid
+                self.cancelHistoricalData(tid)
+                yield key, self.wrapper.take_historicprices(tid, timed_out)
+
 class TestApp(TestWrapper, TestClient):
     def __init__(self, ipaddress, portid, clientid):
         TestWrapper.__init__(self)
@@ -272,84 +618,27 @@ class TestApp(TestWrapper, TestClient):
 
         self.init_error()
 
-def get_metal_data(symbol="XAUUSD", duration = "20 D", period = "30 mins", is_simulated=False):    
+def metal_contract(symbol="XAUUSD"):
 
-    config = config_loader.load()
-    ip = config.get("ib-gateway","ip")
-    #ip = "127.0.0.1"
-    
-    if (is_simulated):
-        app = TestApp(ip, 4002, ClientID.HIST_METAL.value)
-    else:
-        app = TestApp(ip, 4001, ClientID.HIST_METAL.value)
-        
     ibcontract = IBcontract()
     #ibcontract.lastTradeDateOrContractMonth="201803"
     ibcontract.secType = "CMDTY"
     ibcontract.symbol = symbol
     ibcontract.exchange = "SMART"
-    
-    resolved_ibcontract=app.resolve_ib_contract(ibcontract)
+    return ibcontract
 
-    historic_data = app.get_IB_historical_data(resolved_ibcontract, duration, period)
-    #print(historic_data)
-    
-    #out_tup = resample.filter_data(historic_data, period)
-    #historic_data = out_tup
-    
-    try:
-        app.disconnect()
-    except:
-        print("Disconnect with errors (no harm)!")
+def hkfe_contract(contractMonth, symbol="MHI"):
 
-    return historic_data          
-        
-def get_hkfe_data(contractMonth, symbol="MHI", duration = "20 D", period = "30 mins", is_simulated=False):    
-
-    config = config_loader.load()
-
-    ip = config.get("ib-gateway","ip")
-    #ip = "127.0.0.1"
-    
-    if (is_simulated):
-        app = TestApp(ip, 4002, ClientID.HIST_HKFE.value)
-    else:
-        app = TestApp(ip, 4001, ClientID.HIST_HKFE.value)
-        
     ibcontract = IBcontract()
     #YYYYMM
     ibcontract.lastTradeDateOrContractMonth=contractMonth
     ibcontract.secType = "FUT"
     ibcontract.symbol = symbol
     ibcontract.exchange = "HKFE"
- 
-    resolved_ibcontract = app.resolve_ib_contract(ibcontract)
+    return ibcontract
 
-    historic_data = app.get_IB_historical_data(resolved_ibcontract, duration, period, "TRADES")
-    #print(historic_data)
-    
-    out_tup = resample.filter_data("HKFE", historic_data, period)
-    historic_data = out_tup
-    #print(historic_data)
-    try:
-        app.disconnect()
-    except:
-        print("Disconnect with errors (no harm)!")
-
-    return historic_data     
-        
-def get_fx_data(symbol, currency, duration = "2 M", period = "4 hours", is_simulated=False): 
-
-    config = config_loader.load()
+def fx_contract(symbol, currency):
 
-    ip = config.get("ib-gateway","ip")
-    #ip = "127.0.0.1"
-    
-    if (is_simulated):
-        app = TestApp(ip, 4002, ClientID.HIST_FX.value)
-    else:
-        app = TestApp(ip, 4001, ClientID.HIST_FX.value)
-        
     ibcontract = IBcontract()
     #ibcontract.lastTradeDateOrContractMonth="201809"
     #ibcontract.secType = "FUT"
@@ -359,21 +648,195 @@ def get_fx_data(symbol, currency, duration = "2 M", period = "4 hours", is_simul
     ibcontract.secType = "CASH"
     ibcontract.currency = currency
     ibcontract.exchange = "IDEALPRO"
+    return ibcontract
 
-    resolved_ibcontract=app.resolve_ib_contract(ibcontract)
+def hist_pool(is_simulated=False):
+    """
+    The shared pool of gateway sessions used by the historical data helpers
+    """
 
-    historic_data = app.get_IB_historical_data(resolved_ibcontract, duration, period)
+    ip, port = ib_session.gateway_address(is_simulated)
+    return ib_session.get_pool(TestApp, ip, port, ClientID.POOL_HIST.value)
+
+## shared stream sessions, by pool
+_STREAM_SESSIONS = {}
+_STREAM_SESSIONS_LOCK = Lock()
+
+def stream_session(is_simulated=False):
+    """
+    The one gateway client all bar / tick subscriptions of the process share, on a pool of its own
+    so open subscriptions never hold up the historical data helpers
+    """
+
+    ip, port = ib_session.gateway_address(is_simulated)
+    pool = ib_session.get_pool(TestApp, ip, port, ClientID.POOL_STREAM.value)
+
+    with _STREAM_SESSIONS_LOCK:
+        if id(pool) not in _STREAM_SESSIONS:
+            _STREAM_SESSIONS[id(pool)] = ib_session.sharedSession(pool)
+        return _STREAM_SESSIONS[id(pool)]
+
+def get_hist_data(ibcontract, duration, period, priceType="MIDPOINT", is_simulated=False, use_cache=False):
+    """
+    Historical data for a contract, with use_cache only the bars since the last cached one are
+    fetched and merged into the local bar store
+    An empty fetch (error or timeout) comes back empty, with or without the cache
+    """
+
+    pool = hist_pool(is_simulated)
+
+    if (use_cache):
+        store = bar_store.get_store()
+        key = store.key(contract_key(ibcontract, priceType), period)
+        request_duration = bar_store.fetch_duration(store.load(key), duration, period)
+    else:
+        request_duration = duration
+
+    with pool.session() as app:
+        resolved_ibcontract = app.resolve_ib_contract(ibcontract, pool.next_request_id())
+
+        ckey = contract_key(resolved_ibcontract, priceType)
+        HIST_PACING.wait(ckey, (ckey, request_duration, period))
+        historic_data = app.get_IB_historical_data(resolved_ibcontract, request_duration, period, priceType,
+                                                   pool.next_request_id())
+
+    ## a failed fetch stays empty for the caller rather than serving the cached bars as current
+    if (use_cache and len(historic_data) > 0):
+        merged = store.merge(key, historic_data)
+        historic_data = barArray.from_records(store.window(merged, duration), bar_store.is_daily(period))
+
+    return historic_data
+
+def get_metal_data(symbol="XAUUSD", duration = "20 D", period = "30 mins", is_simulated=False, use_cache=False):    
+
+    historic_data = get_hist_data(metal_contract(symbol), duration, period, "MIDPOINT", is_simulated, use_cache)
     #print(historic_data)
     
-    out_tup = resample.filter_data("FX", historic_data, period)
+    #out_tup = resample.filter_data(historic_data, period)
+    #historic_data = out_tup
+
+    return historic_data          
+        
+def get_hkfe_data(contractMonth, symbol="MHI", duration = "20 D", period = "30 mins", is_simulated=False, use_cache=False):    
+
+    historic_data = get_hist_data(hkfe_contract(contractMonth, symbol), duration, period, "TRADES", is_simulated, use_cache)
+    #print(historic_data)
+    
+    out_tup = resample.filter_data("HKFE", historic_data, period)
     historic_data = out_tup
+    #print(historic_data)
+
+    return historic_data     
+        
+def get_fx_data(symbol, currency, duration = "2 M", period = "4 hours", is_simulated=False, use_cache=False): 
+
+    historic_data = get_hist_data(fx_contract(symbol, currency), duration, period, "MIDPOINT", is_simulated, use_cache)
+    #print(historic_data)
     
+    out_tup = resample.filter_data("FX", historic_data, period)
+    historic_data = out_tup
+
+    return historic_data
+
+def stream_data(ibcontract, duration, period, priceType="MIDPOINT", callbacks=None, is_simulated=False):
+    """
+    Subscribe to bars of a contract as they complete, instead of polling for historical data
+    The subscription shares the stream_session client with the others until it is closed
+    :param callbacks: functions called with each completed (date, open, high, low, close, volume) tuple
+    :return: barSubscription, call close() on it when done
+    """
+
+    shared = stream_session(is_simulated)
+    app = shared.open()
+
     try:
-        app.disconnect()
+        resolved_ibcontract = app.resolve_ib_contract(ibcontract, shared.pool.next_request_id())
+        tickerid = shared.pool.next_request_id()
+        subscription = app.start_streaming_IB_historical_data(resolved_ibcontract, duration, period, priceType,
+                                                              tickerid, callbacks)
     except:
-        print("Disconnect with errors (no harm)!")
+        shared.close(app)
+        raise
 
-    return historic_data
+    def _close():
+        try:
+            app.stop_streaming_IB_historical_data(tickerid)
+        finally:
+            shared.close(app)
+
+    subscription._on_close = _close
+    return subscription
+
+def stream_hkfe_data(contractMonth, symbol="MHI", duration = "28800 S", period = "1 min", callbacks=None, is_simulated=False):
+
+    return stream_data(hkfe_contract(contractMonth, symbol), duration, period, "TRADES", callbacks, is_simulated)
+
+def stream_ticks(ibcontract, aggregators=None, is_simulated=False):
+    """
+    Stream trades of a contract into tick_stream bar aggregators, closed on the wall clock as well
+    The stream shares the stream_session client with the others until it is closed
+    :return: tick_stream.tickStream, call close() on it when done
+    """
+
+    shared = stream_session(is_simulated)
+    app = shared.open()
+
+    try:
+        resolved_ibcontract = app.resolve_ib_contract(ibcontract, shared.pool.next_request_id())
+        tickerid = shared.pool.next_request_id()
+        stream = app.start_streaming_IB_ticks(resolved_ibcontract, tickerid, aggregators)
+    except:
+        shared.close(app)
+        raise
+
+    def _close():
+        try:
+            app.stop_streaming_IB_ticks(tickerid)
+        finally:
+            shared.close(app)
+
+    stream._on_close = _close
+    stream.start_clock()
+    return stream
+
+def get_data_batch(requests, is_simulated=False, max_wait_seconds=20, use_cache=False):
+    """
+    Fetch historical data for many contracts over one gateway connection, concurrently
+    :param requests: list of (key, ibcontract, duration, period, priceType, filterType)
+                     filterType is "FX", "HKFE" or None as in resample.filter_data
+    :param use_cache: only fetch the gap since the last bar in the local bar store
+    :return: generator of (key, historic_data) in order of completion, empty for a failed fetch
+    The generator holds one of the hist_pool sessions until it is exhausted or closed
+    """
+
+    pool = hist_pool(is_simulated)
+    store = bar_store.get_store() if use_cache else None
+
+    with pool.session() as app:
+        request_info = {}
+        hist_requests = []
+        for (key, ibcontract, duration, period, priceType, filterType) in requests:
+
+            request_duration = duration
+            store_key = None
+            if (use_cache):
+                store_key = store.key(contract_key(ibcontract, priceType), period)
+                request_duration = bar_store.fetch_duration(store.load(store_key), duration, period)
+
+            resolved_ibcontract = app.resolve_ib_contract(ibcontract, pool.next_request_id())
+            hist_requests.append((key, resolved_ibcontract, request_duration, period, priceType))
+            request_info[key] = (filterType, duration, period, store_key)
+
+        tickerid_base = pool.next_request_id(len(hist_requests))
+        for key, historic_data in app.get_IB_historical_data_batch(hist_requests, max_wait_seconds,
+                                                                   tickerid_base=tickerid_base):
+            filterType, duration, period, store_key = request_info[key]
+            if store_key and len(historic_data) > 0:
+                merged = store.merge(store_key, historic_data)
+                historic_data = barArray.from_records(store.window(merged, duration), bar_store.is_daily(period))
+            if filterType:
+                historic_data = resample.filter_data(filterType, historic_data, period)
+            yield key, historic_data
 
 def main():
     
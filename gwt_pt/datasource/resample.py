@@ -1,11 +1,23 @@
 #! /usr/bin/python
 
+"""
+Session filtering and resampling of bars
+
+Works on the parsed epoch timestamps of a barArray with vectorised masks, so one fetch at the
+finest bar size can be rolled up into coarser bars locally instead of asking IB again:
+
+    bars_1h = ibkr.get_hist_data(ibcontract, "2 M", "1 hour")
+    bars_4h = resample_bars(bars_1h, "4 hours", "FX")
+
+Times of day are the gateway's wall clock, like the bar timestamps (see bar_store).
+"""
+
 import numpy as np
-import pandas as pd
 import os
-from pandas_datareader import data as web, wb
 
-from gwt_pt.datasource import ibkr 
+from gwt_pt.datasource import ibkr
+from gwt_pt.datasource import bar_store
+from gwt_pt.datasource.bar_array import barArray, COLUMNS
 
 import time
 import datetime
@@ -19,35 +31,157 @@ FILTER_DICT_HKFE = {
     "1 hour": ["09:15"]
 }
 
+## trading sessions as (start, end) times of day, an end before the start runs past midnight
+## None means trading round the clock
+SESSIONS = {
+    "FX": None,
+    "HKFE": [("09:15", "12:00"), ("13:00", "16:30"), ("17:15", "01:00")]
+}
+
+## pandas offset aliases for IB bar sizes, for resampling DataFrames
+BAR_SIZE_RULES = {
+    "1 secs": "1s", "5 secs": "5s", "10 secs": "10s", "15 secs": "15s", "30 secs": "30s",
+    "1 min": "1min", "2 mins": "2min", "3 mins": "3min", "5 mins": "5min", "10 mins": "10min",
+    "15 mins": "15min", "20 mins": "20min", "30 mins": "30min",
+    "1 hour": "1h", "2 hours": "2h", "3 hours": "3h", "4 hours": "4h", "8 hours": "8h",
+    "1 day": "1D"
+}
+
+def time_of_day(hhmm):
+    """
+    "09:15" as seconds after midnight
+    """
+    return int(hhmm[:2]) * 3600 + int(hhmm[3:5]) * 60
+
+def session_starts(ts, sessions):
+    """
+    Start (epoch seconds) of the session each bar falls in, -1 outside every session
+    :param ts: epoch seconds array
+    :param sessions: list of (start, end) times of day as in SESSIONS, or None for round the clock
+    """
+
+    ts = np.asarray(ts, dtype=np.int64)
+    seconds = ts % 86400
+    midnight = ts - seconds
+
+    if sessions is None:
+        return midnight
+
+    starts = np.full(len(ts), -1, dtype=np.int64)
+    for start, end in sessions:
+        start, end = time_of_day(start), time_of_day(end)
+        if start < end:
+            in_session = (seconds >= start) & (seconds < end)
+            starts[in_session] = midnight[in_session] + start
+        else:
+            ## runs past midnight, the part after midnight belongs to the previous day's session
+            evening = seconds >= start
+            morning = seconds < end
+            starts[evening] = midnight[evening] + start
+            starts[morning] = midnight[morning] - 86400 + start
+    return starts
+
+def session_filter(bars, exchange):
+    """
+    Only the bars which start inside the trading sessions of exchange
+    """
+
+    bars = barArray.from_tuples(bars)
+    if SESSIONS.get(exchange) is None:
+        return bars
+    return bars.select(session_starts(bars.ts, SESSIONS[exchange]) >= 0)
+
 def filter_data(type, ib_tuples, period):
+    """
+    Drop the partial bars IB returns at the listed times of day for this bar size
+    :return: barArray
+    """
 
     filter = filterDict = None
     if type == "FX":
         filterDict = FILTER_DICT_FX
     elif type == "HKFE":
         filterDict = FILTER_DICT_HKFE
-        
-    if period in filterDict:
+
+    bars = barArray.from_tuples(ib_tuples)
+
+    if filterDict and period in filterDict:
         filter = filterDict[period]
 
     if filter:
-        for f in filter:
-            ib_tuples = [i for i in ib_tuples if f not in i[0]]
-            
-    return ib_tuples
+        drop = [time_of_day(f) for f in filter]
+        bars = bars.select(~np.isin(bars.ts % 86400, drop))
+
+    return bars
+
+def resample_bars(bars, bar_size, exchange=None):
+    """
+    Roll bars up into a coarser bar size, eg. "1 min" into "5 mins" or "1 hour" into "4 hours"
+    Buckets are aligned to the start of each trading session of exchange (to midnight if there
+    are no sessions), and bars outside the sessions are dropped
+    :param bars: barArray (or list of tuples), in time order
+    :return: barArray, each bar stamped with the start of its bucket
+    """
+
+    bars = barArray.from_tuples(bars)
+    daily = bar_store.is_daily(bar_size)
+    seconds = bar_store.BAR_SECONDS[bar_size]
+
+    if len(bars) == 0:
+        return barArray(0, daily)
+
+    ts = bars.ts
+    starts = session_starts(ts, SESSIONS.get(exchange))
+    inside = starts >= 0
+    if not inside.all():
+        bars = bars.select(inside)
+        ts = bars.ts
+        starts = starts[inside]
+        if len(bars) == 0:
+            return barArray(0, daily)
+
+    if daily:
+        ## a trading day is the day its session started
+        bucket = starts - starts % 86400
+    else:
+        bucket = starts + (ts - starts) // seconds * seconds
+
+    ## first bar of each bucket, bars are in time order so buckets are contiguous
+    first = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    last = np.r_[first[1:], len(bucket)] - 1
+
+    values = bars.values
+    resampled = np.empty((len(first), len(COLUMNS)), dtype=np.float64)
+    resampled[:, 0] = values[first, 0]
+    resampled[:, 1] = np.maximum.reduceat(values[:, 1], first)
+    resampled[:, 2] = np.minimum.reduceat(values[:, 2], first)
+    resampled[:, 3] = values[last, 3]
+    resampled[:, 4] = np.add.reduceat(values[:, 4], first)
+
+    return barArray.from_arrays(bucket[first], resampled, daily)
+
+def resample_frame(historic_df, bar_size):
+    """
+    pandas version of resample_bars for an OHLCV DataFrame with a datetime index, aligned to midnight
+    """
+
+    aggregation = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+    resampled = historic_df.resample(BAR_SIZE_RULES[bar_size]).agg(aggregation)
+    return resampled.dropna(subset=['open'])
 
 def main():
-    
+
     passage = "Test............."
     print(passage)
-    
+
     symbol = "EUR"
     currency = "USD"
     duration = "2 M"
-    #period = "1 hour"
-    period = "4 hours"
-    
-    data = filter_data(ibkr.get_data(symbol, currency, duration, period), FILTER_DICT[period])
+
+    ## fetch once at 1 hour and derive the 4 hour bars locally
+    data = ibkr.get_hist_data(ibkr.fx_contract(symbol, currency), duration, "1 hour")
+    print(filter_data("FX", data, "1 hour"))
+    print(resample_bars(data, "4 hours", "FX"))
 
 if __name__ == "__main__":
-    main() 
+    main()
@@ -0,0 +1,244 @@
+#! /usr/bin/python
+
+"""
+Tick ingestion and on the fly aggregation into OHLCV bars
+
+Trades are written into preallocated NumPy ring buffers (tickBuffer) and rolled up into bars
+of any size (barAggregator). Completed bars are pushed to callbacks as the same
+(date, open, high, low, close, volume) tuples the historical data helpers return, so they can
+go straight into the incremental indicators:
+
+    stream = indicator_stream.macdstoc_stream().seed(historic_df)
+    aggregator = barAggregator(30, [indicator_callback(stream, on_row)])
+    ibkr.stream_ticks(ibcontract, [aggregator])
+
+ibkr.stream_ticks also starts the stream's clock, which closes bars on time when no trade comes
+(a quiet market, or the last bar before the lunch break).
+
+This is the production version of the tick / IBtick / stream_of_ticks demo in
+sample/IBAPItickdataexample.py.
+"""
+
+import calendar
+import datetime
+from threading import Lock, Thread, Event
+
+import numpy as np
+
+from gwt_pt.datasource import bar_store
+
+## IB tick types we build trades from (live and delayed)
+LAST_PRICE_TICKS = (4, 68)
+LAST_SIZE_TICKS = (5, 71)
+
+DEFAULT_CAPACITY = 65536
+
+## seconds between clock ticks closing bars without a trade
+CLOCK_INTERVAL = 1.0
+
+def now_ts():
+    """
+    Wall clock time in epoch seconds, local time treated as UTC like the bar store
+    """
+    now = datetime.datetime.now()
+    return calendar.timegm(now.timetuple()) + now.microsecond / 1e6
+
+class tickBuffer(object):
+    """
+    Fixed size ring buffer of trades, the oldest ticks are overwritten once it is full
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._ts = np.zeros(capacity, dtype=np.float64)
+        self._price = np.zeros(capacity, dtype=np.float64)
+        self._size = np.zeros(capacity, dtype=np.float64)
+        self._count = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, ts, price, size):
+
+        with self._lock:
+            idx = self._count % self.capacity
+            self._ts[idx] = ts
+            self._price[idx] = price
+            self._size[idx] = size
+            self._count += 1
+
+    def last(self, n=None):
+        """
+        The last n ticks (all we have if n is None) in time order
+        :return: (ts, price, size) arrays, copies
+        """
+
+        with self._lock:
+            available = min(self._count, self.capacity)
+            n = available if n is None else min(n, available)
+
+            end = self._count % self.capacity
+            idx = (np.arange(end - n, end)) % self.capacity
+            return self._ts[idx], self._price[idx], self._size[idx]
+
+class barAggregator(object):
+    """
+    Rolls trades up into bars of bar_seconds, aligned to the clock (a 30 second bar starts at :00 or :30)
+    """
+
+    def __init__(self, bar_seconds, callbacks=None, daily=False):
+        self.bar_seconds = bar_seconds
+        self.daily = daily
+        self._callbacks = list(callbacks or [])
+
+        self._start = None
+        self._open = self._high = self._low = self._close = None
+        self._volume = 0.0
+        ## trades and the clock come from different threads
+        self._lock = Lock()
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def _close_bar(self, ts):
+        ## the completed bar if ts is past it, cleared for the next one (lock held)
+
+        if self._start is None or ts < self._start + self.bar_seconds:
+            return None
+
+        bardata = (bar_store.format_ib_date(self._start, self.daily), self._open, self._high, self._low,
+                   self._close, self._volume)
+        self._start = None
+        return bardata
+
+    def _emit(self, bardata):
+
+        for callback in self._callbacks:
+            try:
+                callback(bardata)
+            except Exception as e:
+                print("Bar callback raised: [" + str(e) + "]")
+
+    def on_time(self, ts):
+        """
+        Close the current bar if the clock has moved past it, called by the tickStream clock so a
+        bar closes even without a new trade
+        """
+
+        with self._lock:
+            bardata = self._close_bar(ts)
+        if bardata is not None:
+            self._emit(bardata)
+
+    def on_trade(self, ts, price, size):
+
+        with self._lock:
+            bardata = self._close_bar(ts)
+
+            if self._start is None:
+                self._start = int(ts - ts % self.bar_seconds)
+                self._open = self._high = self._low = price
+                self._volume = 0.0
+            else:
+                if price > self._high:
+                    self._high = price
+                if price < self._low:
+                    self._low = price
+
+            self._close = price
+            self._volume += size
+
+        if bardata is not None:
+            self._emit(bardata)
+
+    def on_ticks(self, ts, price, size):
+        """
+        Feed a batch of ticks, eg. replayed out of a tickBuffer
+        """
+
+        for t, p, s in zip(ts, price, size):
+            self.on_trade(t, p, s)
+
+class tickStream(object):
+    """
+    Turns IB tickPrice / tickSize callbacks into trades, stores them and fans them out to aggregators
+    """
+
+    def __init__(self, tickerid, aggregators=None, capacity=DEFAULT_CAPACITY):
+        self.tickerid = tickerid
+        self.buffer = tickBuffer(capacity)
+        self._aggregators = list(aggregators or [])
+        self._last_price = None
+        ## a LAST price arrived that no LAST_SIZE has booked yet
+        self._trade_pending = False
+        self._on_close = None
+        self._clock = None
+        self._clock_stop = Event()
+
+    def add_aggregator(self, aggregator):
+        self._aggregators.append(aggregator)
+
+    def start_clock(self, interval=CLOCK_INTERVAL):
+        """
+        Tick the aggregators with the wall clock every interval seconds, so bars close on time
+        Only for live streams, replayed ticks carry their own time
+        """
+
+        if self._clock is not None:
+            return
+
+        def run():
+            while not self._clock_stop.wait(interval):
+                self.on_time(now_ts())
+
+        self._clock = Thread(target=run, name="tick-clock-%s" % self.tickerid)
+        self._clock.daemon = True
+        self._clock.start()
+
+    def on_time(self, ts):
+        for aggregator in self._aggregators:
+            aggregator.on_time(ts)
+
+    def on_price(self, tickType, price):
+        if tickType in LAST_PRICE_TICKS and price > 0:
+            self._last_price = price
+            self._trade_pending = True
+
+    def on_size(self, tickType, size):
+
+        ## IB sends the last size straight after the last price, a LAST_SIZE on its own
+        ## only revises the size of that trade and is not a new one
+        if tickType in LAST_SIZE_TICKS and self._trade_pending:
+            self._trade_pending = False
+            self.on_trade(now_ts(), self._last_price, size)
+
+    def on_trade(self, ts, price, size):
+
+        self.buffer.append(ts, price, size)
+        for aggregator in self._aggregators:
+            aggregator.on_trade(ts, price, size)
+
+    def close(self):
+        """
+        Cancel the market data subscription (and give back its share of the stream session)
+        """
+        self._clock_stop.set()
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+def indicator_callback(stream, on_row=None):
+    """
+    Bar callback which feeds each completed bar into an incremental indicator (common/indicator_stream)
+    :param stream: eg. macdstoc_stream
+    :param on_row: called with (bardata, indicator values) after each update
+    """
+
+    def callback(bardata):
+        date, open, high, low, close, volume = bardata
+        row = stream.update_bar(open, high, low, close)
+        if on_row is not None:
+            on_row(bardata, row)
+
+    return callback
@@ -0,0 +1,119 @@
+#! /usr/bin/python
+
+"""
+Resident alert daemon
+
+Runs the alert and strategy jobs from one long lived process instead of a cron entry per
+script, so Python, pandas, matplotlib, the config and the IB gateway sessions are set up once
+(and the bar store, chart workers and Telegram connections stay warm) rather than on every run:
+
+    python -m gwt_pt.execution.alert_daemon          # run until the daily restart
+    python -m gwt_pt.execution.alert_daemon list     # print the jobs and their next runs
+
+The daemon exits at RESTART_AT every day and is expected to be restarted by its supervisor,
+which also picks up new contract months and config changes.
+"""
+
+import sys
+import time
+import signal
+from threading import Event
+
+from gwt_pt.execution import scheduler
+from gwt_pt.execution.scheduler import cronScheduler, barSchedule, dailySchedule, SESSIONS
+from gwt_pt.charting import render_service
+from gwt_pt.datasource import ibkr
+from gwt_pt.telegram import bot_sender
+from gwt_pt.util import log_config
+
+## after the FX daily bar (05:00 / 06:00 HKT) and before the HKFE open
+RESTART_AT = "08:30"
+## IB's FX day ends at 17:00 New York time, 05:00 HKT in summer and 06:00 HKT in winter
+FX_DAILY_CLOSE_TZ = "America/New_York"
+STATS_INTERVAL = 3600
+
+def add_jobs(cron):
+    """
+    The jobs run by the daemon, what used to be the crontab
+    """
+
+    from gwt_pt.alert import macdstoc_alert
+    from gwt_pt.strategy import strat_ema_xover
+    from gwt_pt.strategy import strat_mkt_open_reversal
+
+    cron.add("macdstoc-hourly", macdstoc_alert.alert_hourly, barSchedule("1 hour", SESSIONS['IDEALPRO'], delay=30))
+    ## 20 minutes after the daily FX bar closes, Monday to Friday in New York
+    cron.add("macdstoc-daily", macdstoc_alert.alert_daily, dailySchedule("17:20", tz=FX_DAILY_CLOSE_TZ))
+    cron.add("ema-xover-MHI", strat_ema_xover.gen_alert, barSchedule("1 hour", SESSIONS['HKFE'], delay=20), "MHI")
+    ## it streams the trade trigger for 20 minutes after the signal, a late run is of no use
+    cron.add("mkt-open-reversal-MHI", strat_mkt_open_reversal.gen_alert, dailySchedule("09:20:30"), "MHI",
+             catch_up=scheduler.CATCH_UP_SKIP, grace=120)
+
+def print_stats(cron):
+
+    for name, stats in sorted(cron.stats().items()):
+        print("%-24s runs %d (%d failed, %d missed, %d overruns), mean %.3fs, p99 <= %ss, max %.3fs, "
+              "late p99 <= %ss, next %s" % (
+            name, stats['runs'], stats['failures'], stats['missed'], stats['overruns'], stats['mean_duration'],
+            stats['p99_duration'], stats['max_duration'], stats['p99_lateness'], stats['next_run']))
+
+def warm_up():
+    """
+    The start up costs paid once a day instead of on every run
+    """
+
+    start_time = time.time()
+
+    ## fork the chart workers before the IB and Telegram threads start
+    render_service.get_service().start()
+    ## connect a gateway session now rather than on the first job
+    with ibkr.hist_pool().session():
+        pass
+    bot_sender.get_queue()
+
+    print("Warm up took %.3fs" % (time.time() - start_time))
+
+def run(run_seconds=None):
+
+    stop = Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    cron = cronScheduler()
+    add_jobs(cron)
+    cron.add("restart", stop.set, dailySchedule(RESTART_AT, (0, 1, 2, 3, 4, 5, 6)))
+
+    warm_up()
+    cron.start()
+    print_stats(cron)
+
+    deadline = None if run_seconds is None else time.time() + run_seconds
+    try:
+        while not stop.is_set() and (deadline is None or time.time() < deadline):
+            stop.wait(STATS_INTERVAL if deadline is None else min(STATS_INTERVAL, max(deadline - time.time(), 0)))
+            print_stats(cron)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Alert daemon stopping, waiting for running jobs ......")
+        cron.stop()
+        print_stats(cron)
+        bot_sender.flush()
+
+def main(args):
+
+    start_time = time.time()
+
+    if (len(args) > 1 and args[1] == "list"):
+        cron = cronScheduler()
+        add_jobs(cron)
+        for job in cron.jobs():
+            print(job)
+        cron.stop()
+    else:
+        log_config.init_logging("alert_daemon")
+        run()
+
+    print("Time elapsed: " + "%.3f" % (time.time() - start_time) + "s")
+
+if __name__ == "__main__":
+    main(sys.argv)
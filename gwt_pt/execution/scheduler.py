@@ -0,0 +1,529 @@
+#! /usr/bin/python
+
+"""
+Session aware cron for the resident alert daemon
+
+Jobs fire on bar closes of an exchange session instead of on fixed crontab minutes:
+
+    scheduler = cronScheduler()
+    scheduler.add("macdstoc-hourly", macdstoc_alert.alert_hourly, barSchedule("1 hour", SESSIONS['IDEALPRO'], delay=30))
+    scheduler.add("mkt-open-reversal", strat_mkt_open_reversal.gen_alert, dailySchedule("09:20:30"), "MHI")
+    scheduler.start()
+
+- bar closes are clock aligned (IB's intraday bars are), only the ones of bars overlapping the
+  session fire, and a bar cut short by the session close fires at the close
+- a run that is late (the machine slept, the job before was slow) is still made for the latest
+  slot, the older missed slots are counted and dropped (catch_up=CATCH_UP_LAST), or all of
+  them are dropped once later than grace (CATCH_UP_SKIP)
+- a job never runs twice at the same time, a slot coming up while it is still running is
+  counted as an overrun and skipped
+- per job timings (runs, duration and start latency histograms, misses) are kept in stats()
+  and saved to the state store as SCHED:<job name> records for monitoring from other processes
+
+Due runs are kept on a timerWheel, so hundreds of monitors firing every few seconds cost a
+slot lookup each rather than a heap operation, and jobs with iterations stop by themselves:
+
+    cron.add("monitor-MHI", trade_monitor_hkfe, intervalSchedule(60.0), json_args, iterations=20, run_now=True)
+    cron.start().join()
+
+Times are local wall clock times, like the rest of the alerts the daemon assumes it runs on HKT.
+"""
+
+import time
+import bisect
+import datetime
+from zoneinfo import ZoneInfo
+from threading import Thread, Lock, Condition
+from concurrent.futures import ThreadPoolExecutor
+
+from gwt_pt.datasource import bar_store
+from gwt_pt.redis import redis_pool
+
+WORKERS = 4
+## timer wheel resolution and size, one turn is a minute
+TICK_SECONDS = 0.1
+WHEEL_SLOTS = 600
+GRACE_SECONDS = 300
+STATS_PREFIX = "SCHED"
+STATS_TTL = 7 * 86400
+
+CATCH_UP_LAST = "last"
+CATCH_UP_SKIP = "skip"
+
+WEEKDAYS = (0, 1, 2, 3, 4)
+
+def parse_time(time_str):
+    """
+    "HH:MM" or "HH:MM:SS" to a datetime.time
+    """
+    parts = [int(part) for part in time_str.split(":")]
+    return datetime.time(*parts)
+
+def epoch(dt):
+    """
+    Local naive datetime to epoch seconds
+    """
+    return time.mktime(dt.timetuple()) + dt.microsecond / 1e6
+
+def minutes(time_str):
+    hhmm = parse_time(time_str)
+    return hhmm.hour * 60 + hhmm.minute
+
+class tradingSession(object):
+    """
+    Weekly trading hours of an exchange
+    :param windows: list of (weekdays, "HH:MM" open, "HH:MM" close), a close before the open is
+                    on the next day
+    """
+
+    def __init__(self, name, windows):
+        self.name = name
+        self.windows = []
+        for days, start, end in windows:
+            start_min, end_min = minutes(start), minutes(end)
+            if end_min <= start_min:
+                end_min += 1440
+            for day in days:
+                self.windows.append((day, start_min, end_min))
+
+    def __repr__(self):
+        return "tradingSession %s" % self.name
+
+    def _window(self, dt):
+        """
+        (window open, window close) datetimes of the window dt is in, None if closed
+        """
+
+        day_minutes = dt.hour * 60 + dt.minute + (dt.second + dt.microsecond / 1e6) / 60.0
+        midnight = datetime.datetime.combine(dt.date(), datetime.time())
+        for day, start, end in self.windows:
+            for offset in (0, 1):
+                if (dt.weekday() - offset) % 7 == day and start <= day_minutes + offset * 1440 < end:
+                    base = midnight - datetime.timedelta(days=offset)
+                    return base + datetime.timedelta(minutes=start), base + datetime.timedelta(minutes=end)
+        return None
+
+    def is_open(self, dt):
+        return self._window(dt) is not None
+
+    def window_end(self, dt):
+        window = self._window(dt)
+        return window[1] if window else None
+
+    def next_open(self, dt):
+        """
+        dt if the session is open, else the next time it opens
+        """
+
+        if self.is_open(dt):
+            return dt
+
+        midnight = datetime.datetime.combine(dt.date(), datetime.time())
+        opens = [midnight + datetime.timedelta(days=offset, minutes=start)
+                 for offset in range(8) for day, start, end in self.windows
+                 if (dt.weekday() + offset) % 7 == day]
+        return min(start for start in opens if start > dt)
+
+## in HKT, FX / metals hours move by an hour with New York daylight saving, these are the winter ones
+SESSIONS = {
+    'HKFE': tradingSession('HKFE', [(WEEKDAYS, "09:15", "12:00"), (WEEKDAYS, "13:00", "16:30"),
+                                    (WEEKDAYS, "17:15", "01:00")]),
+    'IDEALPRO': tradingSession('IDEALPRO', [(WEEKDAYS, "06:15", "06:00")]),
+    'METAL': tradingSession('METAL', [(WEEKDAYS, "07:00", "06:00")]),
+}
+
+class barSchedule(object):
+    """
+    Every close of a bar_size bar while the session is open, delay seconds after it so IB has
+    the bar
+    """
+
+    def __init__(self, bar_size, session=None, delay=0):
+        self.bar_size = bar_size
+        self.bar = datetime.timedelta(seconds=bar_store.BAR_SECONDS[bar_size])
+        self.session = session
+        self.delay = datetime.timedelta(seconds=delay)
+
+    def __repr__(self):
+        return "every %s bar of %s" % (self.bar_size, self.session.name if self.session else "the clock")
+
+    def _boundary_after(self, dt):
+        midnight = datetime.datetime.combine(dt.date(), datetime.time())
+        return midnight + ((dt - midnight) // self.bar + 1) * self.bar
+
+    def next_after(self, dt):
+
+        close = self._boundary_after(dt - self.delay)
+        while True:
+            if self.session is None:
+                return close + self.delay
+
+            start = close - self.bar
+            if self.session.is_open(start):
+                ## the bar started in the session, it ends at the close or when the session does
+                fire = min(close, self.session.window_end(start)) + self.delay
+                if fire > dt:
+                    return fire
+                close = close + self.bar
+            elif self.session.is_open(close - datetime.timedelta(seconds=1)):
+                ## session opened part way through the bar
+                return close + self.delay
+            else:
+                close = self._boundary_after(self.session.next_open(close))
+
+class intervalSchedule(barSchedule):
+    """
+    Every cycle seconds on the clock (a 60s cycle fires on the minute), like a barSchedule
+    """
+
+    def __init__(self, cycle, session=None, delay=0):
+        self.bar_size = "%gs" % cycle
+        self.bar = datetime.timedelta(seconds=cycle)
+        self.session = session
+        self.delay = datetime.timedelta(seconds=delay)
+
+class dailySchedule(object):
+    """
+    Once a day at a fixed time, on weekdays (0 is Monday)
+    :param tz: time zone name the time and weekdays are in, eg. "America/New_York" for the FX
+               daily close, so it follows that zone's daylight saving; local time if None
+    """
+
+    def __init__(self, at, weekdays=WEEKDAYS, tz=None):
+        self.at = parse_time(at)
+        self.weekdays = weekdays
+        self.tz = None if tz is None else ZoneInfo(tz)
+
+    def __repr__(self):
+        return "daily at %s%s" % (self.at, "" if self.tz is None else " " + str(self.tz))
+
+    def next_after(self, dt):
+
+        ## dt is local wall clock time, naive datetimes are local to astimezone
+        start = dt.date() if self.tz is None else dt.astimezone(self.tz).date()
+        for offset in range(-1, 8):
+            day = start + datetime.timedelta(days=offset)
+            if self.tz is None:
+                fire = datetime.datetime.combine(day, self.at)
+            else:
+                fire = datetime.datetime.combine(day, self.at, tzinfo=self.tz).astimezone().replace(tzinfo=None)
+            if day.weekday() in self.weekdays and fire > dt:
+                return fire
+        return None
+
+class timerWheel(object):
+    """
+    Hashed timing wheel: a ring of slots of tick seconds each, a timer goes into the slot of its
+    tick and ones more than a turn away just stay there until their tick comes round. Adding a
+    timer and firing the due ones are O(1) per timer. Not thread safe, the owner locks
+    """
+
+    def __init__(self, tick=TICK_SECONDS, slots=WHEEL_SLOTS):
+        self.tick = tick
+        self.slots = slots
+        self._wheel = [[] for _ in range(slots)]
+        self._current = int(time.time() // tick)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, when, item):
+        """
+        :param when: epoch seconds, a time already past fires on the next tick
+        """
+
+        idx = max(int(-(-when // self.tick)), self._current + 1)
+        self._wheel[idx % self.slots].append((idx, item))
+        self._count += 1
+
+    def advance(self, now):
+        """
+        Move the wheel up to now
+        :return: items due, in the order of their ticks
+        """
+
+        target = int(now // self.tick)
+        if target <= self._current:
+            return []
+
+        due = []
+        ## after a long gap every slot is visited once, each holds all its due timers
+        for t in range(self._current + 1, self._current + min(target - self._current, self.slots) + 1):
+            slot = self._wheel[t % self.slots]
+            if slot:
+                keep = [timer for timer in slot if timer[0] > target]
+                due.extend(timer for timer in slot if timer[0] <= target)
+                self._wheel[t % self.slots] = keep
+
+        self._current = target
+        self._count -= len(due)
+        due.sort(key=lambda timer: timer[0])
+        return [item for _, item in due]
+
+    def next_wait(self, now):
+        """
+        Seconds until the next tick with a timer, or a turn if there is none within one
+        """
+
+        for t in range(self._current + 1, self._current + self.slots + 1):
+            if any(idx <= t for idx, _ in self._wheel[t % self.slots]):
+                return max(t * self.tick - now, 0.0)
+        return self.slots * self.tick
+
+class latencyHistogram(object):
+    """
+    Counts of durations by bucket (upper bounds in seconds)
+    """
+
+    BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+
+    def percentile(self, p):
+        """
+        Upper bound of the bucket holding the p-th percentile, inf past the last bucket
+        """
+
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.BOUNDS[idx] if idx < len(self.BOUNDS) else float("inf")
+        return float("inf")
+
+    def to_dict(self):
+        labels = ["<=%gs" % bound for bound in self.BOUNDS] + [">%gs" % self.BOUNDS[-1]]
+        return dict((label, count) for label, count in zip(labels, self.counts) if count)
+
+class jobStats(object):
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.missed = 0
+        self.overruns = 0
+        self.last_run = None
+        self.last_duration = 0.0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self.durations = latencyHistogram()
+        self.latencies = latencyHistogram()
+
+    def record(self, start, duration, lateness, ok):
+        self.runs += 1
+        if not ok:
+            self.failures += 1
+        self.last_run = start
+        self.last_duration = duration
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        self.last_lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.durations.record(duration)
+        self.latencies.record(lateness)
+
+    def to_dict(self):
+        return {'runs': self.runs, 'failures': self.failures, 'missed': self.missed, 'overruns': self.overruns,
+                'last_run': str(self.last_run), 'last_duration': round(self.last_duration, 3),
+                'mean_duration': round(self.total_duration / self.runs, 3) if self.runs else 0.0,
+                'max_duration': round(self.max_duration, 3), 'last_lateness': round(self.last_lateness, 3),
+                'max_lateness': round(self.max_lateness, 3),
+                'p50_duration': self.durations.percentile(50), 'p99_duration': self.durations.percentile(99),
+                'p50_lateness': self.latencies.percentile(50), 'p99_lateness': self.latencies.percentile(99),
+                'duration_histogram': self.durations.to_dict(), 'lateness_histogram': self.latencies.to_dict()}
+
+class cronJob(object):
+
+    def __init__(self, name, fn, schedule, args=(), catch_up=CATCH_UP_LAST, grace=GRACE_SECONDS, iterations=None):
+        self.name = name
+        self.fn = fn
+        self.schedule = schedule
+        self.args = args
+        self.catch_up = catch_up
+        self.grace = datetime.timedelta(seconds=grace)
+        self.iterations = iterations
+
+        self.next_run = None
+        self.running = False
+        self.started = 0
+        self.stats = jobStats()
+
+    def __repr__(self):
+        return "cronJob %s (%s) next %s" % (self.name, self.schedule, self.next_run)
+
+    def done(self):
+        return self.next_run is None and not self.running
+
+class cronScheduler(object):
+    """
+    Runs cronJobs on a thread pool, see the module docstring
+    """
+
+    def __init__(self, workers=WORKERS, save_stats=True, tick=TICK_SECONDS):
+        self.save_stats = save_stats
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cron")
+        self._jobs = {}
+        self._wheel = timerWheel(tick)
+        self._cond = Condition(Lock())
+        self._stopped = False
+        self._thread = None
+
+    def add(self, name, fn, schedule, *args, catch_up=CATCH_UP_LAST, grace=GRACE_SECONDS, iterations=None,
+            run_now=False):
+        """
+        :param iterations: stop after this many runs, None to keep going
+        :param run_now: first run straight away rather than at the first slot of the schedule
+        :return: the cronJob
+        """
+
+        job = cronJob(name, fn, schedule, args, catch_up, grace, iterations)
+        now = datetime.datetime.now()
+        with self._cond:
+            self._jobs[name] = job
+            self._push(job, now if run_now else schedule.next_after(now))
+            self._cond.notify_all()
+        return job
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def _push(self, job, next_run):
+        ## lock held
+        if job.iterations is not None and job.started >= job.iterations:
+            next_run = None
+        job.next_run = next_run
+        if next_run is not None:
+            self._wheel.add(epoch(next_run), (next_run, job))
+
+    def _due(self, job, now):
+        """
+        Slot to run for a job which has come due and the run after it, the missed slots in
+        between are counted (lock held)
+        :return: (slot or None to skip it, following)
+        """
+
+        slot = job.next_run
+        following = job.schedule.next_after(slot)
+        while following is not None and following <= now:
+            job.stats.missed += 1
+            print("Job %s missed its %s run" % (job.name, slot))
+            slot, following = following, job.schedule.next_after(following)
+
+        if job.catch_up == CATCH_UP_SKIP and now - slot > job.grace:
+            job.stats.missed += 1
+            print("Job %s skipped its %s run, %s late" % (job.name, slot, now - slot))
+            return None, following
+        return slot, following
+
+    def _fire(self, job, now):
+        ## lock held
+
+        slot, following = self._due(job, now)
+        if slot is not None and job.running:
+            ## the run before has overrun into this slot
+            job.stats.overruns += 1
+            print("Job %s overran, still running at its %s run" % (job.name, slot))
+            slot = None
+
+        if slot is not None:
+            job.started += 1
+            job.running = True
+            self._executor.submit(self._execute, job, slot)
+
+        self._push(job, following)
+
+    def _run(self):
+
+        with self._cond:
+            while not self._stopped:
+                due = self._wheel.advance(time.time())
+                if not due:
+                    self._cond.wait(self._wheel.next_wait(time.time()))
+                    continue
+
+                now = datetime.datetime.now()
+                for next_run, job in due:
+                    if self._jobs.get(job.name) is job and job.next_run == next_run:
+                        self._fire(job, now)
+
+    def _execute(self, job, slot):
+
+        start = datetime.datetime.now()
+        lateness = (start - slot).total_seconds()
+        start_time = time.time()
+        ok = False
+        print("Job %s starts for %s (%.1fs late)" % (job.name, slot, lateness))
+        try:
+            job.fn(*job.args)
+            ok = True
+        except Exception as e:
+            print("Job %s failed: [%s]" % (job.name, e))
+        finally:
+            duration = time.time() - start_time
+            with self._cond:
+                job.running = False
+                job.stats.record(start, duration, lateness, ok)
+                stats = job.stats.to_dict()
+                self._cond.notify_all()
+            print("Job %s took %.3fs, next at %s" % (job.name, duration, job.next_run))
+
+        if self.save_stats:
+            try:
+                redis_pool.get_store().save_records(STATS_PREFIX, {job.name: stats}, STATS_TTL)
+            except Exception as e:
+                print("Saving stats of job %s failed: [%s]" % (job.name, e))
+
+    def stats(self):
+        """
+        :return: dict of job name to its timings
+        """
+
+        with self._cond:
+            return dict((name, dict(job.stats.to_dict(), next_run=str(job.next_run)))
+                        for name, job in self._jobs.items())
+
+    def join(self, timeout=None):
+        """
+        Wait for the jobs with iterations to finish them
+        :return: True if they all did within timeout
+        """
+
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while not all(job.done() for job in self._jobs.values() if job.iterations is not None):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def start(self):
+        self._thread = Thread(target=self._run, name="cron", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        """
+        Stop firing jobs, with wait also let the running ones finish
+        """
+
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=wait)
@@ -3,11 +3,13 @@
 import numpy as np
 import pandas as pd
 import os
-from pandas_datareader import data as web, wb
 
 from gwt_pt.datasource import ibkr 
+from gwt_pt.datasource import bar_array
 from gwt_pt.telegram import bot_sender
-from gwt_pt.charting import btplot
+from gwt_pt.redis import stream_bus
+from gwt_pt.execution import scheduler
+from gwt_pt.util import log_config
 
 import time
 import datetime
@@ -15,24 +17,16 @@ import logging, sys
 
 LOGFILE_ENABLED = False
 
-if (os.name == 'nt'):
-    logfile = 'C:\\Users\\Hin\\eggyolktech\\gwtPT\\gwt_pt\\log\\trade_executor.log'
-else:
-    logfile = '/app/gwtPT/gwt_pt/log/trade_executor_%s.log' % datetime.datetime.today().strftime('%m%d-%H%M%S')
-
-logging.basicConfig(filename=logfile, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger()
 
-if LOGFILE_ENABLED:
-    sys.stderr.write = lambda s: logger.error(s)
-    sys.stdout.write = lambda s: logger.info(s)
-
 EL = "\n"
 DEL = "\n\n"
 
 MONITOR_PERIOD = 20
 SLEEP_PERIOD = 8
 
+BUS_GROUP = "trade-monitor"
+
 LAST_TDAY_DICT = { 
     'Jan-17': 26,
     'Feb-17': 27,
@@ -60,46 +54,24 @@ LAST_TDAY_DICT = {
     'Dec-18': 28
 }
 
-def trade_monitor_hkfe(json_args):     
-
-    symbol = json_args['symbol']
-    duration = json_args['duration']
-    period = json_args['period']
-    signal = json_args['signal']
+def check_trade_trigger(signal, bar):
+    """
+    Checks one completed bar against the gap reversal signal
+    :param signal: {'date': '2018-04-06', 'gap': 'UP', 'trigger': 30064.0}
+    :param bar: (datetime, open, high, low, close)
+    :return: alert message, empty if the trigger is not hit
+    """
 
     signal_gap = signal['gap']
     signal_date = signal['date']
     signal_trigger = "%.0f" % signal['trigger']
-    
-    current_mth = get_contract_month()
-    #current_mth = "201802"
-    title = symbol + "@" + period + " (Contract: " + current_mth + ")"
-    print("Checking on " + title + " ......")
 
-    historic_data = ibkr.get_hkfe_data(current_mth, symbol, duration, period)
-    
-    if (not historic_data):
-        print("Historic Data is empty!!!")
-        return
+    lts = str(bar[0])
+    ldt = lts.split()[0]
+    lclose = "%.0f" % bar[4]
 
-    # Data pre-processing
-    bars = pd.DataFrame(historic_data, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
-    bars.set_index('datetime', inplace=True)
-    bars.index = pd.to_datetime(bars.index)
-    
-    print(bars.tail())
-    
-    latest_bar = bars.iloc[-2:].head(1)
-    lts = str(latest_bar.index[0])
-    ldt = str(latest_bar.index[0]).split()[0]
-    lrec = latest_bar.iloc[0]
-    lopen = "%.0f" % lrec['open']
-    lhigh = "%.0f" % lrec['high']
-    llow = "%.0f" % lrec['low']
-    lclose = "%.0f" % lrec['close']    
-    
     print("\nSignal:[\n%s]" % signal)
-    print("\nLast Bar:[\n%s]" % latest_bar)
+    print("\nLast Bar:[\n%s]" % (bar,))
     print("Last Bar Date: [%s]" % ldt)
     
     # Test case {'date': '2018-04-06', 'gap': 'UP', 'trigger': 30064.0}
@@ -125,13 +97,109 @@ def trade_monitor_hkfe(json_args):
             print("Signal Gap is invalid: [%s]" % signal_gap)  
     else:
         print("Signal Date Check Failed [%s / %s]" % (ldt, signal_date))
+
+    return message
+
+def trade_monitor_hkfe(json_args):     
+
+    symbol = json_args['symbol']
+    duration = json_args['duration']
+    period = json_args['period']
+    signal = json_args['signal']
+    
+    current_mth = get_contract_month()
+    #current_mth = "201802"
+    title = symbol + "@" + period + " (Contract: " + current_mth + ")"
+    print("Checking on " + title + " ......")
+
+    historic_data = ibkr.get_hkfe_data(current_mth, symbol, duration, period)
+    
+    if (not historic_data):
+        print("Historic Data is empty!!!")
+        return
+
+    # Data pre-processing
+    bars = bar_array.to_frame(historic_data)
+    
+    print(bars.tail())
     
+    latest_bar = bars.iloc[-2:].head(1)
+    lrec = latest_bar.iloc[0]
+
+    message = check_trade_trigger(signal, (latest_bar.index[0], lrec['open'], lrec['high'], lrec['low'], lrec['close']))
        
     if (message):
         print(message)
         #bot_sender.broadcast_list(message, "telegram-chat-test")   
         bot_sender.broadcast_list(message, "telegram-pt")
 
+def stream_monitor_hkfe(json_args, run_seconds=1200):
+    """
+    Event driven version of trade_monitor_hkfe, checks each bar the moment it completes
+    instead of re-downloading the whole duration every cycle
+    """
+
+    symbol = json_args['symbol']
+    duration = json_args['duration']
+    period = json_args['period']
+    signal = json_args['signal']
+
+    current_mth = get_contract_month()
+    title = symbol + "@" + period + " (Contract: " + current_mth + ")"
+    print("Streaming " + title + " for %s seconds ......" % run_seconds)
+
+    def on_bar(bardata):
+        bar = (pd.to_datetime(bardata[0]),) + tuple(bardata[1:])
+        message = check_trade_trigger(signal, bar)
+        if (message):
+            print(message)
+            bot_sender.broadcast_list(message, "telegram-pt")
+
+    subscription = ibkr.stream_hkfe_data(current_mth, symbol, duration, period, [on_bar])
+    try:
+        time.sleep(run_seconds)
+    finally:
+        subscription.close()
+
+def bus_monitor_hkfe(json_args, run_seconds=1200):
+    """
+    Version of stream_monitor_hkfe fed by the bar ingest process over the message bus instead of
+    its own IB subscription, new reversal signals published by strat_mkt_open_reversal replace
+    the one it started with
+    """
+
+    symbol = json_args['symbol']
+    period = json_args['period']
+    signal = dict(json_args['signal'])
+
+    print("Monitoring " + symbol + "@" + period + " bars from the bus for %s seconds ......" % run_seconds)
+
+    def on_signal(message):
+        if (message['strategy'] == "MRS" and message['symbol'] == symbol):
+            print("New signal: [%s]" % message['signal'])
+            signal.update(message['signal'])
+
+    def on_bar(message):
+        if (message['symbol'] != symbol or message['bar_size'] != period):
+            return
+        bardata = message['bar']
+        bar = (pd.to_datetime(bardata[0]),) + tuple(bardata[1:])
+        message = check_trade_trigger(signal, bar)
+        if (message):
+            print(message)
+            bot_sender.broadcast_list(message, "telegram-pt")
+
+    bus = stream_bus.get_bus()
+    consumer_name = stream_bus.consumer_name()
+    consumers = [stream_bus.streamConsumer(bus, stream_bus.SIGNALS_STREAM, BUS_GROUP, consumer_name, on_signal).start(),
+                 stream_bus.streamConsumer(bus, stream_bus.BARS_STREAM, BUS_GROUP, consumer_name, on_bar).start()]
+    try:
+        time.sleep(run_seconds)
+    finally:
+        for consumer in consumers:
+            consumer.stop()
+            print(consumer)
+
 def get_contract_month():
 
     now = datetime.datetime.now()
@@ -153,15 +221,33 @@ def get_contract_month():
         
 def strat_scheduler(function, json_args, cycle=10.0, iterations=10):
 
-    starttime=time.time()
-    
-    print("Scheduler starts at %s" % time.ctime(int(starttime)))
-    runcount = 0
-    while (runcount < iterations):
-        print("Iteration %s runs at %s" % (runcount+1, time.ctime(int(time.time()))))
-        function( json_args )
-        time.sleep(cycle - ((time.time() - starttime) % cycle))
-        runcount = runcount + 1
+    monitor_scheduler([(function, json_args)], cycle, iterations)
+
+def monitor_scheduler(monitors, cycle=10.0, iterations=10):
+    """
+    Run several monitors side by side, each every cycle seconds on the clock (first run straight
+    away), until each has run iterations times. A run still going at its next cycle is reported as
+    an overrun and that cycle skipped rather than drifting
+    :param monitors: list of (function, json_args)
+    """
+
+    cron = scheduler.cronScheduler(workers=max(len(monitors), 1), save_stats=False)
+    print("Scheduler starts at %s" % time.ctime(int(time.time())))
+
+    for idx, (function, json_args) in enumerate(monitors):
+        name = "%s-%s" % (function.__name__, json_args.get('symbol', idx) if isinstance(json_args, dict) else idx)
+        cron.add(name, function, scheduler.intervalSchedule(cycle), json_args, iterations=iterations, run_now=True)
+
+    cron.start()
+    try:
+        cron.join()
+    finally:
+        cron.stop()
+
+    for name, stats in sorted(cron.stats().items()):
+        print("%s: %d runs (%d failed, %d overruns), duration p50 <= %ss p99 <= %ss, late p99 <= %ss" % (
+            name, stats['runs'], stats['failures'], stats['overruns'], stats['p50_duration'],
+            stats['p99_duration'], stats['p99_lateness']))
 
 def testfun(json_args={}):
 
@@ -170,9 +256,15 @@ def testfun(json_args={}):
 def main(args):
     
     start_time = time.time()
+    log_config.init_logging("trade_executor", LOGFILE_ENABLED)
     
     json_args = {"symbol": "MHI", "duration": "28800 S", "period": "1 min", "signal": {"date": "2018-04-06", "gap": "UP", "trigger": 30064.0}}
-    strat_scheduler(trade_monitor_hkfe, json_args, 60.0, 3)
+    if (len(args) > 1 and args[1] == "stream"):
+        stream_monitor_hkfe(json_args, 180)
+    elif (len(args) > 1 and args[1] == "bus"):
+        bus_monitor_hkfe(json_args, 180)
+    else:
+        strat_scheduler(trade_monitor_hkfe, json_args, 60.0, 3)
     
     print("Time elapsed: " + "%.3f" % (time.time() - start_time) + "s")    
 
@@ -1,37 +1,313 @@
 #! /usr/bin/python
 
-import pandas as pd
-import datetime
-from datetime import tzinfo, timedelta, datetime
+"""
+Shared state store
+
+Signal states ("DS:EUR/USD", "MRS:MHI", ...) live in Redis. The store batches what the scans
+need into single round trips:
+
+    store = redis_pool.get_store()
+    states = store.mget(["DS:" + cur for cur in CURRENCY_PAIR])             # one MGET
+    store.mset({"DS:EUR/USD": "XUP since 2018-10-17", ...}, ttl=86400 * 7) # one pipeline
+    store.save_records("POS", {"MHI": {'qty': 1, 'avg': 27950.0}})           # HSETs, one pipeline
+    records = store.load_records("POS", ["MHI", "HSI"])
+
+Values go through a codec: 'raw' (bytes back, as getV always returned), 'json', or 'msgpack'
+when it is installed.
+
+The alerts run as separate processes (the daily scan writes the DS: states the hourly one
+reads), so when the redis package is missing or the server does not answer, connecting raises.
+An in-process memoryStore with the same interface, which shares nothing between processes, is
+only used when asked for: connect(fallback=True), or fallback=true in the config for a single
+process set up like the alert daemon.
+
+Connection settings come from the optional [redis] host / port / db / fallback config entries.
+"""
+
+import json
 import time
-import os
+from threading import Lock
+
+from gwt_pt.util import config_loader
+
+## the redis and msgpack packages, imported on first use (None if not installed)
+redis = None
+msgpack = None
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 6379
+DEFAULT_DB = 0
+
+def import_redis():
+    """
+    :return: the redis module, None if it is not installed
+    """
+
+    global redis
+    if redis is None:
+        try:
+            import redis as redis_module
+        except ImportError:
+            return None
+        redis = redis_module
+    return redis
+
+def _msgpack():
+
+    global msgpack
+    if msgpack is None:
+        try:
+            import msgpack as msgpack_module
+        except ImportError:
+            raise ImportError("msgpack codec needs the msgpack package")
+        msgpack = msgpack_module
+    return msgpack
+
+def encode(value, codec='raw'):
+
+    if codec == 'json':
+        return json.dumps(value).encode('utf-8')
+    if codec == 'msgpack':
+        return _msgpack().packb(value, use_bin_type=True)
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+def decode(data, codec='raw'):
+
+    if data is None:
+        return None
+    if codec == 'json':
+        return json.loads(data.decode('utf-8'))
+    if codec == 'msgpack':
+        return _msgpack().unpackb(data, raw=False)
+    return data
+
+def make_key(prefix, name):
+    """
+    Typed key, eg. make_key("DS", "EUR/USD") -> "DS:EUR/USD"
+    """
+    return prefix + ":" + name
+
+class stateStore(object):
+    """
+    Interface of the state stores, values encoded with codec ('raw', 'json' or 'msgpack')
+    and ttl in seconds (None to keep)
+    """
+
+    def get(self, key, codec='raw'):
+        return self.mget([key], codec)[0]
+
+    def set(self, key, value, ttl=None, codec='raw'):
+        self.mset({key: value}, ttl, codec)
+
+    def mget(self, keys, codec='raw'):
+        """
+        :return: list of values in the order of keys, None for missing ones
+        """
+        raise NotImplementedError()
+
+    def mset(self, mapping, ttl=None, codec='raw'):
+        raise NotImplementedError()
+
+    def delete(self, *keys):
+        raise NotImplementedError()
+
+    def save_records(self, prefix, records, ttl=None, codec='json'):
+        """
+        One hash per name, eg. prefix "POS" and {"MHI": {'qty': 1}} -> HSET POS:MHI qty 1
+        :param records: dict of name to dict of field values
+        """
+        raise NotImplementedError()
+
+    def load_records(self, prefix, names, codec='json'):
+        """
+        :return: dict of name to dict of field values, empty dicts for missing names
+        """
+        raise NotImplementedError()
+
+class redisStore(stateStore):
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, db=DEFAULT_DB):
+        self.pool = redis.ConnectionPool(host=host, port=port, db=db)
+        self.server = redis.Redis(connection_pool=self.pool)
+
+    def __repr__(self):
+        return "redisStore %s" % self.pool
 
-import traceback
-import logging
-import sys
+    def ping(self):
+        return self.server.ping()
 
-import redis
+    def mget(self, keys, codec='raw'):
+        if not keys:
+            return []
+        return [decode(data, codec) for data in self.server.mget(keys)]
 
-POOL = redis.ConnectionPool(host='localhost', port=6379, db=0)
+    def mset(self, mapping, ttl=None, codec='raw'):
+
+        if not mapping:
+            return
+        if ttl is None:
+            self.server.mset(dict((key, encode(value, codec)) for key, value in mapping.items()))
+            return
+
+        pipe = self.server.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, encode(value, codec), ex=int(ttl))
+        pipe.execute()
+
+    def delete(self, *keys):
+        if keys:
+            self.server.delete(*keys)
+
+    def save_records(self, prefix, records, ttl=None, codec='json'):
+
+        if not records:
+            return
+
+        pipe = self.server.pipeline(transaction=False)
+        for name, fields in records.items():
+            key = make_key(prefix, name)
+            pipe.hset(key, mapping=dict((field, encode(value, codec)) for field, value in fields.items()))
+            if ttl is not None:
+                pipe.expire(key, int(ttl))
+        pipe.execute()
+
+    def load_records(self, prefix, names, codec='json'):
+
+        pipe = self.server.pipeline(transaction=False)
+        for name in names:
+            pipe.hgetall(make_key(prefix, name))
+
+        records = {}
+        for name, fields in zip(names, pipe.execute()):
+            records[name] = dict((field.decode('utf-8'), decode(value, codec)) for field, value in fields.items())
+        return records
+
+class memoryStore(stateStore):
+    """
+    In-process stand-in for redisStore, values kept encoded so both behave the same
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._values = {}
+        self._expiry = {}
+
+    def __repr__(self):
+        return "memoryStore (%d keys)" % len(self._values)
+
+    def _live(self, key, now):
+        ## drop the key once its ttl is up (lock held)
+        if key in self._expiry and self._expiry[key] <= now:
+            self._values.pop(key, None)
+            del self._expiry[key]
+        return key in self._values
+
+    def _put(self, key, value, ttl, now):
+        self._values[key] = value
+        if ttl is None:
+            self._expiry.pop(key, None)
+        else:
+            self._expiry[key] = now + ttl
+
+    def mget(self, keys, codec='raw'):
+        now = time.time()
+        with self._lock:
+            return [decode(self._values[key], codec) if self._live(key, now) else None for key in keys]
+
+    def mset(self, mapping, ttl=None, codec='raw'):
+        now = time.time()
+        with self._lock:
+            for key, value in mapping.items():
+                self._put(key, encode(value, codec), ttl, now)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+                self._expiry.pop(key, None)
+
+    def save_records(self, prefix, records, ttl=None, codec='json'):
+        now = time.time()
+        with self._lock:
+            for name, fields in records.items():
+                key = make_key(prefix, name)
+                record = dict(self._values[key]) if self._live(key, now) else {}
+                record.update((field, encode(value, codec)) for field, value in fields.items())
+                self._put(key, record, ttl if ttl is not None else self._remaining(key, now), now)
+
+    def _remaining(self, key, now):
+        ## like HSET, an update keeps the key's ttl
+        return self._expiry[key] - now if key in self._expiry else None
+
+    def load_records(self, prefix, names, codec='json'):
+        now = time.time()
+        with self._lock:
+            records = {}
+            for name in names:
+                key = make_key(prefix, name)
+                fields = self._values[key] if self._live(key, now) else {}
+                records[name] = dict((field, decode(value, codec)) for field, value in fields.items())
+            return records
+
+_STORE = None
+_STORE_LOCK = Lock()
+
+def connect(fallback=None):
+    """
+    A redisStore for the configured server
+    :param fallback: use a memoryStore if Redis is not available, the [redis] fallback config entry
+                     (false by default) if None
+    :return: redisStore, or memoryStore with fallback
+    """
+
+    config = config_loader.load()
+    if fallback is None:
+        fallback = config.getboolean("redis", "fallback", fallback=False)
+
+    if import_redis() is None:
+        if not fallback:
+            raise ImportError("redis package not installed (set [redis] fallback=true for an in-process state store)")
+        print("redis package not installed, using an in-process state store")
+        return memoryStore()
+
+    store = redisStore(config.get("redis", "host", fallback=DEFAULT_HOST),
+                       config.getint("redis", "port", fallback=DEFAULT_PORT),
+                       config.getint("redis", "db", fallback=DEFAULT_DB))
+    try:
+        store.ping()
+    except redis.exceptions.RedisError as e:
+        if not fallback:
+            raise
+        print("Redis not available [%s], using an in-process state store" % e)
+        return memoryStore()
+    return store
+
+def get_store(fallback=None):
+    """
+    The process wide state store, connected on first use (and again on the next call if that failed)
+    :param fallback: as in connect
+    """
+
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = connect(fallback)
+        return _STORE
 
 def getV(variable_name):
-    my_server = redis.Redis(connection_pool=POOL)
-    response = my_server.get(variable_name)
-    return response
+    return get_store().get(variable_name)
 
 def setV(variable_name, variable_value):
-    my_server = redis.Redis(connection_pool=POOL)
-    my_server.set(variable_name, variable_value)
+    get_store().set(variable_name, variable_value)
 
 def main():
 
     print("main....")
-    end = datetime.today()
-    start = end - timedelta(days=(1*365))
-    
+
     #setV("Winston", "test")
     print(getV("Winston"))
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,370 @@
+#! /usr/bin/python
+
+"""
+Message bus on Redis Streams
+
+One ingest process publishes bars (and the strategies their signals), any number of consumers
+read them through consumer groups: every group sees every message, the consumers of a group
+share its messages between them, and a message stays pending until its consumer acks it, so
+whatever a crashed consumer had in hand is picked up again (claim_stale) rather than lost.
+
+    bus = stream_bus.get_bus()
+    bus.publish(stream_bus.BARS_STREAM, {'symbol': 'MHI', 'bar_size': '1 min', 'bar': [...]})
+
+    consumer = stream_bus.streamConsumer(bus, stream_bus.BARS_STREAM, "trade-monitor", "worker-1", on_bar)
+    consumer.start()
+
+Messages are dicts, JSON encoded into the entry's 'data' field. When the state store falls back
+to a memoryStore ([redis] fallback), the in-process memoryBus does the same within one process.
+"""
+
+import json
+import time
+import bisect
+import socket
+import os
+from collections import OrderedDict
+from threading import Thread, Lock, Condition, Event
+
+from gwt_pt.redis import redis_pool
+
+BARS_STREAM = "STREAM:BARS"
+SIGNALS_STREAM = "STREAM:SIGNALS"
+ALERTS_STREAM = "STREAM:ALERTS"
+
+## entries kept per stream, older ones are trimmed (approximately, on Redis)
+MAX_LEN = 100000
+
+READ_COUNT = 100
+BLOCK_MS = 1000
+## pending messages idle this long are taken over from their (presumably dead) consumer
+CLAIM_IDLE_MS = 60000
+## deliveries of a message its handler keeps failing on before it is dropped
+MAX_ATTEMPTS = 5
+
+def encode_message(message):
+    return {'data': json.dumps(message)}
+
+def decode_message(fields):
+    data = fields.get(b'data', fields.get('data'))
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+def consumer_name():
+    """
+    Default consumer name, unique per process
+    """
+    return "%s-%d" % (socket.gethostname(), os.getpid())
+
+class streamBus(object):
+    """
+    Interface of the buses, messages are returned as lists of (message id, dict)
+    """
+
+    def publish(self, stream, message):
+        """
+        :return: message id
+        """
+        raise NotImplementedError()
+
+    def create_group(self, stream, group, start="$"):
+        """
+        Create the consumer group if it does not exist yet
+        :param start: "$" for messages published from now on, "0" for the whole stream
+        """
+        raise NotImplementedError()
+
+    def read_group(self, stream, group, consumer, count=READ_COUNT, block_ms=None, new=True):
+        """
+        :param new: messages not yet delivered to the group, or with new=False the ones
+                    delivered to this consumer and not acked yet (after a restart)
+        :param block_ms: wait this long for new messages, None to return at once
+        """
+        raise NotImplementedError()
+
+    def ack(self, stream, group, *ids):
+        raise NotImplementedError()
+
+    def claim_stale(self, stream, group, consumer, min_idle_ms=CLAIM_IDLE_MS, count=READ_COUNT):
+        """
+        Take over messages left pending by other consumers for at least min_idle_ms
+        """
+        raise NotImplementedError()
+
+    def pending_count(self, stream, group):
+        raise NotImplementedError()
+
+class redisBus(streamBus):
+
+    def __init__(self, server, max_len=MAX_LEN):
+        self.server = server
+        self.max_len = max_len
+
+    def __repr__(self):
+        return "redisBus %s" % self.server
+
+    def publish(self, stream, message):
+        message_id = self.server.xadd(stream, encode_message(message), maxlen=self.max_len, approximate=True)
+        return message_id.decode() if isinstance(message_id, bytes) else message_id
+
+    def create_group(self, stream, group, start="$"):
+        try:
+            self.server.xgroup_create(stream, group, id=start, mkstream=True)
+        except redis_pool.redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _messages(self, entries):
+        return [(message_id.decode() if isinstance(message_id, bytes) else message_id, decode_message(fields))
+                for message_id, fields in entries if fields]
+
+    def read_group(self, stream, group, consumer, count=READ_COUNT, block_ms=None, new=True):
+        reply = self.server.xreadgroup(group, consumer, {stream: ">" if new else "0"}, count=count,
+                                       block=block_ms if new else None)
+        return self._messages(reply[0][1]) if reply else []
+
+    def ack(self, stream, group, *ids):
+        return self.server.xack(stream, group, *ids) if ids else 0
+
+    def claim_stale(self, stream, group, consumer, min_idle_ms=CLAIM_IDLE_MS, count=READ_COUNT):
+        reply = self.server.xautoclaim(stream, group, consumer, min_idle_ms, count=count)
+        return self._messages(reply[1])
+
+    def pending_count(self, stream, group):
+        return self.server.xpending(stream, group)['pending']
+
+class memoryStream(object):
+
+    def __init__(self):
+        self.ids = []
+        self.entries = []
+        ## group -> [last delivered id, OrderedDict of pending id -> [consumer, delivery time]]
+        self.groups = {}
+
+    def find(self, message_id):
+        idx = bisect.bisect_left(self.ids, message_id)
+        if idx < len(self.ids) and self.ids[idx] == message_id:
+            return self.entries[idx]
+        return None
+
+class memoryBus(streamBus):
+    """
+    In-process stand-in for redisBus with the same delivery and ack semantics
+    """
+
+    def __init__(self, max_len=MAX_LEN):
+        self.max_len = max_len
+        self._streams = {}
+        self._cond = Condition(Lock())
+        self._last_id = (0, 0)
+
+    def __repr__(self):
+        return "memoryBus %s" % dict((name, len(stream.ids)) for name, stream in self._streams.items())
+
+    def _stream(self, name):
+        if name not in self._streams:
+            self._streams[name] = memoryStream()
+        return self._streams[name]
+
+    def _group(self, stream, group):
+        try:
+            return self._streams[stream].groups[group]
+        except KeyError:
+            raise KeyError("NOGROUP no consumer group %s for stream %s" % (group, stream))
+
+    def publish(self, stream, message):
+
+        with self._cond:
+            ## ids as Redis makes them: milliseconds-sequence, always increasing
+            ms = int(time.time() * 1000)
+            self._last_id = (ms, 0) if ms > self._last_id[0] else (self._last_id[0], self._last_id[1] + 1)
+
+            entries = self._stream(stream)
+            entries.ids.append(self._last_id)
+            entries.entries.append(json.loads(json.dumps(message)))
+            if len(entries.ids) > self.max_len:
+                del entries.ids[:-self.max_len]
+                del entries.entries[:-self.max_len]
+
+            self._cond.notify_all()
+            return "%d-%d" % self._last_id
+
+    def create_group(self, stream, group, start="$"):
+
+        with self._cond:
+            entries = self._stream(stream)
+            if group not in entries.groups:
+                last = entries.ids[-1] if (start == "$" and entries.ids) else (0, 0)
+                entries.groups[group] = [last, OrderedDict()]
+
+    def read_group(self, stream, group, consumer, count=READ_COUNT, block_ms=None, new=True):
+
+        deadline = time.time() + (block_ms or 0) / 1000.0
+        with self._cond:
+            entries = self._stream(stream)
+            state = self._group(stream, group)
+
+            if not new:
+                return [("%d-%d" % message_id, entries.find(message_id))
+                        for message_id, (owner, _) in state[1].items()
+                        if owner == consumer and entries.find(message_id) is not None][:count]
+
+            while True:
+                start = bisect.bisect_right(entries.ids, state[0])
+                if start < len(entries.ids):
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+
+            now = time.time()
+            messages = []
+            for idx in range(start, min(start + count, len(entries.ids))):
+                message_id = entries.ids[idx]
+                state[1][message_id] = [consumer, now]
+                messages.append(("%d-%d" % message_id, entries.entries[idx]))
+            state[0] = entries.ids[idx]
+            return messages
+
+    def ack(self, stream, group, *ids):
+
+        with self._cond:
+            pending = self._group(stream, group)[1]
+            acked = 0
+            for message_id in ids:
+                ms, seq = message_id.split("-")
+                if pending.pop((int(ms), int(seq)), None) is not None:
+                    acked += 1
+            return acked
+
+    def claim_stale(self, stream, group, consumer, min_idle_ms=CLAIM_IDLE_MS, count=READ_COUNT):
+
+        now = time.time()
+        with self._cond:
+            entries = self._stream(stream)
+            pending = self._group(stream, group)[1]
+
+            messages = []
+            for message_id, delivery in list(pending.items()):
+                if len(messages) >= count:
+                    break
+                if (now - delivery[1]) * 1000 < min_idle_ms:
+                    continue
+                message = entries.find(message_id)
+                if message is None:
+                    ## trimmed away, nothing left to redeliver
+                    del pending[message_id]
+                    continue
+                pending[message_id] = [consumer, now]
+                messages.append(("%d-%d" % message_id, message))
+            return messages
+
+    def pending_count(self, stream, group):
+        with self._cond:
+            return len(self._group(stream, group)[1])
+
+class streamConsumer(object):
+    """
+    Thread reading a stream through a consumer group, handler(message) is called for each
+    message and the message is acked once the handler returns. A message the handler raises on
+    stays pending and is retried, up to MAX_ATTEMPTS times
+    """
+
+    def __init__(self, bus, stream, group, consumer, handler, start="$", count=READ_COUNT,
+                 block_ms=BLOCK_MS, claim_idle_ms=CLAIM_IDLE_MS):
+        self.bus = bus
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.handler = handler
+        self.start_id = start
+        self.count = count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+
+        self.handled = 0
+        self.failed = 0
+        self._attempts = {}
+        self._stop = Event()
+        self._thread = None
+
+    def __repr__(self):
+        return "streamConsumer %s/%s/%s %d handled, %d failed" % (self.stream, self.group, self.consumer,
+                                                                  self.handled, self.failed)
+
+    def process(self, messages):
+        """
+        Handle and ack a batch of messages
+        :return: number of messages handled
+        """
+
+        acked = []
+        for message_id, message in messages:
+            try:
+                self.handler(message)
+            except Exception as e:
+                self.failed += 1
+                attempts = self._attempts[message_id] = self._attempts.get(message_id, 0) + 1
+                if attempts < MAX_ATTEMPTS:
+                    print("%s: message %s failed (attempt %d): [%s]" % (self.group, message_id, attempts, e))
+                    continue
+                print("%s: dropping message %s after %d attempts: [%s]" % (self.group, message_id, attempts, e))
+            else:
+                self.handled += 1
+            self._attempts.pop(message_id, None)
+            acked.append(message_id)
+
+        self.bus.ack(self.stream, self.group, *acked)
+        return len(acked)
+
+    def poll(self, block_ms=None):
+        """
+        One round: stale messages of other consumers, then new ones
+        """
+
+        handled = self.process(self.bus.claim_stale(self.stream, self.group, self.consumer, self.claim_idle_ms, self.count))
+        return handled + self.process(self.bus.read_group(self.stream, self.group, self.consumer, self.count, block_ms))
+
+    def _run(self):
+
+        ## whatever this consumer had in hand before a restart comes first
+        self.process(self.bus.read_group(self.stream, self.group, self.consumer, self.count, new=False))
+
+        while not self._stop.is_set():
+            try:
+                self.poll(self.block_ms)
+            except Exception as e:
+                print("%s: error reading %s: [%s]" % (self.group, self.stream, e))
+                self._stop.wait(1.0)
+
+    def start(self):
+        self.bus.create_group(self.stream, self.group, self.start_id)
+        self._thread = Thread(target=self._run, name="%s-%s" % (self.group, self.consumer), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+_BUS = None
+_BUS_LOCK = Lock()
+
+def get_bus():
+    """
+    The process wide bus, on the state store's Redis server, or in-process when the store
+    fell back to a memoryStore
+    """
+
+    global _BUS
+    with _BUS_LOCK:
+        if _BUS is None:
+            store = redis_pool.get_store()
+            if isinstance(store, redis_pool.redisStore):
+                _BUS = redisBus(store.server)
+            else:
+                _BUS = memoryBus()
+        return _BUS
@@ -0,0 +1,296 @@
+#! /usr/bin/python
+
+"""
+Event driven backtest engine for strat_base portfolios
+
+Signals are traded stop and reverse, like the old recon in run_strat: a long signal sets the
+target position to +quantity and a short one to -quantity, and the order on a bar is the target
+less the current position (2 * quantity on a reversal).
+
+Orders decided on the close of a bar are filled at the open of the next bar, with slippage and
+commission taken from pluggable models. Only the fills go through the event loop (compiled with
+numba when it is installed, plain Python otherwise); position, cash and equity per bar are
+cumulative sums over them, so multi-year 1 minute data takes well under a second.
+
+    pf = event_portfolio(symbol, bars, signals, quantity=10)
+    equity = pf.backtest_portfolio()
+    print(pf.trades().to_string())
+    print(pf.summary())
+"""
+
+import numpy as np
+import pandas as pd
+
+from gwt_pt.common.indicator import EMA
+from gwt_pt.strategy.strat_base import portfolio
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+## Same costs as the old recon in run_strat: 30 points slippage and $34 commission a round trip of 10 contracts
+DEFAULT_SLIPPAGE_POINTS = 15.0
+DEFAULT_COMMISSION_PER_CONTRACT = 1.7
+
+class commissionModel(object):
+    """
+    Commission charged on each fill: per_order + per_contract * quantity, at least minimum
+    """
+
+    def __init__(self, per_order=0.0, per_contract=DEFAULT_COMMISSION_PER_CONTRACT, minimum=0.0):
+        self.per_order = float(per_order)
+        self.per_contract = float(per_contract)
+        self.minimum = float(minimum)
+
+    def __repr__(self):
+        return "commissionModel(per_order=%s, per_contract=%s, minimum=%s)" % (self.per_order, self.per_contract,
+                                                                             self.minimum)
+
+class slippageModel(object):
+    """
+    Adverse move on each fill, per contract: points + pct of the fill price
+    Buys fill above the open, sells below
+    """
+
+    def __init__(self, points=DEFAULT_SLIPPAGE_POINTS, pct=0.0):
+        self.points = float(points)
+        self.pct = float(pct)
+
+    def __repr__(self):
+        return "slippageModel(points=%s, pct=%s)" % (self.points, self.pct)
+
+NO_COMMISSION = commissionModel(0.0, 0.0)
+NO_SLIPPAGE = slippageModel(0.0)
+
+def target_positions(long_signal, short_signal, quantity):
+    """
+    Stop and reverse positions from signal columns
+    :param long_signal / short_signal: > 0 on the bars to go long / short, a bar with both keeps the position
+    :return: array of the position to hold after each bar, quantity after a long signal, -quantity after a
+             short one, flat before the first
+    """
+
+    long_signal = np.nan_to_num(np.asarray(long_signal, dtype=np.float64)) > 0
+    short_signal = np.nan_to_num(np.asarray(short_signal, dtype=np.float64)) > 0
+
+    targets = np.full(len(long_signal), np.nan)
+    targets[long_signal & ~short_signal] = quantity
+    targets[short_signal & ~long_signal] = -quantity
+    return pd.Series(targets).ffill().fillna(0.0).values
+
+def target_orders(targets):
+    """
+    :return: orders moving the position from one target to the next
+    """
+
+    targets = np.asarray(targets, dtype=np.float64)
+    return np.diff(targets, prepend=0.0)
+
+def _simulate_fills(open, qty, multiplier, per_order, per_contract, min_commission, slip_points, slip_pct):
+    """
+    The event loop over fills only, kept to scalars and arrays so numba can compile it
+    :param open: open of each bar an order fills on
+    :param qty: quantity of each fill (+ buy, - sell)
+    :return: fill price, commission, slippage cost, realised long P&L, realised short P&L per fill
+    """
+
+    n = len(qty)
+    fill_price = np.zeros(n)
+    commissions = np.zeros(n)
+    slippages = np.zeros(n)
+    realized_long = np.zeros(n)
+    realized_short = np.zeros(n)
+
+    pos = 0.0
+    avg_price = 0.0
+
+    for i in range(n):
+
+        side = 1.0 if qty[i] > 0 else -1.0
+        price = open[i] + side * (slip_points + slip_pct * open[i])
+
+        commission = per_order + per_contract * abs(qty[i])
+        if commission < min_commission:
+            commission = min_commission
+
+        ## realised P&L on the part of the order which reduces the position
+        if pos != 0 and (pos > 0) != (qty[i] > 0):
+            closing = min(abs(qty[i]), abs(pos))
+            if pos > 0:
+                realized_long[i] = (price - avg_price) * closing * multiplier
+            else:
+                realized_short[i] = (avg_price - price) * closing * multiplier
+
+            if abs(qty[i]) > abs(pos):
+                avg_price = price
+            elif abs(qty[i]) == abs(pos):
+                avg_price = 0.0
+        else:
+            avg_price = (avg_price * abs(pos) + price * abs(qty[i])) / (abs(pos) + abs(qty[i]))
+
+        pos = pos + qty[i]
+
+        fill_price[i] = price
+        commissions[i] = commission
+        slippages[i] = abs(qty[i]) * abs(price - open[i]) * multiplier
+
+    return fill_price, commissions, slippages, realized_long, realized_short
+
+if njit is not None:
+    _simulate_fills = njit(cache=True)(_simulate_fills)
+
+def run_backtest(open, close, orders, initial_capital=100000.0, commission=None, slippage=None, multiplier=1.0):
+    """
+    Simulate a stream of orders against bars
+    Only bars with a fill go through the event loop, position / cash / equity per bar are cumulative
+    sums over the fills
+    :param orders: quantity to trade decided at each bar's close (+ buy, - sell), filled at the next open
+    :return: dict of arrays per bar: position, cash, equity, fill_qty, fill_price, commission, slippage,
+             realized_long, realized_short
+    """
+
+    commission = commission or commissionModel()
+    slippage = slippage or slippageModel()
+
+    open = np.ascontiguousarray(open, dtype=np.float64)
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    orders = np.nan_to_num(np.ascontiguousarray(orders, dtype=np.float64))
+    n = len(open)
+
+    ## an order on bar i fills at the open of bar i + 1, orders on the last bar or onto a missing open are dropped
+    fill_idx = np.flatnonzero(orders[:-1]) + 1
+    fill_idx = fill_idx[~np.isnan(open[fill_idx])]
+    qty = orders[fill_idx - 1]
+
+    fills = _simulate_fills(open[fill_idx], qty, float(multiplier), commission.per_order, commission.per_contract,
+                            commission.minimum, slippage.points, slippage.pct)
+
+    result = {'fill_qty': np.zeros(n), 'fill_price': np.full(n, np.nan)}
+    result['fill_qty'][fill_idx] = qty
+    for key, values in zip(['fill_price', 'commission', 'slippage', 'realized_long', 'realized_short'], fills):
+        if key not in result:
+            result[key] = np.zeros(n)
+        result[key][fill_idx] = values
+
+    result['position'] = np.cumsum(result['fill_qty'])
+    result['cash'] = initial_capital - np.cumsum(result['fill_qty'] * np.nan_to_num(result['fill_price']) * multiplier
+                                                 + result['commission'])
+
+    ## mark to the last known close
+    marks = pd.Series(close).ffill().fillna(0.0).values
+    result['equity'] = result['cash'] + result['position'] * marks * multiplier
+
+    return result
+
+class event_portfolio(portfolio):
+    """Stop and reverse portfolio backtested with run_backtest, for any strategy
+    producing long / short signal columns (1.0 on the bar to go long / short).
+
+    Requires:
+    symbol - A stock symbol which forms the basis of the portfolio.
+    bars - A DataFrame of bars for a symbol set.
+    signals - A pandas DataFrame of signals for each symbol.
+    initial_capital - The amount in cash at the start of the portfolio.
+    quantity - Contracts held long or short.
+    commission / slippage - commissionModel / slippageModel, the old recon costs by default.
+    multiplier - Contract multiplier.
+    long_column / short_column - signal columns, xup_pos / xdown_pos by default."""
+
+    def __init__(self, symbol, bars, signals, initial_capital=100000.0, quantity=10, commission=None,
+                 slippage=None, multiplier=1.0, long_column='xup_pos', short_column='xdown_pos'):
+        self.symbol = symbol
+        self.bars = bars
+        self.signals = signals
+        self.initial_capital = float(initial_capital)
+        self.quantity = quantity
+        self.commission = commission or commissionModel()
+        self.slippage = slippage or slippageModel()
+        self.multiplier = multiplier
+        self.long_column = long_column
+        self.short_column = short_column
+        self.positions = self.generate_positions()
+        self.orders = target_orders(self.positions[self.symbol].values)
+        self.result = None
+
+    def generate_positions(self):
+        """Target position per bar, quantity after a long signal and -quantity after a short one"""
+        positions = pd.DataFrame(index=self.signals.index)
+        positions[self.symbol] = target_positions(self.signals[self.long_column].values,
+                                                  self.signals[self.short_column].values, self.quantity)
+        return positions
+
+    def backtest_portfolio(self):
+
+        self.result = run_backtest(self.bars['open'].values, self.bars['close'].values,
+                                   self.orders, self.initial_capital,
+                                   self.commission, self.slippage, self.multiplier)
+
+        pf = pd.DataFrame(index=self.bars.index)
+        pf['close'] = self.bars['close']
+        pf['open'] = self.bars['open']
+        pf['target'] = self.positions[self.symbol]
+        pf['order'] = self.orders
+        for key in ['position', 'fill_qty', 'fill_price', 'commission', 'slippage', 'cash']:
+            pf[key] = self.result[key]
+        pf['total'] = self.result['equity']
+        pf['returns'] = pf['total'].pct_change()
+        pf['sma25'] = EMA(pf, 'total', 25)
+
+        return pf
+
+    def trades(self):
+        """Fills as a DataFrame: qty, price, commission, slippage, realised long / short P&L"""
+
+        if self.result is None:
+            self.backtest_portfolio()
+
+        filled = self.result['fill_qty'] != 0
+        trades = pd.DataFrame(index=self.bars.index[filled])
+        trades['qty'] = self.result['fill_qty'][filled]
+        trades['price'] = self.result['fill_price'][filled]
+        trades['commission'] = self.result['commission'][filled]
+        trades['slippage'] = self.result['slippage'][filled]
+        trades['realized_long'] = self.result['realized_long'][filled]
+        trades['realized_short'] = self.result['realized_short'][filled]
+        trades['position'] = self.result['position'][filled]
+        return trades
+
+    def summary(self):
+        """Realised P&L by side (after slippage, before commission), commission and final equity"""
+
+        if self.result is None:
+            self.backtest_portfolio()
+
+        return {
+            'long': float(self.result['realized_long'].sum()),
+            'short': float(self.result['realized_short'].sum()),
+            'commission': float(self.result['commission'].sum()),
+            'slippage': float(self.result['slippage'].sum()),
+            'trades': int(np.count_nonzero(self.result['fill_qty'])),
+            'equity': float(self.result['equity'][-1]) if len(self.result['equity']) else self.initial_capital
+        }
+
+def main():
+
+    import time
+
+    n = 2000000
+    rng = np.random.default_rng(0)
+    close = 30000 + np.cumsum(rng.standard_normal(n) * 5)
+    open = np.r_[close[0], close[:-1]]
+    ema = pd.Series(close).ewm(span=25).mean().values
+    orders = target_orders(target_positions(close > ema, close < ema, 10))
+
+    start_time = time.time()
+    run_backtest(open, close, orders)
+    print("Compile / first run %.3fs (numba %s)" % (time.time() - start_time, njit is not None))
+
+    start_time = time.time()
+    result = run_backtest(open, close, orders)
+    print("Backtested %d bars in %.3fs, %d fills, equity %.2f" % (n, time.time() - start_time,
+                                                                 np.count_nonzero(result['fill_qty']),
+                                                                 result['equity'][-1]))
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,15 @@
 import numpy as np
 import pandas as pd
 import os
-from pandas_datareader import data as web, wb
 from gwt_pt.common.indicator import SMA, EMA, RSI, FASTSTOC, SLOWSTOC, MACD
+from gwt_pt.common import signal_pipeline
 
 from gwt_pt.datasource import ibkr 
+from gwt_pt.datasource import bar_array
 from gwt_pt.telegram import bot_sender
-from gwt_pt.charting import btplot
-from gwt_pt.strategy.strat_base import strategy, portfolio
+from gwt_pt.strategy.strat_base import strategy
+from gwt_pt.strategy.strat_backtest import event_portfolio
+from gwt_pt.util import log_config
 
 import time
 import datetime
@@ -17,18 +19,8 @@ import logging, sys
 
 LOGFILE_ENABLED = False
 
-if (os.name == 'nt'):
-    logfile = 'C:\\Users\\Hin\\eggyolktech\\gwtPT\\gwt_pt\\log\\macdstoc_strat.log'
-else:
-    logfile = '/app/gwtPT/gwt_pt/log/macdstoc_strat_%s.log' % datetime.datetime.today().strftime('%m%d-%H%M%S')
-
-logging.basicConfig(filename=logfile, level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger()
 
-if LOGFILE_ENABLED:
-    sys.stderr.write = lambda s: logger.error(s)
-    sys.stdout.write = lambda s: logger.info(s)
-
 EL = "\n"
 DEL = "\n\n"
 
@@ -84,85 +76,13 @@ class ema_xover_strategy(strategy):
         """Returns the DataFrame of symbols containing the signals
         to go long, short or hold (1, -1 or 0)."""
             
-        signals = pd.DataFrame(index=self.bars.index)
-        signals['open'] = self.bars['open']    
-        signals['high'] = self.bars['high']
-        signals['low'] = self.bars['low']
-        signals['close'] = self.bars['close']
-        signals["ema25"] = EMA(signals, 'close', 25)
+        ## ema25, MACD and slow stochastic, shared through the signal pipeline
+        signals = signal_pipeline.get_pipeline().frame(self.bars, self.symbol, "", self.window1, STOC_WINDOW, 6)
         signals['nopen'] = signals['open'].shift(-1) # get next bar open for trade action
 
-        # MACD
-        macd = MACD(self.bars['close'])
-        signals = pd.concat([signals, macd], axis=1)
-
-        # Slowstoc
-        kslow, dslow = SLOWSTOC(self.bars, 'low', 'high', 'close', STOC_WINDOW, 6, False)
-        signals = pd.concat([signals, kslow, dslow], axis=1)   
-
-        signals['xup'] = signals['xdown'] = signals['xup_pos'] = signals['xdown_pos'] = 0.0
-
-        ###############################################################################
-        if (len(signals) >= EMA_WINDOW):
-            signals['xup'][EMA_WINDOW:] = np.where(
-                (signals['close'][EMA_WINDOW:] > signals['ema25'][EMA_WINDOW:]), 1.0, 0.0)
-        else:
-            signals['xup'] = 0.0
-        
-        ## Take the difference of the signals in order to generate actual trading orders
-        signals['xup_pos'] = signals['xup'].diff()
-        signals.loc[signals.xup_pos == -1.0, 'xup_pos'] = 0.0
-
-        ###############################################################################
-        if (len(signals) >= EMA_WINDOW):
-            signals['xdown'][EMA_WINDOW:] = np.where(
-                (signals['close'][EMA_WINDOW:] < signals['ema25'][EMA_WINDOW:]), 1.0, 0.0)
-        else:
-            signals['xdown'] = 0.0
-        
-        ## Take the difference of the signals in order to generate actual trading orders
-        signals['xdown_pos'] = signals['xdown'].diff()
-        signals.loc[signals.xdown_pos == -1.0, 'xdown_pos'] = 0.0
-        
-        return signals
-
-class ema_xover_portfolio(portfolio):
-    """Encapsulates the notion of a portfolio of positions based
-    on a set of signals as provided by a Strategy.
-
-    Requires:
-    symbol - A stock symbol which forms the basis of the portfolio.
-    bars - A DataFrame of bars for a symbol set.
-    signals - A pandas DataFrame of signals (1, 0, -1) for each symbol.
-    initial_capital - The amount in cash at the start of the portfolio."""
-
-    def __init__(self, symbol, bars, signals, initial_capital=100000.0):
-        self.symbol = symbol        
-        self.bars = bars
-        self.signals = signals
-        self.initial_capital = float(initial_capital)
-        self.positions = self.generate_positions()
-        
-    def generate_positions(self):
-        positions = pd.DataFrame(index=self.signals.index).fillna(0.0)
-        positions[self.symbol] = 10 * self.signals['xup_pos']
-        positions[self.symbol] = positions[self.symbol] + (-10 * self.signals['xdown_pos'])
-        #print(positions.to_string())
-        return positions
-                    
-    def backtest_portfolio(self):
-        pf = pd.DataFrame(index=self.bars.index)
-        pf['close'] = self.bars['close']
-        pf['open'] = self.bars['open']
-        pf['nopen'] = self.signals['nopen']
-        pf['pos'] = self.positions
-        pf['holdings'] = self.positions.mul(self.bars['close'], axis='index')
-        pf['cash'] = self.initial_capital - pf['holdings'].cumsum()
-        pf['total'] = pf['cash'] + self.positions[self.symbol].cumsum() * self.bars['close']
-        pf['returns'] = pf['total'].pct_change()
-        pf['sma25'] = EMA(pf, 'total', 25)
-        print(pf.to_string())
-        return pf
+        ## no crossover until the EMA window has filled
+        return signal_pipeline.crossover_columns(signals, signals['close'].values, signals['ema25'].values,
+                                                 self.window1)
 
 def run_strat(symbol, historic_data): 
     
@@ -170,33 +90,20 @@ def run_strat(symbol, historic_data):
     #pd.options.display.float_format = "{:.9f}".format
     
     # Data pre-processing
-    bars = pd.DataFrame(historic_data, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
-    bars.set_index('datetime', inplace=True)
-    bars.index = pd.to_datetime(bars.index)
+    bars = bar_array.to_frame(historic_data)
     
-    ema_strats = ema_xover_strategy(symbol, bars, 25)
+    ema_strats = ema_xover_strategy(symbol, bars, EMA_WINDOW)
     signals = ema_strats.generate_signals()
     
-    ema_portfolio = ema_xover_portfolio(symbol, bars, signals, initial_capital=100000.0)
+    ema_portfolio = event_portfolio(symbol, bars, signals, initial_capital=100000.0, quantity=10)
     pf = ema_portfolio.backtest_portfolio()
     
-    #print(pf)
-    recon = (pf[(pf.pos == 10) | (pf.pos == -10)])[['close', 'nopen', 'pos']]
-    recon['l'] = recon['nopen'].diff() - 30
-    recon.loc[recon['pos'] == 10, 'l'] = None
-    recon['lpos'] = (recon['l'] * 10)
-    recon.loc[recon['lpos'] != 0, 'lpos_comm'] = recon['lpos'] - 34 
-    ltotal = recon['lpos_comm'].sum()
-  
-    recon['s'] = recon['nopen'].diff() + 30
-    recon.loc[recon['pos'] == -10, 's'] = None
-    recon['spos'] = (recon['s'] * -10)
-    recon.loc[recon['spos'] != 0, 'spos_comm'] = recon['spos'] - 34 
-    stotal = recon['spos_comm'].sum()
-  
-    print(recon.to_string())
-    print("Total P&L (Long): $%f" % ltotal)
-    print("Total P&L (Short): $%f" % stotal)
+    print(ema_portfolio.trades().to_string())
+    summary = ema_portfolio.summary()
+    print("Total P&L (Long): $%f" % summary['long'])
+    print("Total P&L (Short): $%f" % summary['short'])
+    print("Commission: $%f, Slippage: $%f, Net: $%f" % (summary['commission'], summary['slippage'],
+                                                          summary['equity'] - ema_portfolio.initial_capital))
   
     
     ## Plot the strategy charting
@@ -204,6 +111,8 @@ def run_strat(symbol, historic_data):
     #print(signals[['sk_slow','sd_slow', 'macdstoc_xup_positions', 'macdstoc_xdown_positions']].tail(20).to_string())
     #print(signals[['close','xup_pos', 'xdown_pos']].to_string())
 
+    ## matplotlib is only loaded for the backtest charts
+    from gwt_pt.charting import btplot
     btplot.plot_with_portfolio(bars, signals, pf, title, True)
 
 def gen_alert(symbol="MHI"):     
@@ -222,11 +131,9 @@ def gen_alert(symbol="MHI"):
         return
 
     # Data pre-processing
-    bars = pd.DataFrame(historic_data, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
-    bars.set_index('datetime', inplace=True)
-    bars.index = pd.to_datetime(bars.index)
+    bars = bar_array.to_frame(historic_data)
     
-    ema_strats = ema_xover_strategy(symbol, bars, 25)
+    ema_strats = ema_xover_strategy(symbol, bars, EMA_WINDOW)
     signals = ema_strats.generate_signals()
     
     latest_signal = signals.iloc[-2:].head(1)
@@ -298,6 +205,7 @@ def get_contract_month():
 def main(args):
     
     start_time = time.time()
+    log_config.init_logging("macdstoc_strat", LOGFILE_ENABLED)
 
     if (len(args) > 1 and args[1] == "gen_alert"):
         gen_alert("MHI")
@@ -0,0 +1,114 @@
+#! /usr/bin/python
+
+import numpy as np
+import pandas as pd
+
+from gwt_pt.common import signal_pipeline
+from gwt_pt.strategy.strat_base import strategy
+
+STOC_UPPER_LIMIT = 75
+STOC_LOWER_LIMIT = 25
+STOC_WINDOW = 16
+STOC_SMOOTHING = 6
+MACDSTOC_WINDOW = 11
+MACDSTOC_SMOOTHING = 3
+MACDSTOC_UPPER_LIMIT = 0
+MACDSTOC_LOWER_LIMIT = 100
+MACDSTOC_THRESHOLD = 1.0
+EMA_WINDOW = 25
+
+## signal columns, then the positions taken from them, in one block
+SIGNAL_COLUMNS = ['signal_stoc_xup', 'signal_stoc_xdown', 'signal_macd_xup', 'signal_macd_xdown',
+                  'signal_xup', 'signal_sxup', 'signal_xdown', 'signal_sxdown']
+POSITION_COLUMNS = ['stoc_xup_positions', 'xup_positions', 'sxup_positions', 'xdown_positions', 'sxdown_positions']
+
+class macdstoc_strategy(strategy):
+    """Macdstoc (stochastic of the MACD) crossover, the signal behind macdstoc_alert,
+    with every window and threshold as a parameter so it can be optimised.
+
+    Requires:
+    symbol - A stock symbol on which to form a strategy on.
+    bars - A DataFrame of bars for the above symbol."""
+
+    def __init__(self, symbol, bars, stoc_window=STOC_WINDOW, stoc_smoothing=STOC_SMOOTHING,
+                 macdstoc_window=MACDSTOC_WINDOW, macdstoc_smoothing=MACDSTOC_SMOOTHING,
+                 stoc_lower_limit=STOC_LOWER_LIMIT, macdstoc_upper_limit=MACDSTOC_UPPER_LIMIT,
+                 macdstoc_lower_limit=MACDSTOC_LOWER_LIMIT, macdstoc_threshold=MACDSTOC_THRESHOLD,
+                 ema_window=EMA_WINDOW):
+        self.symbol = symbol
+        self.bars = bars
+        self.stoc_window = stoc_window
+        self.stoc_smoothing = stoc_smoothing
+        self.macdstoc_window = macdstoc_window
+        self.macdstoc_smoothing = macdstoc_smoothing
+        self.stoc_lower_limit = stoc_lower_limit
+        self.macdstoc_upper_limit = macdstoc_upper_limit
+        self.macdstoc_lower_limit = macdstoc_lower_limit
+        self.macdstoc_threshold = macdstoc_threshold
+        self.ema_window = ema_window
+
+    def params(self):
+        return {'stoc_window': self.stoc_window, 'stoc_smoothing': self.stoc_smoothing,
+                'macdstoc_window': self.macdstoc_window, 'macdstoc_smoothing': self.macdstoc_smoothing,
+                'stoc_lower_limit': self.stoc_lower_limit, 'macdstoc_upper_limit': self.macdstoc_upper_limit,
+                'macdstoc_lower_limit': self.macdstoc_lower_limit, 'macdstoc_threshold': self.macdstoc_threshold,
+                'ema_window': self.ema_window}
+
+    def generate_indicators(self):
+        """ema25, MACD, slow stochastic and Macdstoc columns, shared through the signal pipeline"""
+
+        return signal_pipeline.get_pipeline().frame(self.bars, self.symbol, "", self.ema_window, self.stoc_window,
+                                                    self.stoc_smoothing, self.macdstoc_window,
+                                                    self.macdstoc_smoothing)
+
+    def generate_signals(self, signals=None):
+        """Returns the DataFrame of indicators and signals, xup_positions / xdown_positions
+        are 1.0 on the bar to go long / short
+        :param signals: indicators from generate_indicators, computed if not given"""
+
+        if signals is None:
+            signals = self.generate_indicators()
+
+        k_slow, d_slow = signals['k_slow'].values, signals['d_slow'].values
+        sk_slow, sd_slow = signals['sk_slow'].values, signals['sd_slow'].values
+
+        ## every signal / position column is written into one preallocated block, no chained assignment
+        n = len(signals)
+        block = np.zeros((n, len(SIGNAL_COLUMNS) + len(POSITION_COLUMNS)))
+        column = dict([(name, idx) for idx, name in enumerate(SIGNAL_COLUMNS + POSITION_COLUMNS)])
+
+        def mark(name, condition, window):
+            ## no signal until the window has filled
+            out = block[:, column[name]]
+            out[window:] = condition[window:]
+            return out
+
+        with np.errstate(invalid='ignore'):
+            ## Slow Stoc cross over <= the lower limit
+            stoc_xup = mark('signal_stoc_xup', (k_slow > d_slow) & (k_slow <= self.stoc_lower_limit),
+                            self.stoc_window)
+
+            ## Macdstoc cross up / down, plus the pinned at 100 / 0 special cases
+            window = self.macdstoc_window
+            xup = mark('signal_xup', (sk_slow > sd_slow + self.macdstoc_threshold)
+                       & (sd_slow <= self.macdstoc_lower_limit), window)
+            sxup = mark('signal_sxup', (sk_slow == 100) & (sd_slow == 100), window)
+            xdown = mark('signal_xdown', (sk_slow < sd_slow - self.macdstoc_threshold)
+                         & (sd_slow >= self.macdstoc_upper_limit), window)
+            sxdown = mark('signal_sxdown', (sk_slow == 0) & (sd_slow == 0), window)
+
+        ## Take the difference of the signals in order to generate actual trading orders
+        signal_pipeline.signal_positions(stoc_xup, block[:, column['stoc_xup_positions']])
+        signal_pipeline.signal_positions(sxup, block[:, column['sxup_positions']])
+        signal_pipeline.signal_positions(sxdown, block[:, column['sxdown_positions']])
+
+        ## Aggregrate the special case + normal case together
+        xup_positions = block[:, column['xup_positions']]
+        np.add(signal_pipeline.signal_positions(xup, xup_positions), block[:, column['sxup_positions']], out=xup_positions)
+        xdown_positions = block[:, column['xdown_positions']]
+        np.add(signal_pipeline.signal_positions(xdown, xdown_positions), block[:, column['sxdown_positions']], out=xdown_positions)
+
+        signals = pd.concat([signals, pd.DataFrame(block, index=signals.index,
+                                                   columns=SIGNAL_COLUMNS + POSITION_COLUMNS, copy=False)], axis=1)
+
+        return signals
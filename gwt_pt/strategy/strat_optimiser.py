@@ -0,0 +1,255 @@
+#! /usr/bin/python
+
+"""
+Parallel parameter sweep for the strategies
+
+Each parameter set is backtested with strat_backtest.event_portfolio in a ProcessPoolExecutor,
+stop and reverse from target positions like run_strat, so a signal column counting 2.0 (the
+macdstoc xup and sxup on the same bar) still trades the one quantity.
+The bars are written once to a .npy file and opened memory-mapped in every worker, so a task
+only pickles its parameters, never the data:
+
+    bars = bar_array.to_frame(ibkr.get_hkfe_data(contract_mth, "MHI", "1 Y", "1 hour"))
+    param_sets = grid({'window1': range(10, 60, 5)})
+    ranked = run_sweep(ema_xover_strategy, bars, param_sets, symbol="MHI")
+    print(ranked.head(20).to_string())
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from gwt_pt.datasource.bar_array import barArray
+from gwt_pt.strategy.strat_backtest import event_portfolio
+
+## metric columns of the result table, ranked on RANK_BY (highest first)
+RANK_BY = 'net'
+
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+## bars opened by this worker process, by file
+_WORKER_BARS = {}
+
+class sharedBars(object):
+    """
+    Bars written to a .npy file in a temporary directory, opened memory-mapped by the workers
+    Pickles as just the file name
+    """
+
+    def __init__(self, bars, directory=None):
+        """
+        :param bars: DataFrame of open, high, low, close, volume with a datetime index, or a barArray
+        """
+
+        if isinstance(bars, barArray):
+            bars = bars.to_frame()
+
+        self._directory = tempfile.mkdtemp(prefix="gwtpt_sweep_", dir=directory)
+        self.path = os.path.join(self._directory, "bars.npy")
+
+        ## one float64 block: epoch seconds followed by the OHLCV columns
+        block = np.empty((len(bars), 6), dtype=np.float64)
+        block[:, 0] = bars.index.values.astype('datetime64[s]').astype(np.int64)
+        for idx, column in enumerate(['open', 'high', 'low', 'close', 'volume']):
+            block[:, idx + 1] = bars[column].values if column in bars else 0.0
+        np.save(self.path, block)
+
+    def __getstate__(self):
+        return {'path': self.path, '_directory': None}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def load(self):
+        """
+        The bars as a DataFrame backed by the memory-mapped file (read-only), cached per process
+        """
+
+        if self.path not in _WORKER_BARS:
+            block = np.load(self.path, mmap_mode='r')
+            index = pd.DatetimeIndex(pd.to_datetime(block[:, 0].astype(np.int64), unit='s'), name='datetime')
+            _WORKER_BARS[self.path] = pd.DataFrame(block[:, 1:], index=index,
+                                                   columns=['open', 'high', 'low', 'close', 'volume'], copy=False)
+        return _WORKER_BARS[self.path]
+
+    def close(self):
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+def grid(param_grid):
+    """
+    Every combination of the values in param_grid
+    :param param_grid: dict of parameter name to a list of values
+    :return: list of parameter dicts
+    """
+
+    names = sorted(param_grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[list(param_grid[name]) for name in names])]
+
+def random_search(param_space, n, seed=None):
+    """
+    n random parameter sets, without repeats
+    :param param_space: dict of parameter name to a list of values, or a (low, high) tuple sampled
+                        uniformly (as int if both are ints)
+    """
+
+    rng = random.Random(seed)
+    names = sorted(param_space.keys())
+
+    def sample(space):
+        if isinstance(space, tuple):
+            low, high = space
+            if isinstance(low, int) and isinstance(high, int):
+                return rng.randint(low, high)
+            return rng.uniform(low, high)
+        return rng.choice(list(space))
+
+    param_sets = []
+    seen = set()
+    attempts = 0
+    while len(param_sets) < n and attempts < n * 20:
+        attempts += 1
+        params = dict([(name, sample(param_space[name])) for name in names])
+        key = tuple(params[name] for name in names)
+        if key not in seen:
+            seen.add(key)
+            param_sets.append(params)
+    return param_sets
+
+def periods_per_year(index):
+    """
+    Bars per year, counted from the bars themselves so the bar size and the trading hours
+    (HKFE sessions, FX weekends) both come out right
+    :param index: datetime index of the bars
+    :return: None if the bars span no time
+    """
+
+    if len(index) < 2:
+        return None
+    years = (index[-1] - index[0]).total_seconds() / SECONDS_PER_YEAR
+    return (len(index) - 1) / years if years > 0 else None
+
+def result_metrics(result, initial_capital, periods_per_year=None):
+    """
+    :param result: arrays from strat_backtest.run_backtest
+    :param periods_per_year: bars per year to annualise the sharpe ratio with, see periods_per_year(),
+                             None for the ratio per bar
+    :return: dict of net, long, short, commission, slippage, trades, max_drawdown, sharpe
+    """
+
+    equity = result['equity']
+    drawdown = np.maximum.accumulate(equity) - equity if len(equity) else np.zeros(0)
+    returns = np.diff(equity) / equity[:-1] if len(equity) > 1 else np.zeros(0)
+    sharpe = returns.mean() / returns.std() if len(returns) and returns.std() > 0 else 0.0
+    if periods_per_year:
+        sharpe = sharpe * np.sqrt(periods_per_year)
+
+    return {
+        'net': (float(equity[-1]) if len(equity) else initial_capital) - initial_capital,
+        'long': float(result['realized_long'].sum()),
+        'short': float(result['realized_short'].sum()),
+        'commission': float(result['commission'].sum()),
+        'slippage': float(result['slippage'].sum()),
+        'trades': int(np.count_nonzero(result['fill_qty'])),
+        'max_drawdown': float(drawdown.max()) if len(drawdown) else 0.0,
+        'sharpe': float(sharpe)
+    }
+
+def portfolio_metrics(pf):
+    """
+    :param pf: event_portfolio after backtest_portfolio
+    """
+    return result_metrics(pf.result, pf.initial_capital, periods_per_year(pf.bars.index))
+
+def evaluate(strategy_class, bars, params, symbol="", portfolio_args=None):
+    """
+    Backtest one parameter set, stop and reverse on the signal columns
+    :param portfolio_args: extra keyword arguments for event_portfolio (quantity, commission, signal columns...)
+    :return: dict of the parameters plus portfolio_metrics
+    """
+
+    signals = strategy_class(symbol, bars, **params).generate_signals()
+    pf = event_portfolio(symbol, bars, signals, **(portfolio_args or {}))
+    pf.backtest_portfolio()
+
+    result = dict(params)
+    result.update(portfolio_metrics(pf))
+    return result
+
+def _evaluate_shared(strategy_class, shared, params, symbol, portfolio_args):
+    return evaluate(strategy_class, shared.load(), params, symbol, portfolio_args)
+
+def run_sweep(strategy_class, bars, param_sets, symbol="", portfolio_args=None, max_workers=None, rank_by=RANK_BY):
+    """
+    Backtest every parameter set across a process pool
+    :param strategy_class: strategy taking (symbol, bars, **params), eg. ema_xover_strategy
+    :param bars: DataFrame of bars (or barArray), shared with the workers through a memory-mapped file
+    :return: DataFrame of results, best rank_by first
+    """
+
+    shared = sharedBars(bars)
+    results = []
+    start_time = time.time()
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = dict([(executor.submit(_evaluate_shared, strategy_class, shared, params, symbol, portfolio_args),
+                             params) for params in param_sets])
+
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print("Parameters %s failed: [%s]" % (futures[future], e))
+    finally:
+        shared.close()
+
+    print("Swept %d parameter sets in %.3fs" % (len(param_sets), time.time() - start_time))
+
+    if not results:
+        return pd.DataFrame()
+
+    ranked = pd.DataFrame(results).sort_values(rank_by, ascending=False)
+    ranked.index = np.arange(1, len(ranked) + 1)
+    ranked.index.name = 'rank'
+    return ranked
+
+def main(args):
+
+    from gwt_pt.datasource import ibkr
+    from gwt_pt.datasource import bar_array
+    from gwt_pt.strategy.strat_ema_xover import ema_xover_strategy, get_contract_month
+    from gwt_pt.strategy.strat_macdstoc import macdstoc_strategy
+
+    symbol = "MHI"
+    duration = "1 Y"
+    period = "1 hour"
+    contract_mth = get_contract_month()
+
+    bars = bar_array.to_frame(ibkr.get_hkfe_data(contract_mth, symbol, duration, period, use_cache=True))
+
+    if (len(args) > 1 and args[1] == "macdstoc"):
+        param_sets = grid({
+            'stoc_window': [12, 14, 16, 18],
+            'macdstoc_window': [9, 11, 13],
+            'macdstoc_threshold': [0.0, 1.0, 2.0]
+        })
+        ranked = run_sweep(macdstoc_strategy, bars, param_sets, symbol,
+                           {'long_column': 'xup_positions', 'short_column': 'xdown_positions'})
+    else:
+        param_sets = grid({'window1': range(10, 65, 5)})
+        ranked = run_sweep(ema_xover_strategy, bars, param_sets, symbol)
+
+    print(ranked.head(20).to_string())
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,194 @@
+#! /usr/bin/python
+
+"""
+Walk-forward evaluation of a strategy
+
+The history is split into rolling in-sample / out-of-sample windows. On each fold the parameter
+set with the best in-sample score is picked and traded on the following out-of-sample window.
+
+Positions come from the signal level, not its edges: the stop and reverse target position a
+parameter set holds on each bar (strat_backtest.target_positions). The out-of-sample windows are
+traded as one book, each fold taking over the position the previous one ended with and trading
+to its own parameter set's target, so nothing is closed or opened for free at a fold boundary.
+
+The indicators only look back, so the target positions of a parameter set over the whole history
+are the same as continuing its indicator state from fold to fold. They are computed once per
+parameter set and sliced per fold, and every backtest runs on plain array slices:
+
+    wf = walkForward(ema_xover_strategy, bars, grid({'window1': range(10, 60, 5)}), "MHI")
+    results, equity = wf.run(in_sample=4000, out_sample=1000)
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from gwt_pt.strategy.strat_backtest import run_backtest, target_positions, target_orders, commissionModel, \
+    slippageModel
+from gwt_pt.strategy.strat_optimiser import grid, result_metrics, periods_per_year, RANK_BY
+
+## about a month in sample and a week out of sample of 5 minute HKFE bars
+IN_SAMPLE_BARS = 4000
+OUT_SAMPLE_BARS = 1000
+
+def folds(n, in_sample, out_sample, step=None, anchored=False):
+    """
+    Index ranges of the walk-forward folds over n bars
+    :param step: bars between fold starts, out_sample by default (back to back out-of-sample windows)
+    :param anchored: in-sample windows all start at bar 0 and grow
+    :return: list of (in-sample start, out-of-sample start, out-of-sample end)
+    """
+
+    step = step or out_sample
+    ranges = []
+    start = 0
+    while start + in_sample < n:
+        oos_start = start + in_sample
+        ranges.append((0 if anchored else start, oos_start, min(oos_start + out_sample, n)))
+        start = start + step
+    return ranges
+
+class walkForward(object):
+    """
+    Walk-forward harness for strategies taking (symbol, bars, **params) and a signal per bar
+    to go long / short, traded stop and reverse with the strat_backtest engine
+    """
+
+    def __init__(self, strategy_class, bars, param_sets, symbol="", initial_capital=100000.0, quantity=10,
+                 commission=None, slippage=None, multiplier=1.0, long_column='xup_pos', short_column='xdown_pos',
+                 rank_by=RANK_BY):
+        self.strategy_class = strategy_class
+        self.bars = bars
+        self.param_sets = list(param_sets)
+        self.symbol = symbol
+        self.initial_capital = float(initial_capital)
+        self.quantity = quantity
+        self.commission = commission or commissionModel()
+        self.slippage = slippage or slippageModel()
+        self.multiplier = multiplier
+        self.long_column = long_column
+        self.short_column = short_column
+        self.rank_by = rank_by
+
+        self._open = np.ascontiguousarray(bars['open'].values, dtype=np.float64)
+        self._close = np.ascontiguousarray(bars['close'].values, dtype=np.float64)
+        self._periods_per_year = periods_per_year(bars.index)
+
+        ## target positions over the whole history, by parameter set
+        self._targets = {}
+
+    def _key(self, params):
+        return tuple(sorted(params.items()))
+
+    def targets(self, params):
+        """
+        Target position per bar over the whole history for a parameter set, computed once
+        """
+
+        key = self._key(params)
+        if key not in self._targets:
+            signals = self.strategy_class(self.symbol, self.bars, **params).generate_signals()
+            self._targets[key] = target_positions(signals[self.long_column].values,
+                                                  signals[self.short_column].values, self.quantity)
+        return self._targets[key]
+
+    def backtest(self, params, start, end, capital=None):
+        """
+        Backtest a parameter set on bars [start, end), starting flat and taking the position the
+        parameter set holds on the first bar
+        :return: run_backtest result arrays
+        """
+
+        orders = target_orders(self.targets(params)[start:end])
+        return run_backtest(self._open[start:end], self._close[start:end], orders,
+                            self.initial_capital if capital is None else capital,
+                            self.commission, self.slippage, self.multiplier)
+
+    def fit(self, start, end):
+        """
+        Best parameter set on bars [start, end)
+        :return: (params, in-sample metrics)
+        """
+
+        best = None
+        for params in self.param_sets:
+            metrics = result_metrics(self.backtest(params, start, end), self.initial_capital,
+                                     self._periods_per_year)
+            if best is None or metrics[self.rank_by] > best[1][self.rank_by]:
+                best = (params, metrics)
+        return best
+
+    def run(self, in_sample, out_sample, step=None, anchored=False):
+        """
+        :param in_sample: bars to fit each fold on
+        :param out_sample: bars to trade each fold on
+        :return: (DataFrame of folds: dates, chosen parameters, in / out-of-sample scores,
+                  Series of the out-of-sample equity from the first out-of-sample bar)
+        """
+
+        if step is not None and step < out_sample:
+            raise ValueError("step %d would overlap the out-of-sample windows of %d bars" % (step, out_sample))
+
+        start_time = time.time()
+        index = self.bars.index
+        ranges = folds(len(self.bars), in_sample, out_sample, step, anchored)
+        if not ranges:
+            return pd.DataFrame(), pd.Series(dtype=np.float64)
+
+        ## the out-of-sample windows as one book, flat in the gaps between them (step > out_sample)
+        first, last = ranges[0][1], ranges[-1][2]
+        targets = np.zeros(last - first)
+        fits = []
+        for is_start, oos_start, oos_end in ranges:
+            params, is_metrics = self.fit(is_start, oos_start)
+            targets[oos_start - first:oos_end - first] = self.targets(params)[oos_start:oos_end]
+            fits.append((params, is_metrics))
+
+        result = run_backtest(self._open[first:last], self._close[first:last], target_orders(targets),
+                              self.initial_capital, self.commission, self.slippage, self.multiplier)
+
+        rows = []
+        for (is_start, oos_start, oos_end), (params, is_metrics) in zip(ranges, fits):
+
+            ## each fold scored from the equity the book had when it took over
+            capital = float(result['equity'][oos_start - first - 1]) if oos_start > first else self.initial_capital
+            fold = dict((key, values[oos_start - first:oos_end - first]) for key, values in result.items())
+            oos_metrics = result_metrics(fold, capital, self._periods_per_year)
+
+            row = dict(params)
+            row.update({
+                'is_start': index[is_start], 'oos_start': index[oos_start], 'oos_end': index[oos_end - 1],
+                'is_' + self.rank_by: is_metrics[self.rank_by],
+                'oos_net': oos_metrics['net'], 'oos_trades': oos_metrics['trades'],
+                'oos_max_drawdown': oos_metrics['max_drawdown'], 'equity': float(fold['equity'][-1])
+            })
+            rows.append(row)
+
+        print("Walked %d folds over %d parameter sets in %.3fs" % (len(rows), len(self.param_sets),
+                                                                   time.time() - start_time))
+
+        return pd.DataFrame(rows), pd.Series(result['equity'], index=index[first:last])
+
+def main(args):
+
+    from gwt_pt.datasource import ibkr
+    from gwt_pt.datasource import bar_array
+    from gwt_pt.strategy.strat_ema_xover import ema_xover_strategy, get_contract_month
+
+    symbol = "MHI"
+    duration = "1 Y"
+    period = "5 mins"
+    contract_mth = get_contract_month()
+
+    bars = bar_array.to_frame(ibkr.get_hkfe_data(contract_mth, symbol, duration, period, use_cache=True))
+
+    wf = walkForward(ema_xover_strategy, bars, grid({'window1': range(10, 65, 5)}), symbol)
+    results, equity = wf.run(in_sample=IN_SAMPLE_BARS, out_sample=OUT_SAMPLE_BARS)
+
+    print(results.to_string())
+    print("Out-of-sample P&L: $%f" % (equity.iloc[-1] - wf.initial_capital if len(equity) else 0.0))
+
+if __name__ == "__main__":
+    main(sys.argv)
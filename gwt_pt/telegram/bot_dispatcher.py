@@ -0,0 +1,139 @@
+#! /usr/bin/python
+
+"""
+Concurrent command handling for the bot
+
+telepot calls the message handlers one at a time from its loop thread, so a handler waiting on
+IB or the chart renderer holds up every other chat. The handlers only parse the command and
+hand the slow part to a botDispatcher:
+
+- commands run on a pool of worker threads
+- identical requests in flight at the same time (ten users asking for the same chart) are
+  coalesced, the work runs once and everyone gets its result (single_flight)
+- each user can only have a few commands in flight, anything more is turned away at once
+  instead of queueing up behind the slow ones, and the whole queue is bounded too
+
+    dispatcher = bot_dispatcher.botDispatcher()
+    if not dispatcher.submit(user_id, handle_fx, chat_id, symbol, currency):
+        bot.sendMessage(chat_id, "Still working on your last request")
+"""
+
+import time
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, Future
+
+WORKERS = 8
+## commands in flight per user
+MAX_USER_PENDING = 2
+MAX_PENDING = 100
+
+class singleFlight(object):
+    """
+    Runs one call per key at a time, concurrent callers with the same key share its result
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        fn(*args, **kwargs), or the result of the identical call already running
+        """
+
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+class botDispatcher(object):
+    """
+    Worker pool for bot commands with single-flight and per-user backpressure
+    """
+
+    def __init__(self, workers=WORKERS, max_user_pending=MAX_USER_PENDING, max_pending=MAX_PENDING):
+        self.max_user_pending = max_user_pending
+        self.max_pending = max_pending
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bot")
+        self._flight = singleFlight()
+        self._lock = Lock()
+        self._pending = {}
+        self._total = 0
+
+        self.handled = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def __repr__(self):
+        return "botDispatcher %d pending, %d handled, %d rejected, %d failed, %d coalesced" % (
+            self._total, self.handled, self.rejected, self.failed, self._flight.coalesced)
+
+    def pending(self, user_id):
+        with self._lock:
+            return self._pending.get(user_id, 0)
+
+    def submit(self, user_id, handler, *args):
+        """
+        Run handler(*args) on a worker
+        :return: False if the user (or the bot) has too much in flight and the command was not taken
+        """
+
+        with self._lock:
+            if self._pending.get(user_id, 0) >= self.max_user_pending or self._total >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._pending[user_id] = self._pending.get(user_id, 0) + 1
+            self._total += 1
+
+        self._executor.submit(self._run, user_id, handler, args)
+        return True
+
+    def _run(self, user_id, handler, args):
+
+        start_time = time.time()
+        ok = False
+        try:
+            handler(*args)
+            ok = True
+        except Exception as e:
+            print("Bot command %s failed for user %s: [%s]" % (handler.__name__, user_id, e))
+        finally:
+            with self._lock:
+                self._pending[user_id] -= 1
+                if self._pending[user_id] == 0:
+                    del self._pending[user_id]
+                self._total -= 1
+                if ok:
+                    self.handled += 1
+                else:
+                    self.failed += 1
+            print("Bot command %s for user %s took %.3fs" % (handler.__name__, user_id, time.time() - start_time))
+
+    def single_flight(self, key, fn, *args):
+        """
+        fn(*args) shared with any identical request already in flight, see singleFlight
+        """
+        return self._flight.do(key, fn, *args)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
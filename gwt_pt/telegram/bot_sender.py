@@ -1,66 +1,310 @@
 #!/usr/bin/python
 
-import configparser
-import os
-import urllib.request
+"""
+Telegram delivery
+
+broadcast / broadcast_list only queue the messages and return, a deliveryQueue sends them in
+the background so a slow Telegram API does not hold up the market scan (the config, and the
+queue's threads, are only set up once the first message is sent):
+
+- a few worker threads, each chat always handled by the same worker so its messages (and the
+  4096 char chunks of one message) arrive in order, while different chats go out in parallel
+- one keep-alive HTTPS connection per worker instead of a new TCP / TLS handshake per message
+- at most one message per second to each chat (Telegram's own limit)
+- retries with exponential backoff on network errors and 5xx, honouring retry_after on 429;
+  a request that was sent but got no reply (eg. read timeout) is not retried, so no duplicates
+- bounded queues, a full queue drops the message rather than blocking the caller
+- whatever is still queued at exit is flushed
+"""
+
+import json
+import time
+import zlib
+import queue
+import atexit
+import http.client
 import urllib.parse
-from gwt_pt.util import config_loader
-from urllib.error import URLError, HTTPError
+from threading import Thread, Lock, Condition
 
-config = config_loader.load()
+from gwt_pt.util import config_loader
 
 MAX_MSG_SIZE = 4096
 
-def broadcast(passage, is_test=False):
+WORKERS = 4
+MAX_QUEUED = 1000
+## seconds between two messages to the same chat
+CHAT_INTERVAL = 1.0
+MAX_RETRIES = 5
+RETRY_BACKOFF_SECONDS = 1.0
+HTTP_TIMEOUT = 10
+FLUSH_TIMEOUT = 30
 
-    if (is_test):
-        chat_list = config.items("telegram-chat-test")
-    else:
-        chat_list = config.items("telegram-chat")
-    bot_send_url = config.get("telegram","bot-send-url")
-    
-    print(bot_send_url)
+class sentUnconfirmed(Exception):
+    """
+    The request went out but no reply came back, the message may or may not have been delivered
+    """
+    pass
 
-    for key, chat_id in chat_list:
-        print("Chat to send: " + key + " => " + chat_id);
+def split_message(passage, size=MAX_MSG_SIZE):
+    return [passage[i:i+size] for i in range(0, len(passage), size)]
+
+class deliveryWorker(object):
+    """
+    Sends the messages of its chats in order over one keep-alive connection
+    """
+
+    def __init__(self, owner, name, max_queued=MAX_QUEUED):
+        self.owner = owner
+        self.queue = queue.Queue(max_queued)
+        self._connection = None
+        self._connection_key = None
+        ## chat id -> time the next message can go out
+        self._next_send = {}
+
+        self._thread = Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _connect(self, url):
+
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        if self._connection is None or self._connection_key != key:
+            self._close()
+            if parts.scheme == "https":
+                self._connection = http.client.HTTPSConnection(parts.netloc, timeout=HTTP_TIMEOUT)
+            else:
+                self._connection = http.client.HTTPConnection(parts.netloc, timeout=HTTP_TIMEOUT)
+            self._connection_key = key
+
+        path = parts.path + ("?" + parts.query if parts.query else "")
+        return self._connection, path
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = None
+
+    def post(self, url, payload):
+        """
+        One POST over the kept-alive connection
+        :return: (HTTP status, parsed JSON reply or None)
+        Raises HTTPException / OSError if the request never reached Telegram (safe to send again),
+        sentUnconfirmed if it was sent but no reply came back
+        """
+
+        connection, path = self._connect(url)
+        reused = connection.sock is not None
+        try:
+            connection.request("POST", path, urllib.parse.urlencode(payload).encode("utf-8"),
+                               {"Content-Type": "application/x-www-form-urlencoded"})
+        except (http.client.HTTPException, OSError):
+            ## connect failed or the connection is broken, nothing was sent
+            self._close()
+            raise
+
+        try:
+            response = connection.getresponse()
+            body = response.read()
+        except http.client.RemoteDisconnected:
+            ## a kept-alive connection the server had already closed, it never read the request
+            self._close()
+            if reused:
+                raise
+            raise sentUnconfirmed("connection closed without a reply")
+        except (http.client.HTTPException, OSError) as e:
+            ## eg. read timeout, Telegram may well have delivered the message
+            self._close()
+            raise sentUnconfirmed(str(e))
+
+        if response.getheader("Connection", "").lower() == "close":
+            self._close()
+
+        try:
+            return response.status, json.loads(body.decode("utf-8"))
+        except ValueError:
+            return response.status, None
 
-        messages = [passage[i:i+MAX_MSG_SIZE] for i in range(0, len(passage), MAX_MSG_SIZE)]
+    def send(self, url, payload):
+        """
+        Send with retries
+        :return: True if Telegram accepted the message
+        """
 
-        for message in messages:
-        
-            result = ""
-            payload = { "parse_mode": "HTML", "chat_id": chat_id, "text": message }
+        chat_id = payload.get("chat_id")
 
+        for attempt in range(MAX_RETRIES):
+
+            wait = self._next_send.get(chat_id, 0) - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self._next_send[chat_id] = time.time() + self.owner.chat_interval
+
+            backoff = RETRY_BACKOFF_SECONDS * 2 ** attempt
             try:
-                result = urllib.request.urlopen(bot_send_url, urllib.parse.urlencode(payload).encode("utf-8")).read()
-                
-            except HTTPError as e:
-                # do something
-                print('Error code: ', e.code)
-                print(e)
-            except URLError as e:
-                # do something
-                print('Reason: ', e.reason)
+                status, reply = self.post(url, payload)
+            except sentUnconfirmed as e:
+                ## at most once, a retry could post the message twice
+                print("Telegram send to %s unconfirmed: [%s], not retrying" % (chat_id, e))
+                return False
+            except (http.client.HTTPException, OSError) as e:
+                print("Telegram send to %s failed: [%s], retrying in %.1fs" % (chat_id, e, backoff))
+                time.sleep(backoff)
+                continue
+
+            if status == 200:
+                return True
+
+            description = reply.get("description", "") if isinstance(reply, dict) else ""
+            if status == 429:
+                ## flood control, Telegram tells us how long to back off
+                retry_after = reply.get("parameters", {}).get("retry_after", backoff) if isinstance(reply, dict) else backoff
+                print("Telegram rate limited chat %s, retrying in %ss" % (chat_id, retry_after))
+                time.sleep(float(retry_after))
+            elif status >= 500:
+                print("Telegram error %d for chat %s: %s, retrying in %.1fs" % (status, chat_id, description, backoff))
+                time.sleep(backoff)
             else:
-                # do something
-                print('good!')
-            print(result)
+                ## bad request (eg. broken HTML), retrying will not help
+                print("Telegram rejected message to chat %s: %d %s" % (chat_id, status, description))
+                return False
+
+        print("Giving up on message to chat %s after %d attempts" % (chat_id, MAX_RETRIES))
+        return False
+
+    def _run(self):
+
+        while True:
+            url, payload = self.queue.get()
+            try:
+                self.owner._delivered(self.send(url, payload))
+            except Exception as e:
+                print("Telegram delivery error: [%s]" % e)
+                self.owner._delivered(False)
+            finally:
+                self.queue.task_done()
+
+class deliveryQueue(object):
+    """
+    Background delivery of Telegram messages, see the module docstring
+    """
+
+    def __init__(self, workers=WORKERS, max_queued=MAX_QUEUED, chat_interval=CHAT_INTERVAL):
+        self.chat_interval = chat_interval
+
+        self._cond = Condition(Lock())
+        self.pending = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+        self._workers = [deliveryWorker(self, "telegram-%d" % i, max_queued) for i in range(workers)]
+
+    def __repr__(self):
+        return "deliveryQueue %d pending, %d sent, %d failed, %d dropped" % (self.pending, self.sent,
+                                                                              self.failed, self.dropped)
+
+    def _worker(self, chat_id):
+        return self._workers[zlib.crc32(str(chat_id).encode()) % len(self._workers)]
+
+    def enqueue(self, url, payload):
+        """
+        Queue one request, without waiting
+        :return: False if the chat's queue is full and the message was dropped
+        """
+
+        with self._cond:
+            self.pending = self.pending + 1
+
+        try:
+            self._worker(payload.get("chat_id")).queue.put_nowait((url, payload))
+        except queue.Full:
+            print("Telegram queue full, dropping message to chat %s" % payload.get("chat_id"))
+            with self._cond:
+                self.pending = self.pending - 1
+                self.dropped = self.dropped + 1
+                self._cond.notify_all()
+            return False
+        return True
+
+    def send_message(self, chat_id, passage, url=None):
+        """
+        Queue a message to a chat, split into MAX_MSG_SIZE chunks
+        """
+
+        url = url or config_loader.load().get("telegram","bot-send-url")
+        for message in split_message(passage):
+            self.enqueue(url, { "parse_mode": "HTML", "chat_id": chat_id, "text": message })
+
+    def _delivered(self, ok):
+        with self._cond:
+            self.pending = self.pending - 1
+            if ok:
+                self.sent = self.sent + 1
+            else:
+                self.failed = self.failed + 1
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Wait until everything queued so far has been sent (or given up on)
+        :return: True if the queue drained within timeout
+        """
+
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self.pending > 0:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+_QUEUE = None
+_QUEUE_LOCK = Lock()
+
+def get_queue():
+    """
+    The process wide delivery queue, started on first use
+    """
+
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = deliveryQueue()
+        return _QUEUE
+
+def flush(timeout=FLUSH_TIMEOUT):
+
+    if _QUEUE is None:
+        return True
+
+    if not _QUEUE.flush(timeout):
+        print("Telegram messages still queued after %ds: %s" % (timeout, _QUEUE))
+        return False
+    return True
+
+atexit.register(flush)
+
+def broadcast(passage, is_test=False):
+
+    if (is_test):
+        broadcast_list(passage, "telegram-chat-test")
+    else:
+        broadcast_list(passage, "telegram-chat")
 
 def broadcast_list(passage, chatlist="telegram-chat-test"):
+    """
+    Queue the passage to every chat of the config section, returns straight away
+    """
 
+    config = config_loader.load()
     chat_list = config.items(chatlist)
     bot_send_url = config.get("telegram","bot-send-url")
 
+    delivery = get_queue()
     for key, chat_id in chat_list:
         print("Chat to send: " + key + " => " + chat_id);
-
-        messages = [passage[i:i+MAX_MSG_SIZE] for i in range(0, len(passage), MAX_MSG_SIZE)]
-
-        for message in messages:
-
-            result = urllib.request.urlopen(bot_send_url, urllib.parse.urlencode({ "parse_mode": "HTML", "chat_id": chat_id, "text": message }).encode("utf-8")).read()
-
-            print(result)
+        delivery.send_message(chat_id, passage, bot_send_url)
 
 def main():
 
@@ -68,6 +312,7 @@ def main():
 
     # Send a message to a chat room (chat room ID retrieved from getUpdates)
     broadcast(passage, False)
+    flush()
 
 if __name__ == "__main__":
     main()
@@ -4,6 +4,7 @@ import os
 import sys
 import time
 import telepot
+import telepot.exception
 from telepot.namedtuple import InlineKeyboardMarkup, InlineKeyboardButton
 from telepot.namedtuple import ReplyKeyboardMarkup, KeyboardButton
 from decimal import Decimal
@@ -14,7 +15,13 @@ import random
 #import resource
 from gwt_pt.util import config_loader
 from gwt_pt.datasource import ibkr 
-from gwt_pt.charting import frameplot 
+from gwt_pt.datasource import bar_array
+from gwt_pt.charting import render_service
+from gwt_pt.charting import chart_cache
+from gwt_pt.telegram import bot_dispatcher
+from gwt_pt.common import signal_pipeline
+from gwt_pt.strategy.strat_macdstoc import macdstoc_strategy, STOC_WINDOW, STOC_LOWER_LIMIT, MACDSTOC_WINDOW, \
+    MACDSTOC_SMOOTHING
 
 # Load static properties
 config = config_loader.load()
@@ -23,8 +30,84 @@ LOADING = [u'\U0000231B', u'\U0001F6AC', u'\U0001F37B', u'\U0001F377', u'\U00002
 DEL = "\n\n"
 EL = "\n"
 
+FX_DURATION = "2 M"
+FX_PERIOD = "4 hours"
+FX_CHART = "macdstoc"
+## the chart's own Macdstoc limits, as drawn by frameplot (which would load matplotlib here)
+FX_STOC_SMOOTHING = 8
+FX_MACDSTOC_UPPER_LIMIT = 95
+FX_MACDSTOC_LOWER_LIMIT = 5
+
+def cached_fx_chart(symbol, currency, period=FX_PERIOD):
+    """
+    The chart of the bar forming now if it has been drawn already, without asking IB
+    :return: chart_cache.chartEntry or None
+    """
+
+    return chart_cache.get_cache().current(symbol + "/" + currency, period, FX_CHART)
+
+def render_fx_chart(symbol, currency, duration=FX_DURATION, period=FX_PERIOD):
+    """
+    Fetch and draw an FX chart, unless the data turns out to be the same as a cached chart
+    :return: chart_cache.chartEntry
+    """
+
+    cache = chart_cache.get_cache()
+    pair = symbol + "/" + currency
+
+    historic_df = bar_array.to_frame(ibkr.get_fx_data(symbol, currency, duration, period, use_cache=True))
+    key = cache.data_key(pair, period, FX_CHART, historic_df)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    strategy = macdstoc_strategy(pair, historic_df, STOC_WINDOW, FX_STOC_SMOOTHING, MACDSTOC_WINDOW,
+                                 MACDSTOC_SMOOTHING, STOC_LOWER_LIMIT, FX_MACDSTOC_UPPER_LIMIT,
+                                 FX_MACDSTOC_LOWER_LIMIT, 0.0)
+    signals = signal_pipeline.get_pipeline().signals(strategy, historic_df, pair, period)
+
+    title = symbol + "/" + currency + " " + period
+    chartpath = render_service.get_service().submit(historic_df, signals, title,
+                                                    render_service.chart_path('cchart')).result()
+    return cache.put(key, chartpath)
+
+def send_chart(chat_id, entry):
+    """
+    Send a cached chart, by its Telegram file_id once it has been uploaded
+    """
+
+    if (entry.file_id):
+        try:
+            bot.sendPhoto(chat_id=chat_id, photo=entry.file_id)
+            return
+        except telepot.exception.TelegramError as e:
+            print("Resend by file_id failed, uploading again: [" + str(e) + "]")
+
+    with open(entry.path, 'rb') as photo:
+        sent = bot.sendPhoto(chat_id=chat_id, photo=photo)
+    chart_cache.get_cache().set_file_id(entry.key, sent['photo'][-1]['file_id'])
+
+def fx_command(chat_id, symbol, currency):
+    """
+    /fx on a dispatcher worker, concurrent requests for the same chart share one fetch and render
+    """
+
+    try:
+        ## repeat requests within the same bar are served from the chart cache
+        entry = cached_fx_chart(symbol, currency)
+        if (entry is None):
+            bot.sendMessage(chat_id, random.choice(LOADING), parse_mode='HTML')
+            entry = dispatcher.single_flight(("fx", symbol, currency), render_fx_chart, symbol, currency)
+        print("Chart Path: [" + entry.path + "]")
+        send_chart(chat_id, entry)
+
+    except Exception as e:
+        print("Exception raised: [" + str(e) +  "]")
+        bot.sendMessage(chat_id, u'\U000026D4' + ' ' + str(e), parse_mode='HTML')
+
 def on_chat_message(msg):
     content_type, chat_type, chat_id = telepot.glance(msg)
+    user_id = msg['from']['id'] if 'from' in msg else chat_id
     
     print("Text Command: " + msg['text'])
     
@@ -55,27 +138,12 @@ def on_chat_message(msg):
         codes = [code] + params
         print(codes)
         
-        bot.sendMessage(chat_id, random.choice(LOADING), parse_mode='HTML')         
-        try:
-        
-            if (len(code) == 0):
-                 bot.sendMessage(chat_id, 'Sample: /fxEURUSD /fxUSDJPY', parse_mode='HTML')
-            elif (len(code) != 6):
-                bot.sendMessage(chat_id, u'\U000026D4' + ' Invalid Symbol:' + code, parse_mode='HTML')
-            else:
-                symbol = code[0:3]
-                currency = code[3:6]
-
-                duration = "2 M"
-                period = "4 hours"
-                title = symbol + "/" + currency + " " + period                
-                chartpath= frameplot.plot(ibkr.get_data(symbol, currency, duration, period), title, True)
-                print("Chart Path: [" + chartpath + "]")
-                bot.sendPhoto(chat_id=chat_id, photo=open(chartpath, 'rb'))   
-
-        except Exception as e:
-            print("Exception raised: [" + str(e) +  "]")
-            bot.sendMessage(chat_id, u'\U000026D4' + ' ' + str(e), parse_mode='HTML')
+        if (len(code) == 0):
+             bot.sendMessage(chat_id, 'Sample: /fxEURUSD /fxUSDJPY', parse_mode='HTML')
+        elif (len(code) != 6):
+            bot.sendMessage(chat_id, u'\U000026D4' + ' Invalid Symbol:' + code, parse_mode='HTML')
+        elif not dispatcher.submit(user_id, fx_command, chat_id, code[0:3], code[3:6]):
+            bot.sendMessage(chat_id, u'\U000023F3' + ' Still working on your last request', parse_mode='HTML')
         return
 
     elif (command.startswith("/")):    
@@ -110,6 +178,12 @@ def on_callback_query(msg):
     
 TOKEN = config.get("telegram","bot-id") # get token from command-line
 
+## fork the chart workers before the dispatcher and telepot threads are up
+render_service.get_service().start()
+
+## slow commands run here, off telepot's message loop thread
+dispatcher = bot_dispatcher.botDispatcher()
+
 # Set resource limit
 #rsrc = resource.RLIMIT_DATA
 #soft, hard = resource.getrlimit(rsrc)
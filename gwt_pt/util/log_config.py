@@ -0,0 +1,41 @@
+#! /usr/bin/python
+
+"""
+Log files of the alert and strategy scripts
+
+Set up from the scripts' main (or the alert daemon) rather than on import, so importing one of
+them does not create a log file or take over stdout
+"""
+
+import os
+import sys
+import logging
+import datetime
+
+if (os.name == 'nt'):
+    LOG_DIR = 'C:\\Users\\Hin\\eggyolktech\\gwtPT\\gwt_pt\\log\\'
+else:
+    LOG_DIR = '/app/gwtPT/gwt_pt/log/'
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+
+def init_logging(name, redirect_output=False):
+    """
+    Log to <name>.log on Windows, a new <name>_<mmdd-HHMMSS>.log per run elsewhere
+    :param redirect_output: send stdout / stderr to the log as well
+    :return: log file name
+    """
+
+    if (os.name == 'nt'):
+        logfile = LOG_DIR + name + '.log'
+    else:
+        logfile = LOG_DIR + '%s_%s.log' % (name, datetime.datetime.today().strftime('%m%d-%H%M%S'))
+
+    logging.basicConfig(filename=logfile, level=logging.INFO, format=LOG_FORMAT)
+
+    if redirect_output:
+        logger = logging.getLogger()
+        sys.stderr.write = lambda s: logger.error(s)
+        sys.stdout.write = lambda s: logger.info(s)
+
+    return logfile
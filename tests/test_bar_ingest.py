@@ -0,0 +1,28 @@
+#! /usr/bin/python
+
+"""
+Persisting bars off the bus, in whatever order they come
+"""
+
+from gwt_pt.datasource import bar_store, bar_ingest
+
+KEY = "MHI_FUT_HKFE_TRADES_1 min"
+
+def bar(minute, close):
+    return ["20181018  09:%02d:00" % minute, close, close + 5, close - 5, close, 10.0]
+
+def test_older_bar_keeps_the_newer_ones(tmp_path, monkeypatch):
+
+    store = bar_store.barStore(str(tmp_path))
+    monkeypatch.setattr(bar_store, "get_store", lambda: store)
+
+    for minute in range(20, 25):
+        bar_ingest.persist_bar(bar_ingest.bar_message("MHI", "1 min", KEY, bar(minute, 27000 + minute)))
+
+    ## a retried bar, and one replayed from before the first
+    bar_ingest.persist_bar(bar_ingest.bar_message("MHI", "1 min", KEY, bar(22, 26000)))
+    bar_ingest.persist_bar(bar_ingest.bar_message("MHI", "1 min", KEY, bar(19, 27019)))
+
+    records = store.load(KEY)
+    assert [float(close) for close in records['close']] == [27019, 27020, 27021, 26000, 27023, 27024]
+    assert list(records['ts']) == sorted(records['ts'])
@@ -0,0 +1,73 @@
+#! /usr/bin/python
+
+"""
+Retries only for requests Telegram never got
+"""
+
+import socket
+from threading import Thread
+
+from gwt_pt.telegram import bot_sender
+
+class silentServer(object):
+    """
+    Reads every request and never replies, like a reply lost after Telegram accepted the message
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self._conns = []
+        Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except OSError:
+                return
+            self._conns.append(conn)
+            if conn.recv(65536):
+                self.requests = self.requests + 1
+
+    def close(self):
+        for conn in self._conns:
+            conn.close()
+        self.sock.close()
+
+class owner(object):
+    chat_interval = 0.0
+
+def test_read_timeout_is_not_retried(monkeypatch):
+
+    monkeypatch.setattr(bot_sender, "HTTP_TIMEOUT", 0.2)
+    monkeypatch.setattr(bot_sender, "RETRY_BACKOFF_SECONDS", 0.0)
+
+    server = silentServer()
+    try:
+        worker = bot_sender.deliveryWorker(owner(), "telegram-test")
+        url = "http://127.0.0.1:%d/sendMessage" % server.port
+        assert worker.send(url, {"chat_id": 1, "text": "hello"}) is False
+        assert server.requests == 1
+    finally:
+        server.close()
+
+def test_connect_error_is_retried(monkeypatch):
+
+    monkeypatch.setattr(bot_sender, "RETRY_BACKOFF_SECONDS", 0.0)
+
+    ## nothing listening, every attempt fails before the request is sent
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    attempts = []
+    worker = bot_sender.deliveryWorker(owner(), "telegram-test")
+    post = worker.post
+    monkeypatch.setattr(worker, "post", lambda url, payload: attempts.append(1) or post(url, payload))
+    assert worker.send("http://127.0.0.1:%d/sendMessage" % port, {"chat_id": 1, "text": "hello"}) is False
+    assert len(attempts) == bot_sender.MAX_RETRIES
@@ -0,0 +1,52 @@
+#! /usr/bin/python
+
+"""
+Charts are current until the last bar they were drawn from ends, whatever its alignment
+"""
+
+import calendar
+import datetime
+
+import pandas as pd
+
+from gwt_pt.charting.chart_cache import chartCache
+
+def epoch(text):
+    return calendar.timegm(datetime.datetime.strptime(text, "%Y-%m-%d %H:%M").timetuple())
+
+def fx_bars(last):
+    ## IB FX 4 hour bars are session aligned, 02:15, 06:15 ... not on the epoch 4 hour grid
+    index = pd.date_range(end=last, periods=5, freq="4h", name='datetime')
+    return pd.DataFrame({'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.1}, index=index)
+
+def chart(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b"png")
+    return str(path)
+
+def test_current_until_the_session_aligned_bar_ends(tmp_path):
+
+    cache = chartCache()
+    bars = fx_bars("2018-06-04 10:15")
+    key = cache.data_key("EUR/USD", "4 hours", "macdstoc", bars)
+    entry = cache.put(key, chart(tmp_path, "a.png"))
+
+    ## 12:30 is past the epoch aligned boundary of 12:00, still the 10:15 bar
+    assert cache.current("EUR/USD", "4 hours", "macdstoc", epoch("2018-06-04 12:30")) is entry
+    assert cache.current("EUR/USD", "4 hours", "macdstoc", epoch("2018-06-04 14:14")) is entry
+    assert cache.current("EUR/USD", "4 hours", "macdstoc", epoch("2018-06-04 14:15")) is None
+    assert cache.current("EUR/USD", "1 hour", "macdstoc", epoch("2018-06-04 12:30")) is None
+
+def test_same_data_finds_the_chart_after_the_bar_ends(tmp_path):
+
+    cache = chartCache()
+    bars = fx_bars("2018-06-04 10:15")
+    entry = cache.put(cache.data_key("EUR/USD", "4 hours", "macdstoc", bars), chart(tmp_path, "a.png"))
+
+    ## IB has not printed the next bar yet, the refetch is the same data
+    assert cache.get(cache.data_key("EUR/USD", "4 hours", "macdstoc", bars.copy())) is entry
+
+    newer = fx_bars("2018-06-04 14:15")
+    assert cache.get(cache.data_key("EUR/USD", "4 hours", "macdstoc", newer)) is None
+    latest = cache.put(cache.data_key("EUR/USD", "4 hours", "macdstoc", newer), chart(tmp_path, "b.png"))
+    assert cache.current("EUR/USD", "4 hours", "macdstoc", epoch("2018-06-04 15:00")) is latest
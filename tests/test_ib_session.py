@@ -0,0 +1,69 @@
+#! /usr/bin/python
+
+"""
+Session pool timeouts and subscriptions sharing a client
+"""
+
+import pytest
+
+from gwt_pt.datasource import ib_session
+
+class fakeApp(object):
+
+    def __init__(self, ipaddress, portid, clientid):
+        self.clientid = clientid
+        self.connected = True
+
+    def isConnected(self):
+        return self.connected
+
+    def is_error(self):
+        return False
+
+    def disconnect(self):
+        self.connected = False
+
+def test_exhausted_pool_times_out():
+
+    pool = ib_session.sessionPool(fakeApp, "localhost", 4002, 1, size=1)
+    with pool.session():
+        with pytest.raises(ib_session.sessionTimeout):
+            pool.acquire(timeout=0.1)
+    pool.acquire(timeout=0.1)
+
+def test_subscriptions_share_one_client():
+
+    pool = ib_session.sessionPool(fakeApp, "localhost", 4002, 1, size=2)
+    shared = ib_session.sharedSession(pool)
+
+    apps = [shared.open() for _ in range(5)]
+    assert all(app is apps[0] for app in apps)
+    ## one client in use, the other still free
+    with pool.session(timeout=0.1):
+        pass
+
+    for app in apps[:-1]:
+        shared.close(app)
+    with pytest.raises(ib_session.sessionTimeout):
+        with pool.session(timeout=0.1):
+            with pool.session(timeout=0.1):
+                pass
+
+    shared.close(apps[-1])
+    with pool.session(timeout=0.1):
+        with pool.session(timeout=0.1):
+            pass
+
+def test_lost_client_is_replaced():
+
+    pool = ib_session.sessionPool(fakeApp, "localhost", 4002, 1, size=2)
+    shared = ib_session.sharedSession(pool)
+
+    old = shared.open()
+    old.connected = False
+    new = shared.open()
+    assert new is not old and new.isConnected()
+
+    shared.close(old)
+    shared.close(new)
+    assert len(pool._in_use) == 0
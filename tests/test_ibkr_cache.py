@@ -0,0 +1,60 @@
+#! /usr/bin/python
+
+"""
+A failed gap fetch is not covered up by the bar store
+"""
+
+from contextlib import contextmanager
+
+from gwt_pt.datasource import ibkr, bar_store
+
+BARS = [("20181018  09:%02d:00" % minute, 27000.0, 27005.0, 26995.0, 27000.0 + minute, 10.0) for minute in range(20, 30)]
+
+class fakeApp(object):
+
+    def __init__(self, bars):
+        self.bars = bars
+
+    def resolve_ib_contract(self, ibcontract, reqid):
+        return ibcontract
+
+    def get_IB_historical_data(self, ibcontract, duration, period, priceType, tickerid):
+        return list(self.bars)
+
+    def get_IB_historical_data_batch(self, requests, max_wait_seconds, tickerid_base=None):
+        for request in requests:
+            yield request[0], list(self.bars)
+
+class fakePool(object):
+
+    def __init__(self, bars):
+        self.app = fakeApp(bars)
+
+    def next_request_id(self, n=1):
+        return 1
+
+    @contextmanager
+    def session(self, timeout=None):
+        yield self.app
+
+def test_empty_fetch_stays_empty(tmp_path, monkeypatch):
+
+    store = bar_store.barStore(str(tmp_path))
+    pool = fakePool(BARS)
+    monkeypatch.setattr(bar_store, "get_store", lambda: store)
+    monkeypatch.setattr(ibkr, "hist_pool", lambda is_simulated=False: pool)
+    ## the same request twice would wait out IB's identical request pacing
+    monkeypatch.setattr(ibkr.HIST_PACING, "wait", lambda *args: None)
+    contract = ibkr.hkfe_contract("201810", "MHI")
+
+    assert len(ibkr.get_hist_data(contract, "1 D", "1 min", "TRADES", use_cache=True)) == len(BARS)
+
+    ## the gateway times out on the next fetch
+    pool.app.bars = []
+    assert len(ibkr.get_hist_data(contract, "1 D", "1 min", "TRADES", use_cache=True)) == 0
+
+    requests = [("MHI", contract, "1 D", "1 min", "TRADES", None)]
+    assert [len(data) for key, data in ibkr.get_data_batch(requests, use_cache=True)] == [0]
+
+    ## and the cache still has the bars for the next good fetch
+    assert len(store.load(store.key(ibkr.contract_key(contract, "TRADES"), "1 min"))) == len(BARS)
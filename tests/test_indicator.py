@@ -0,0 +1,54 @@
+#! /usr/bin/python
+
+"""
+Panel indicators against the per-symbol ones gen_signal uses
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gwt_pt.benchmark.synthetic import random_bars
+from gwt_pt.common.indicator import MACD, SLOWSTOC, FASTSTOC, MACDSTOC_PANEL, MACDSTOC_GROUPS, to_panel
+
+def per_symbol(bars):
+    """
+    The columns as macdstoc_alert.gen_signal builds them for one symbol
+    """
+
+    macd = MACD(bars['close'])
+    k_slow, d_slow = SLOWSTOC(bars, 'low', 'high', 'close', 16, 6, False)
+    sk_slow, sd_slow = FASTSTOC(macd, "macd", "macd", "macd", 11, 3, False)
+    return pd.concat([macd, k_slow, d_slow, sk_slow.rename(columns={'k_fast': 'sk_slow'}),
+                      sd_slow.rename(columns={'d_fast': 'sd_slow'})], axis=1)
+
+def universe():
+    ## FX around the clock, HSI in its own hours
+    fx = random_bars(600, seed=1, freq='1h')
+    return {'EUR/USD': fx, 'USD/JPY': random_bars(600, seed=2, freq='1h'),
+            'HSI': random_bars(600, seed=3, freq='1h').between_time('09:00', '16:00')}
+
+def test_groups_match_per_symbol():
+
+    bars_dict = universe()
+    frames = MACDSTOC_GROUPS(bars_dict)
+
+    for symbol, bars in bars_dict.items():
+        expected = per_symbol(bars)
+        pd.testing.assert_frame_equal(frames[symbol][expected.columns], expected, check_names=False)
+
+def test_mixed_calendars_are_refused():
+
+    with pytest.raises(ValueError):
+        to_panel(universe(), 'close')
+
+def test_array_inputs_align_with_close():
+
+    bars_dict = universe()
+    del bars_dict['HSI']
+    close = to_panel(bars_dict, 'close')
+    low, high = to_panel(bars_dict, 'low').values, to_panel(bars_dict, 'high').values
+
+    result = MACDSTOC_PANEL(low, high, close)
+    expected = per_symbol(bars_dict['EUR/USD'])
+    assert np.allclose(result['d_slow']['EUR/USD'].values, expected['d_slow'].values, equal_nan=True)
@@ -0,0 +1,40 @@
+#! /usr/bin/python
+
+"""
+Streaming indicators against the batch ones in common/indicator
+"""
+
+import numpy as np
+import pandas as pd
+
+from gwt_pt.common.indicator import RSI
+from gwt_pt.common.indicator_stream import rsi_stream
+
+def closes(n=300, seed=11):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'close': 20000 + np.cumsum(rng.standard_normal(n) * 10)})
+
+def streamed(stream, values):
+    return np.array([stream.update(value) for value in values])
+
+def test_rsi_matches_batch():
+
+    df = closes()
+    assert np.allclose(streamed(rsi_stream(14), df['close'].values), RSI(df, 'close', 14)['RSI'].values,
+                       equal_nan=True)
+
+def test_rsi_matches_batch_across_missing_closes():
+
+    df = closes()
+    df.loc[50:51, 'close'] = np.nan
+    expected = RSI(df, 'close', 14)['RSI'].values
+    assert np.allclose(streamed(rsi_stream(14), df['close'].values), expected, equal_nan=True)
+    assert not np.isnan(expected[60:]).any()
+
+def test_rsi_takes_none_as_missing():
+
+    df = closes()
+    values = list(df['close'].values)
+    values[50] = None
+    df.loc[50, 'close'] = np.nan
+    assert np.allclose(streamed(rsi_stream(14), values), RSI(df, 'close', 14)['RSI'].values, equal_nan=True)
@@ -0,0 +1,50 @@
+#! /usr/bin/python
+
+"""
+The in-process state store is opt-in
+"""
+
+import pytest
+
+from gwt_pt.redis import redis_pool
+
+class unreachableRedis(object):
+    """
+    Stand-in for the redis module, every server refuses the connection
+    """
+
+    class exceptions(object):
+        class RedisError(Exception):
+            pass
+
+    class ConnectionPool(object):
+        def __init__(self, **kwargs):
+            pass
+
+    class Redis(object):
+        def __init__(self, connection_pool=None):
+            pass
+
+        def ping(self):
+            raise unreachableRedis.exceptions.RedisError("Connection refused")
+
+@pytest.fixture
+def no_server(monkeypatch):
+    monkeypatch.setattr(redis_pool, "redis", unreachableRedis)
+
+def test_unreachable_server_raises(no_server):
+
+    with pytest.raises(unreachableRedis.exceptions.RedisError):
+        redis_pool.connect()
+
+def test_fallback_when_asked_for(no_server):
+
+    store = redis_pool.connect(fallback=True)
+    assert isinstance(store, redis_pool.memoryStore)
+
+def test_missing_package_raises(monkeypatch):
+
+    monkeypatch.setattr(redis_pool, "import_redis", lambda: None)
+    with pytest.raises(ImportError):
+        redis_pool.connect()
+    assert isinstance(redis_pool.connect(fallback=True), redis_pool.memoryStore)
@@ -0,0 +1,39 @@
+#! /usr/bin/python
+
+"""
+Daily jobs pinned to another time zone follow its daylight saving
+"""
+
+import time
+import datetime
+
+import pytest
+
+from gwt_pt.execution.scheduler import dailySchedule
+
+@pytest.fixture
+def hkt(monkeypatch):
+    ## the daemon runs on HKT
+    monkeypatch.setenv("TZ", "Asia/Hong_Kong")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_fx_daily_close_follows_new_york_dst(hkt):
+
+    schedule = dailySchedule("17:20", tz="America/New_York")
+
+    ## summer, New York 17:00 is 05:00 HKT; Friday's close is on Saturday morning in Hong Kong
+    assert schedule.next_after(datetime.datetime(2018, 6, 5, 12, 0)) == datetime.datetime(2018, 6, 6, 5, 20)
+    assert schedule.next_after(datetime.datetime(2018, 6, 9, 1, 0)) == datetime.datetime(2018, 6, 9, 5, 20)
+    ## and nothing on Sunday or Monday morning
+    assert schedule.next_after(datetime.datetime(2018, 6, 9, 6, 0)) == datetime.datetime(2018, 6, 12, 5, 20)
+
+    ## winter, an hour later
+    assert schedule.next_after(datetime.datetime(2018, 12, 4, 12, 0)) == datetime.datetime(2018, 12, 5, 6, 20)
+
+def test_local_daily_schedule(hkt):
+
+    schedule = dailySchedule("09:20:30")
+    assert schedule.next_after(datetime.datetime(2018, 6, 8, 10, 0)) == datetime.datetime(2018, 6, 11, 9, 20, 30)
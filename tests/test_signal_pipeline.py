@@ -0,0 +1,51 @@
+#! /usr/bin/python
+
+"""
+Memoized indicators are recomputed when the bars move, and callers can't corrupt the cache
+"""
+
+from gwt_pt.benchmark.synthetic import random_bars
+from gwt_pt.common.signal_pipeline import signalPipeline
+
+def test_forming_bar_high_and_low_miss_the_cache():
+
+    pipeline = signalPipeline()
+    bars = random_bars(500, seed=2)
+    before = pipeline.frame(bars, "TEST", "5 mins")
+
+    ## the forming bar makes a new high and low, its close is unchanged
+    moved = bars.copy()
+    moved.iloc[-1, moved.columns.get_loc('high')] += 200
+    moved.iloc[-1, moved.columns.get_loc('low')] -= 200
+    after = pipeline.frame(moved, "TEST", "5 mins")
+    assert after['k_slow'].iloc[-1] != before['k_slow'].iloc[-1]
+
+    ## the same bars again are served from the cache
+    hits = pipeline.hits
+    pipeline.frame(moved.copy(), "TEST", "5 mins")
+    assert pipeline.hits == hits + 1
+
+def test_revised_earlier_bar_misses_the_cache():
+
+    pipeline = signalPipeline()
+    bars = random_bars(500, seed=2)
+    before = pipeline.frame(bars, "TEST", "5 mins")
+
+    revised = bars.copy()
+    revised.iloc[-10, revised.columns.get_loc('close')] += 50
+    after = pipeline.frame(revised, "TEST", "5 mins")
+    assert after['ema25'].iloc[-1] != before['ema25'].iloc[-1]
+
+def test_frame_is_a_copy():
+
+    pipeline = signalPipeline()
+    bars = random_bars(500, seed=2)
+    first = pipeline.frame(bars, "TEST", "5 mins")
+    ema = first['ema25'].iloc[-1]
+
+    first['nopen'] = first['open'].shift(-1)
+    first.iloc[-1, first.columns.get_loc('ema25')] = 0.0
+
+    second = pipeline.frame(bars, "TEST", "5 mins")
+    assert 'nopen' not in second
+    assert second['ema25'].iloc[-1] == ema
@@ -0,0 +1,74 @@
+#! /usr/bin/python
+
+"""
+event_portfolio against the recon run_strat used to print
+"""
+
+import numpy as np
+import pandas as pd
+
+from gwt_pt.benchmark.synthetic import random_bars
+from gwt_pt.strategy.strat_ema_xover import ema_xover_strategy
+from gwt_pt.strategy.strat_backtest import event_portfolio, target_positions, target_orders
+
+## round trip commission of the old recon, per 10 contract leg
+RECON_COMMISSION = 34
+
+def old_recon(signals):
+    """
+    The P&L of run_strat before the backtest engine: stop and reverse on every signal,
+    filled at the next open, 30 points slippage and $34 commission a leg
+    :return: (long total, short total, long legs, short legs)
+    """
+
+    pf = pd.DataFrame(index=signals.index)
+    pf['nopen'] = signals['nopen']
+    pf['pos'] = 10 * signals['xup_pos'] - 10 * signals['xdown_pos']
+
+    recon = (pf[(pf.pos == 10) | (pf.pos == -10)])[['nopen', 'pos']].copy()
+    recon['l'] = recon['nopen'].diff() - 30
+    recon.loc[recon['pos'] == 10, 'l'] = None
+    recon['lpos'] = (recon['l'] * 10)
+    recon.loc[recon['lpos'] != 0, 'lpos_comm'] = recon['lpos'] - RECON_COMMISSION
+
+    recon['s'] = recon['nopen'].diff() + 30
+    recon.loc[recon['pos'] == -10, 's'] = None
+    recon['spos'] = (recon['s'] * -10)
+    recon.loc[recon['spos'] != 0, 'spos_comm'] = recon['spos'] - RECON_COMMISSION
+
+    return (recon['lpos_comm'].sum(), recon['spos_comm'].sum(),
+            recon['lpos_comm'].count(), recon['spos_comm'].count())
+
+def test_target_positions():
+
+    long_signal = np.array([0, 1, 0, 0, 1, 0, 0, 1, 0])
+    short_signal = np.array([0, 0, 0, 1, 0, 0, 1, 1, 0])
+
+    targets = target_positions(long_signal, short_signal, 10)
+    assert list(targets) == [0, 10, 10, -10, 10, 10, -10, -10, -10]
+    assert list(target_orders(targets)) == [0, 10, 0, -20, 20, 0, -20, 0, 0]
+
+def test_signal_count_does_not_scale_quantity():
+
+    ## macdstoc xup_positions is 2.0 when xup and sxup fire on the same bar
+    targets = target_positions(np.array([0, 2.0, 0]), np.array([0, 0, 1.0]), 10)
+    assert list(targets) == [0, 10, -10]
+
+def test_matches_old_recon():
+
+    bars = random_bars(20000, seed=3)
+    signals = ema_xover_strategy("TEST", bars, 25).generate_signals()
+    ltotal, stotal, long_legs, short_legs = old_recon(signals)
+    assert long_legs > 100 and short_legs > 100
+
+    pf = event_portfolio("TEST", bars, signals, quantity=10)
+    pf.backtest_portfolio()
+    summary = pf.summary()
+
+    ## the engine's side P&L is before commission, the recon charged each closed leg
+    assert abs(summary['long'] - RECON_COMMISSION * long_legs - ltotal) < 1e-6
+    assert abs(summary['short'] - RECON_COMMISSION * short_legs - stotal) < 1e-6
+
+    ## both legs of every reversal are traded
+    positions = pf.result['position']
+    assert positions.max() == 10 and positions.min() == -10
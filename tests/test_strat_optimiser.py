@@ -0,0 +1,68 @@
+#! /usr/bin/python
+
+"""
+Parameter sweep ranking on the stop and reverse engine
+"""
+
+import numpy as np
+import pandas as pd
+
+from gwt_pt.benchmark.synthetic import random_bars
+from gwt_pt.strategy.strat_backtest import event_portfolio
+from gwt_pt.strategy.strat_ema_xover import ema_xover_strategy
+from gwt_pt.strategy.strat_optimiser import evaluate, run_sweep, grid, result_metrics, periods_per_year
+
+class doubledSignals(object):
+    """
+    ema_xover signals with every long signal counted twice, like macdstoc xup + sxup
+    """
+
+    def __init__(self, symbol, bars, window1=25):
+        self.strategy = ema_xover_strategy(symbol, bars, window1)
+
+    def generate_signals(self):
+        signals = self.strategy.generate_signals()
+        signals['xup_pos'] = signals['xup_pos'] * 2
+        return signals
+
+def test_signal_count_does_not_change_the_score():
+
+    bars = random_bars(5000, seed=5)
+    single = evaluate(ema_xover_strategy, bars, {'window1': 20}, "TEST")
+    doubled = evaluate(doubledSignals, bars, {'window1': 20}, "TEST")
+    assert single == doubled
+
+def test_sweep_ranks_like_sequential_runs():
+
+    bars = random_bars(5000, seed=5)
+    param_sets = grid({'window1': [10, 20, 30]})
+    ranked = run_sweep(ema_xover_strategy, bars, param_sets, "TEST", max_workers=2)
+
+    expected = sorted([evaluate(ema_xover_strategy, bars, params, "TEST") for params in param_sets],
+                      key=lambda result: result['net'], reverse=True)
+    assert list(ranked['window1']) == [result['window1'] for result in expected]
+    assert np.allclose(ranked['net'].values, [result['net'] for result in expected])
+
+    ## every sweep backtest holds one quantity long or short
+    pf = event_portfolio("TEST", bars, ema_xover_strategy("TEST", bars, 10).generate_signals())
+    pf.backtest_portfolio()
+    assert set(np.unique(pf.result['position'])) <= set([-10.0, 0.0, 10.0])
+
+def equity_result(returns):
+    equity = 100000.0 * np.cumprod(np.concatenate([[1.0], 1.0 + returns]))
+    n = len(equity)
+    return dict([('equity', equity)] + [(key, np.zeros(n)) for key in
+                ['realized_long', 'realized_short', 'commission', 'slippage', 'fill_qty']])
+
+def test_sharpe_does_not_scale_with_bar_count():
+
+    returns = np.random.default_rng(1).normal(0.0005, 0.01, 500)
+    short_run = result_metrics(equity_result(returns), 100000.0, 252)['sharpe']
+    long_run = result_metrics(equity_result(np.tile(returns, 4)), 100000.0, 252)['sharpe']
+    assert abs(short_run - long_run) < 1e-6 * abs(short_run)
+
+def test_periods_per_year():
+
+    hourly = pd.date_range("2018-01-01", periods=24 * 365 + 1, freq="h")
+    assert abs(periods_per_year(hourly) - 24 * 365.25) < 1e-6
+    assert periods_per_year(hourly[:1]) is None
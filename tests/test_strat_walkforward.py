@@ -0,0 +1,43 @@
+#! /usr/bin/python
+
+"""
+Walk-forward folds traded as one book
+"""
+
+import numpy as np
+
+from gwt_pt.benchmark.synthetic import random_bars
+from gwt_pt.strategy.strat_backtest import event_portfolio
+from gwt_pt.strategy.strat_ema_xover import ema_xover_strategy
+from gwt_pt.strategy.strat_walkforward import walkForward
+
+def test_single_parameter_set_follows_the_full_run():
+
+    bars = random_bars(12000, seed=7)
+    wf = walkForward(ema_xover_strategy, bars, [{'window1': 25}], "TEST")
+    results, equity = wf.run(in_sample=3000, out_sample=1000)
+    assert len(results) == 9
+
+    pf = event_portfolio("TEST", bars, ema_xover_strategy("TEST", bars, 25).generate_signals())
+    pf.backtest_portfolio()
+
+    ## once the first fold has taken its position, the stitched book holds and earns what the full run does
+    first = bars.index.get_loc(equity.index[0])
+    full = pf.result['equity'][first:]
+    assert np.allclose(np.diff(equity.values)[1:], np.diff(full)[1:])
+    assert (pf.result['position'][first + 1:] != 0).any()
+
+    ## the fold scores add up to the stitched P&L
+    assert np.isclose(results['oos_net'].sum(), equity.iloc[-1] - wf.initial_capital)
+
+def test_folds_hand_over_the_equity():
+
+    bars = random_bars(12000, seed=7)
+    wf = walkForward(ema_xover_strategy, bars, [{'window1': 10}, {'window1': 40}], "TEST")
+    results, equity = wf.run(in_sample=3000, out_sample=1000)
+
+    ## each fold starts from the equity the previous one ended with, open position included
+    starts = (results['equity'] - results['oos_net']).values
+    assert np.isclose(starts[0], wf.initial_capital)
+    assert np.allclose(starts[1:], results['equity'].values[:-1])
+    assert np.isclose(results['oos_net'].sum(), equity.iloc[-1] - wf.initial_capital)
@@ -0,0 +1,52 @@
+#! /usr/bin/python
+
+"""
+Bars closing on the clock as well as on trades
+"""
+
+import time
+
+from gwt_pt.datasource import tick_stream
+from gwt_pt.datasource.tick_stream import barAggregator, tickStream
+
+def test_bar_closes_on_time_without_a_trade():
+
+    bars = []
+    aggregator = barAggregator(60, [bars.append])
+    aggregator.on_trade(120.0, 10.0, 1)
+    aggregator.on_trade(150.0, 12.0, 2)
+
+    aggregator.on_time(179.9)
+    assert bars == []
+    aggregator.on_time(180.0)
+    assert [bar[1:] for bar in bars] == [(10.0, 12.0, 10.0, 12.0, 3)]
+
+    ## nothing to close until the next trade opens a bar
+    aggregator.on_time(400.0)
+    assert len(bars) == 1
+
+def test_stream_clock_ticks_the_aggregators():
+
+    bars = []
+    stream = tickStream(1, [barAggregator(1, [bars.append])])
+    stream.on_trade(tick_stream.now_ts(), 10.0, 1)
+    stream.start_clock(0.05)
+    try:
+        deadline = time.time() + 3
+        while not bars and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        stream.close()
+    assert len(bars) == 1
+
+def test_size_only_update_is_not_a_trade():
+
+    stream = tickStream(1)
+    stream.on_price(4, 10.0)
+    stream.on_size(5, 3)
+    ## size revision of the same trade, then a fresh trade
+    stream.on_size(5, 7)
+    stream.on_price(4, 10.5)
+    stream.on_size(5, 2)
+
+    assert len(stream.buffer) == 2